@@ -5,13 +5,15 @@ from django.core.exceptions import ValidationError
 from django.db import transaction
 from datetime import timedelta
 import logging
-from decimal import Decimal
 
 from app.kyc.models import KYCDocument
 from app.wallet.models import INRWallet, USDTWallet, WalletTransaction
+from app.wallet.services import WalletLedgerService
 from app.investment.models import InvestmentPlan, Investment
+from app.investment.services import ROICreditService, ROIForecastService
 from app.withdrawals.models import Withdrawal
 from app.referral.models import Referral, ReferralMilestone
+from app.referral.services import ReferralService
 from .models import Announcement, AdminActionLog
 from .permissions import log_admin_action
 
@@ -371,56 +373,60 @@ class AdminWalletService:
             with transaction.atomic():
                 user = User.objects.get(id=user_id)
                 
-                if wallet_type == 'inr':
-                    wallet = user.inr_wallet
-                    transaction_type = 'admin_adjustment'
-                elif wallet_type == 'usdt':
-                    wallet = user.usdt_wallet
-                    transaction_type = 'admin_adjustment'
-                else:
+                if wallet_type not in ('inr', 'usdt'):
                     raise ValidationError("Invalid wallet type")
+                transaction_type = 'admin_adjustment'
                 
+                wallet_model = WalletLedgerService.get_wallet_model(wallet_type)
+                wallet = wallet_model.objects.filter(user=user).first()
                 if not wallet:
                     raise ValidationError("User wallet not found")
                 
-                balance_before = wallet.balance
+                metadata = {
+                    'admin_user_id': str(admin_user.id),
+                    'admin_user_email': admin_user.email,
+                    'action': action,
+                    'reason': reason
+                }
                 
                 if action == 'credit':
-                    wallet.balance += amount
-                    balance_after = wallet.balance
+                    delta = amount
                 elif action == 'debit':
-                    if wallet.balance < amount:
-                        raise ValidationError("Insufficient balance for debit")
-                    wallet.balance -= amount
-                    balance_after = wallet.balance
+                    delta = -amount
                 elif action == 'override':
                     if not admin_user.is_superuser:
                         raise ValidationError("Only superusers can override wallet balances")
-                    wallet.balance = amount
-                    balance_after = amount
+                    # Hold the row lock so the override applies to the balance it was computed from
+                    wallet = wallet_model.objects.select_for_update().get(pk=wallet.pk)
+                    delta = amount - wallet.balance
+                    metadata['override_balance'] = str(amount)
                 else:
                     raise ValidationError("Invalid action")
                 
-                wallet.save()
-                
-                # Create transaction log
-                WalletTransaction.objects.create(
-                    user=user,
-                    transaction_type=transaction_type,
-                    wallet_type=wallet_type,
-                    amount=amount,
-                    balance_before=balance_before,
-                    balance_after=balance_after,
-                    status='completed',
-                    reference_id=reference_id,
-                    description=f"Admin {action}: {reason}",
-                    metadata={
-                        'admin_user_id': str(admin_user.id),
-                        'admin_user_email': admin_user.email,
-                        'action': action,
-                        'reason': reason
-                    }
-                )
+                if delta > 0:
+                    wallet_transaction = WalletLedgerService.credit(
+                        user, wallet_type, delta, transaction_type,
+                        reference_id=reference_id, description=f"Admin {action}: {reason}",
+                        metadata=metadata
+                    )
+                elif delta < 0:
+                    try:
+                        wallet_transaction = WalletLedgerService.debit(
+                            user, wallet_type, -delta, transaction_type,
+                            reference_id=reference_id, description=f"Admin {action}: {reason}",
+                            metadata=metadata
+                        )
+                    except ValueError as e:
+                        raise ValidationError(f"Cannot {action} wallet: {e}")
+                else:
+                    wallet_transaction = None
+                
+                wallet.refresh_from_db()
+                if wallet_transaction is not None:
+                    balance_before = wallet_transaction.balance_before
+                    balance_after = wallet_transaction.balance_after
+                else:
+                    balance_before = balance_after = wallet.balance
                 
                 # Log admin action
                 log_admin_action(
@@ -471,96 +477,39 @@ class AdminInvestmentService:
     def trigger_roi_distribution(admin_user):
         """Manually trigger ROI distribution for all eligible investments."""
         try:
-            with transaction.atomic():
-                # Get all active investments that are eligible for ROI
-                eligible_investments = Investment.objects.filter(
-                    status='active',
-                    is_active=True
-                ).select_related('user', 'plan')
-                
-                processed_count = 0
-                total_roi_distributed = Decimal('0.00')
-                
-                for investment in eligible_investments:
-                    try:
-                        # Calculate daily ROI based on plan frequency
-                        if investment.plan.frequency == 'daily':
-                            daily_roi_rate = investment.plan.roi_rate / 365
-                        elif investment.plan.frequency == 'weekly':
-                            daily_roi_rate = investment.plan.roi_rate / 52
-                        elif investment.plan.frequency == 'monthly':
-                            daily_roi_rate = investment.plan.roi_rate / 12
-                        else:
-                            daily_roi_rate = investment.plan.roi_rate / 365
-                        
-                        # Calculate ROI for today
-                        daily_roi_amount = (investment.amount * daily_roi_rate) / 100
-                        
-                        # Update investment ROI accrued
-                        investment.roi_accrued += daily_roi_amount
-                        investment.last_roi_credit = timezone.now()
-                        investment.next_roi_date = timezone.now() + timedelta(days=1)
-                        investment.save()
-                        
-                        # Credit user's wallet
-                        user = investment.user
-                        if investment.currency == 'inr':
-                            wallet = user.inr_wallet
-                        else:  # usdt
-                            wallet = user.usdt_wallet
-                        
-                        if wallet:
-                            balance_before = wallet.balance
-                            wallet.add_balance(daily_roi_amount)
-                            wallet.save()
-                            
-                            # Create transaction log
-                            WalletTransaction.objects.create(
-                                user=user,
-                                transaction_type='roi_credit',
-                                wallet_type=investment.currency,
-                                chain_type=None if investment.currency == 'inr' else wallet.chain_type,
-                                amount=daily_roi_amount,
-                                balance_before=balance_before,
-                                balance_after=wallet.balance,
-                                status='completed',
-                                reference_id=str(investment.id),
-                                description=f"Daily ROI credit for {investment.plan.name}",
-                                metadata={
-                                    'investment_id': str(investment.id),
-                                    'plan_name': investment.plan.name,
-                                    'roi_rate': float(investment.plan.roi_rate),
-                                    'frequency': investment.plan.frequency,
-                                    'daily_roi_amount': float(daily_roi_amount)
-                                }
-                            )
-                        
-                        processed_count += 1
-                        total_roi_distributed += daily_roi_amount
-                        
-                    except Exception as e:
-                        logger.error(f"Error processing ROI for investment {investment.id}: {str(e)}")
-                        continue
-                
-                # Log admin action
-                log_admin_action(
-                    admin_user=admin_user,
-                    action_type='ROI_MANAGEMENT',
-                    action_description=f"Triggered ROI distribution. Processed: {processed_count}, Total ROI: {total_roi_distributed}",
-                    target_user=None,
-                    target_model='Investment',
-                    target_id=None
-                )
-                
-                return {
-                    'processed_count': processed_count,
-                    'total_roi_distributed': total_roi_distributed
-                }
+            # Credit due investments with the same engine and ROI calculator
+            # as the scheduled task, so amounts and rounding always match.
+            result = ROICreditService.credit_due_investments()
+            processed_count = result['credited_count']
+            total_roi_distributed = result['total_roi_credited']
+            
+            # Log admin action
+            log_admin_action(
+                admin_user=admin_user,
+                action_type='ROI_MANAGEMENT',
+                action_description=f"Triggered ROI distribution. Processed: {processed_count}, Total ROI: {total_roi_distributed}",
+                target_user=None,
+                target_model='ROIRun',
+                target_id=str(result['run_id'])
+            )
+            
+            return {
+                'processed_count': processed_count,
+                'total_roi_distributed': total_roi_distributed
+            }
                 
         except Exception as e:
             logger.error(f"Error triggering ROI distribution: {str(e)}")
             raise
     
+    @staticmethod
+    def get_roi_forecast(days=7):
+        """Forecast ROI payouts per day, plan and currency without crediting anything."""
+        try:
+            return ROIForecastService.forecast(days=days)
+        except ValueError as e:
+            raise ValidationError(str(e))
+    
     @staticmethod
     def cancel_investment(investment_id, admin_user, reason=""):
         """Cancel an investment early."""
@@ -580,30 +529,19 @@ class AdminInvestmentService:
                 
                 # Credit user's wallet
                 user = investment.user
-                wallet = user.inr_wallet if investment.plan.currency == 'INR' else user.usdt_wallet
-                
-                if wallet:
-                    balance_before = wallet.balance
-                    wallet.balance += refund_amount
-                    wallet.save()
-                    
-                    # Create transaction log
-                    WalletTransaction.objects.create(
-                        user=user,
-                        transaction_type='refund',
-                        wallet_type='inr' if investment.plan.currency == 'INR' else 'usdt',
-                        amount=refund_amount,
-                        balance_before=balance_before,
-                        balance_after=wallet.balance,
-                        status='completed',
-                        reference_id=str(investment.id),
-                        description=f"Investment cancellation refund. Reason: {reason}",
-                        metadata={
-                            'investment_id': str(investment.id),
-                            'admin_user_id': str(admin_user.id),
-                            'reason': reason
-                        }
-                    )
+                WalletLedgerService.credit(
+                    user,
+                    'inr' if investment.plan.currency == 'INR' else 'usdt',
+                    refund_amount,
+                    'refund',
+                    reference_id=str(investment.id),
+                    description=f"Investment cancellation refund. Reason: {reason}",
+                    metadata={
+                        'investment_id': str(investment.id),
+                        'admin_user_id': str(admin_user.id),
+                        'reason': reason
+                    }
+                )
                 
                 # Log admin action
                 log_admin_action(
@@ -683,30 +621,19 @@ class AdminWithdrawalService:
                 withdrawal.save()
                 
                 # Refund user's wallet
-                wallet = user.inr_wallet if withdrawal.currency == 'INR' else user.usdt_wallet
-                
-                if wallet:
-                    balance_before = wallet.balance
-                    wallet.balance += withdrawal.amount
-                    wallet.save()
-                    
-                    # Create transaction log
-                    WalletTransaction.objects.create(
-                        user=user,
-                        transaction_type='refund',
-                        wallet_type='inr' if withdrawal.currency == 'INR' else 'usdt',
-                        amount=withdrawal.amount,
-                        balance_before=balance_before,
-                        balance_after=wallet.balance,
-                        status='completed',
-                        reference_id=str(withdrawal.id),
-                        description=f"Withdrawal rejection refund. Reason: {rejection_reason}",
-                        metadata={
-                            'withdrawal_id': str(withdrawal.id),
-                            'admin_user_id': str(admin_user.id),
-                            'rejection_reason': rejection_reason
-                        }
-                    )
+                WalletLedgerService.credit(
+                    user,
+                    'inr' if withdrawal.currency == 'INR' else 'usdt',
+                    withdrawal.amount,
+                    'refund',
+                    reference_id=str(withdrawal.id),
+                    description=f"Withdrawal rejection refund. Reason: {rejection_reason}",
+                    metadata={
+                        'withdrawal_id': str(withdrawal.id),
+                        'admin_user_id': str(admin_user.id),
+                        'rejection_reason': rejection_reason
+                    }
+                )
                 
                 # Log admin action
                 log_admin_action(
@@ -766,6 +693,23 @@ class AdminReferralService:
             raise
 
 
+    @staticmethod
+    def get_user_referral_tree_level(user_id, parent_user_id=None, cursor=None, page_size=None):
+        """Get one page of a node's direct referrals in a user's referral tree."""
+        try:
+            user = User.objects.get(id=user_id)
+            return ReferralService.get_referral_tree_level(
+                user,
+                parent_user_id=parent_user_id,
+                cursor=cursor,
+                page_size=page_size or ReferralService.TREE_PAGE_SIZE
+            )
+        except User.DoesNotExist:
+            raise ValidationError("User not found")
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+
 class AdminTransactionService:
     """Service for admin transaction management operations."""
     
@@ -14,6 +14,7 @@ from django.utils import timezone
 from app.users.models import User
 from app.kyc.models import KYCDocument
 from app.wallet.models import INRWallet, USDTWallet, WalletTransaction, DepositRequest
+from app.wallet.services import WalletLedgerService
 from app.withdrawals.models import Withdrawal
 from app.investment.models import InvestmentPlan, Investment, BreakdownRequest
 from app.investment.serializers import InvestmentPlanSerializer, BreakdownRequestAdminSerializer
@@ -334,6 +335,18 @@ class AdminInvestmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    @action(detail=False, methods=['get'])
+    def roi_forecast(self, request):
+        """Forecast ROI payouts per day, plan and currency (dry run)."""
+        try:
+            days = int(request.query_params.get('days', 7))
+            return Response(AdminInvestmentService.get_roi_forecast(days))
+        except Exception as e:
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
     def get_queryset(self):
         """Return filtered queryset."""
         queryset = super().get_queryset()
@@ -503,6 +516,29 @@ class AdminReferralViewSet(viewsets.ReadOnlyModelViewSet):
                 {'error': str(e)}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+    
+    @action(detail=False, methods=['get'])
+    def user_tree_nodes(self, request):
+        """Get one page of a node's direct referrals in a user's referral tree."""
+        user_id = request.query_params.get('user_id')
+        if not user_id:
+            return Response(
+                {'error': 'user_id parameter is required.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            return Response(AdminReferralService.get_user_referral_tree_level(
+                user_id,
+                parent_user_id=request.query_params.get('parent_id'),
+                cursor=request.query_params.get('cursor'),
+                page_size=int(request.query_params.get('page_size', 0)) or None
+            ))
+        except Exception as e:
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
 
 class AdminTransactionViewSet(viewsets.ReadOnlyModelViewSet):
@@ -708,29 +744,9 @@ class AdminBreakdownRequestViewSet(viewsets.ReadOnlyModelViewSet):
                 currency = investment.currency
                 user = investment.user
                 
-                if currency == 'inr':
-                    wallet = user.inr_wallet
-                else:  # usdt
-                    wallet = user.usdt_wallet
-                
-                # Record balance before credit
-                balance_before = wallet.balance
-                
                 # Credit balance
-                wallet.add_balance(final_amount)
-                wallet.save()
-                
-                # Log transaction
-                from app.wallet.models import WalletTransaction
-                WalletTransaction.objects.create(
-                    user=user,
-                    transaction_type='refund',
-                    wallet_type=currency,
-                    chain_type=None if currency == 'inr' else wallet.chain_type,
-                    amount=final_amount,
-                    balance_before=balance_before,
-                    balance_after=wallet.balance,
-                    status='completed',
+                WalletLedgerService.credit(
+                    user, currency, final_amount, 'refund',
                     reference_id=str(breakdown_request.id),
                     description=f"Breakdown payout for {investment.plan.name}",
                     metadata={
@@ -744,19 +760,8 @@ class AdminBreakdownRequestViewSet(viewsets.ReadOnlyModelViewSet):
                 
                 # If ROI was accrued, credit it to wallet
                 if investment.roi_accrued > 0:
-                    roi_balance_before = wallet.balance
-                    wallet.add_balance(investment.roi_accrued)
-                    wallet.save()
-                    
-                    WalletTransaction.objects.create(
-                        user=user,
-                        transaction_type='roi_credit',
-                        wallet_type=currency,
-                        chain_type=None if currency == 'inr' else wallet.chain_type,
-                        amount=investment.roi_accrued,
-                        balance_before=roi_balance_before,
-                        balance_after=wallet.balance,
-                        status='completed',
+                    WalletLedgerService.credit(
+                        user, currency, investment.roi_accrued, 'roi_credit',
                         reference_id=str(investment.id),
                         description=f"ROI settlement for {investment.plan.name} breakdown",
                         metadata={
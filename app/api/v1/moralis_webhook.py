@@ -17,7 +17,12 @@ logger = logging.getLogger(__name__)
 @permission_classes([AllowAny])
 @csrf_exempt
 def moralis_usdt_webhook(request):
-    """Handle Moralis webhook for USDT deposits."""
+    """
+    Handle Moralis webhook for USDT deposits.
+    
+    The event is only validated and stored in the inbox here; crediting and
+    sweeping run in Celery (app.wallet.tasks), so the response is immediate.
+    """
     try:
         # Parse webhook data
         webhook_data = json.loads(request.body)
@@ -25,18 +30,17 @@ def moralis_usdt_webhook(request):
         # Log webhook for debugging
         logger.info(f"Moralis webhook received: {webhook_data}")
         
-        # Process the webhook
-        result = real_wallet_service.process_moralis_webhook(webhook_data)
+        # Store the event for the inbox consumer
+        result = real_wallet_service.enqueue_moralis_webhook(webhook_data)
         
         if result['success']:
-            logger.info(f"Webhook processed successfully: {result}")
             return Response({
                 'status': 'success',
-                'message': 'Webhook processed successfully',
+                'message': 'Webhook queued for processing',
                 'data': result
             }, status=status.HTTP_200_OK)
         else:
-            logger.error(f"Webhook processing failed: {result['error']}")
+            logger.error(f"Webhook rejected: {result['error']}")
             return Response({
                 'status': 'error',
                 'message': result['error']
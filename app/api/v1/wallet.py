@@ -275,6 +275,7 @@ def process_usdt_deposit(request):
     chain_type = request.data.get('chain_type')
     confirmation_count = request.data.get('confirmation_count', 0)
     block_number = request.data.get('block_number')
+    log_index = request.data.get('log_index', -1)
     
     if not all([amount, transaction_hash, from_address, to_address, chain_type]):
         return Response(
@@ -310,6 +311,7 @@ def process_usdt_deposit(request):
         # Create or update deposit request
         deposit, created = USDTDepositRequest.objects.get_or_create(
             transaction_hash=transaction_hash,
+            log_index=log_index,
             defaults={
                 'user': user,
                 'chain_type': chain_type,
@@ -7,6 +7,7 @@ from app.wallet.models import (
     INRWallet, USDTWallet, WalletTransaction, DepositRequest,
     WalletAddress, USDTDepositRequest, SweepLog
 )
+from app.wallet.services import WalletLedgerService
 
 User = get_user_model()
 
@@ -214,24 +215,8 @@ class SweepService:
             # Mark deposit as swept
             deposit.mark_as_swept(sweep_tx_hash, gas_fee)
             
-            # Create transaction log
-            WalletTransaction.objects.create(
-                user=deposit.user,
-                transaction_type='sweep',
-                wallet_type='usdt',
-                chain_type=deposit.chain_type,
-                amount=deposit.amount,
-                balance_before=deposit.user.usdt_wallet.balance,
-                balance_after=deposit.user.usdt_wallet.balance - deposit.amount,
-                status='completed',
-                reference_id=sweep_tx_hash,
-                description=f"Auto sweep to master wallet - {deposit.chain_type.upper()} - Gas: {gas_fee} {chain_config.get('gas_token', 'ETH')}",
-                metadata={'chain_type': deposit.chain_type, 'gas_token': chain_config.get('gas_token')}
-            )
-            
-            # Deduct from user wallet
-            usdt_wallet = deposit.user.usdt_wallet
-            usdt_wallet.deduct_balance(deposit.amount)
+            # A sweep only moves on-chain custody; the balance credited on
+            # confirmation is left alone, as in the batched sweeper
             
             return True
             
@@ -282,24 +267,8 @@ class SweepService:
         # Mark deposit as swept
         deposit.mark_as_swept(sweep_tx_hash, gas_fee)
         
-        # Create transaction log
-        WalletTransaction.objects.create(
-            user=deposit.user,
-            transaction_type='sweep',
-            wallet_type='usdt',
-            chain_type=deposit.chain_type,
-            amount=deposit.amount,
-            balance_before=deposit.user.usdt_wallet.balance,
-            balance_after=deposit.user.usdt_wallet.balance - deposit.amount,
-            status='completed',
-            reference_id=sweep_tx_hash,
-            description=f"Manual sweep to master wallet - {deposit.chain_type.upper()} - Gas: {gas_fee} {chain_config.get('gas_token', 'ETH')}",
-            metadata={'chain_type': deposit.chain_type, 'gas_token': chain_config.get('gas_token')}
-        )
-        
-        # Deduct from user wallet
-        usdt_wallet = deposit.user.usdt_wallet
-        usdt_wallet.deduct_balance(deposit.amount)
+        # A sweep only moves on-chain custody; the balance credited on
+        # confirmation is left alone, as in the batched sweeper
         
         return True
         
@@ -381,30 +350,14 @@ class WalletService:
         if amount <= 0:
             raise ValueError("Amount must be positive")
         
-        wallet = WalletService.get_or_create_inr_wallet(user)
-        
-        if not wallet.can_transact():
-            raise ValueError("Wallet is not active for transactions")
+        WalletService.get_or_create_inr_wallet(user)
         
-        balance_before = wallet.balance
-        if wallet.add_balance(amount):
-            # Save the wallet after balance update
-            wallet.save()
-            
-            # Create transaction log
-            WalletTransaction.objects.create(
-                user=user,
-                transaction_type=transaction_type,
-                wallet_type='inr',
-                amount=amount,
-                balance_before=balance_before,
-                balance_after=wallet.balance,
-                status='completed',
-                reference_id=reference_id,
-                description=description
-            )
-            return True
-        return False
+        # The active-wallet check is applied atomically by the ledger
+        WalletLedgerService.credit(
+            user, 'inr', amount, transaction_type,
+            reference_id=reference_id, description=description, require_active=True
+        )
+        return True
     
     @staticmethod
     @transaction.atomic
@@ -413,33 +366,14 @@ class WalletService:
         if amount <= 0:
             raise ValueError("Amount must be positive")
         
-        wallet = WalletService.get_or_create_inr_wallet(user)
+        WalletService.get_or_create_inr_wallet(user)
         
-        if not wallet.can_transact():
-            raise ValueError("Wallet is not active for transactions")
-        
-        if wallet.balance < amount:
-            raise ValueError("Insufficient balance")
-        
-        balance_before = wallet.balance
-        if wallet.deduct_balance(amount):
-            # Save the wallet after balance update
-            wallet.save()
-            
-            # Create transaction log
-            WalletTransaction.objects.create(
-                user=user,
-                transaction_type=transaction_type,
-                wallet_type='inr',
-                amount=amount,
-                balance_before=balance_before,
-                balance_after=wallet.balance,
-                status='completed',
-                reference_id=reference_id,
-                description=description
-            )
-            return True
-        return False
+        # Active and sufficient-balance checks are applied atomically by the ledger
+        WalletLedgerService.debit(
+            user, 'inr', amount, transaction_type,
+            reference_id=reference_id, description=description
+        )
+        return True
     
     @staticmethod
     @transaction.atomic
@@ -448,33 +382,16 @@ class WalletService:
         if amount <= 0:
             raise ValueError("Amount must be positive")
         
-        wallet = WalletService.get_or_create_usdt_wallet(user)
-        
-        if not wallet.can_transact():
-            raise ValueError("Wallet is not active for transactions")
+        WalletService.get_or_create_usdt_wallet(user)
         
-        balance_before = wallet.balance
-        if wallet.add_balance(amount):
-            # Save the wallet after balance update
-            wallet.save()
-            
-            # Create transaction log
-            metadata = {'chain_type': chain_type} if chain_type else {}
-            WalletTransaction.objects.create(
-                user=user,
-                transaction_type=transaction_type,
-                wallet_type='usdt',
-                chain_type=chain_type,
-                amount=amount,
-                balance_before=balance_before,
-                balance_after=wallet.balance,
-                status='completed',
-                reference_id=reference_id,
-                description=description,
-                metadata=metadata
-            )
-            return True
-        return False
+        # The active-wallet check is applied atomically by the ledger
+        WalletLedgerService.credit(
+            user, 'usdt', amount, transaction_type,
+            reference_id=reference_id, description=description,
+            metadata={'chain_type': chain_type} if chain_type else {},
+            chain_type=chain_type, require_active=True
+        )
+        return True
     
     @staticmethod
     @transaction.atomic
@@ -483,36 +400,32 @@ class WalletService:
         if amount <= 0:
             raise ValueError("Amount must be positive")
         
-        wallet = WalletService.get_or_create_usdt_wallet(user)
-        
-        if not wallet.can_transact():
-            raise ValueError("Wallet is not active for transactions")
+        WalletService.get_or_create_usdt_wallet(user)
         
-        if wallet.balance < amount:
-            raise ValueError("Insufficient balance")
-        
-        balance_before = wallet.balance
-        if wallet.deduct_balance(amount):
-            # Save the wallet after balance update
-            wallet.save()
-            
-            # Create transaction log
-            metadata = {'chain_type': chain_type} if chain_type else {}
-            WalletTransaction.objects.create(
-                user=user,
-                transaction_type=transaction_type,
-                wallet_type='usdt',
-                chain_type=chain_type,
-                amount=amount,
-                balance_before=balance_before,
-                balance_after=wallet.balance,
-                status='completed',
-                reference_id=reference_id,
-                description=description,
-                metadata=metadata
-            )
-            return True
-        return False
+        # Active and sufficient-balance checks are applied atomically by the ledger
+        WalletLedgerService.debit(
+            user, 'usdt', amount, transaction_type,
+            reference_id=reference_id, description=description,
+            metadata={'chain_type': chain_type} if chain_type else {},
+            chain_type=chain_type
+        )
+        return True
+
+    
+    @staticmethod
+    def credit_many(credits, skip_missing=False):
+        """
+        Credit many wallets at once for mass payouts.
+        
+        Args:
+            credits: (user_id, currency, amount, transaction_type, reference_id)
+                tuples, optionally followed by description and metadata
+            skip_missing: Skip users without a wallet instead of failing the batch
+        
+        Returns:
+            list: WalletTransaction per credit, in input order (None when skipped)
+        """
+        return WalletLedgerService.credit_many(credits, skip_missing=skip_missing)
 
 
 class DepositService:
@@ -3,7 +3,7 @@ from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django.utils import timezone
-from .models import InvestmentPlan, Investment, BreakdownRequest
+from .models import InvestmentPlan, Investment, BreakdownRequest, ROIRun
 
 
 @admin.register(InvestmentPlan)
@@ -138,8 +138,7 @@ class InvestmentAdmin(admin.ModelAdmin):
     def approve_investments(self, request, queryset):
         """Approve selected pending investments and deduct wallet balance."""
         from django.db import transaction
-        from app.wallet.models import WalletTransaction
-        from decimal import Decimal
+        from app.wallet.services import WalletLedgerService
         
         approved_count = 0
         failed_count = 0
@@ -151,35 +150,11 @@ class InvestmentAdmin(admin.ModelAdmin):
                     amount = investment.amount
                     currency = investment.currency
                     
-                    # Check if user has sufficient balance
-                    if currency.upper() == 'INR':
-                        wallet = user.inr_wallet
-                        if wallet.balance < amount:
-                            raise ValueError(f"Insufficient INR balance. Required: {amount}, Available: {wallet.balance}")
-                    else:  # USDT
-                        wallet = user.usdt_wallet
-                        if wallet.balance < amount:
-                            raise ValueError(f"Insufficient USDT balance. Required: {amount}, Available: {wallet.balance}")
-                    
-                    # Deduct from wallet
-                    balance_before = wallet.balance
-                    success = wallet.deduct_balance(amount)
-                    if not success:
-                        raise ValueError("Failed to deduct balance from wallet")
-                    
-                    wallet.save()
-                    
-                    # Create wallet transaction record
-                    WalletTransaction.objects.create(
-                        user=user,
-                        transaction_type='investment_purchase',
-                        amount=Decimal(str(amount)).quantize(Decimal('0.000001')),
-                        wallet_type=currency.lower(),
-                        status='completed',
+                    # Active and sufficient-balance checks are applied atomically by the ledger
+                    WalletLedgerService.debit(
+                        user, currency.lower(), amount, 'investment_purchase',
                         reference_id=str(investment.id),
-                        description=f'Investment in {investment.plan.name} (Admin Approved)',
-                        balance_before=balance_before,
-                        balance_after=wallet.balance
+                        description=f'Investment in {investment.plan.name} (Admin Approved)'
                     )
                     
                     # Update investment status and approval info
@@ -259,43 +234,18 @@ class InvestmentAdmin(admin.ModelAdmin):
             if obj.status == 'active' and old_status == 'pending_admin_approval':
                 try:
                     from django.db import transaction
-                    from app.wallet.models import WalletTransaction
-                    from decimal import Decimal
+                    from app.wallet.services import WalletLedgerService
                     
                     with transaction.atomic():
                         user = obj.user
                         amount = obj.amount
                         currency = obj.currency
                         
-                        # Check if user has sufficient balance
-                        if currency.upper() == 'INR':
-                            wallet = user.inr_wallet
-                            if wallet.balance < amount:
-                                raise ValueError(f"Insufficient INR balance. Required: {amount}, Available: {wallet.balance}")
-                        else:  # USDT
-                            wallet = user.usdt_wallet
-                            if wallet.balance < amount:
-                                raise ValueError(f"Insufficient USDT balance. Required: {amount}, Available: {wallet.balance}")
-                        
-                        # Deduct from wallet
-                        balance_before = wallet.balance
-                        success = wallet.deduct_balance(amount)
-                        if not success:
-                            raise ValueError("Failed to deduct balance from wallet")
-                        
-                        wallet.save()
-                        
-                        # Create wallet transaction record
-                        WalletTransaction.objects.create(
-                            user=user,
-                            transaction_type='investment_purchase',
-                            amount=Decimal(str(amount)).quantize(Decimal('0.000001')),
-                            wallet_type=currency.lower(),
-                            status='completed',
+                        # Active and sufficient-balance checks are applied atomically by the ledger
+                        wallet_transaction = WalletLedgerService.debit(
+                            user, currency.lower(), amount, 'investment_purchase',
                             reference_id=str(obj.id),
-                            description=f'Investment in {obj.plan.name} (Admin Approved via Status Change)',
-                            balance_before=balance_before,
-                            balance_after=wallet.balance
+                            description=f'Investment in {obj.plan.name} (Admin Approved via Status Change)'
                         )
                         
                         # Set approval info
@@ -306,7 +256,7 @@ class InvestmentAdmin(admin.ModelAdmin):
                         self.message_user(
                             request,
                             f"Investment {obj.id} approved and wallet deducted: {amount} {currency.upper()}. "
-                            f"User balance: {balance_before} → {wallet.balance}",
+                            f"User balance: {wallet_transaction.balance_before} → {wallet_transaction.balance_after}",
                             level='SUCCESS'
                         )
                         
@@ -453,3 +403,28 @@ class BreakdownRequestAdmin(admin.ModelAdmin):
             f"Successfully rejected {rejected_count} breakdown requests."
         )
     reject_breakdowns.short_description = "Reject selected breakdown requests"
+
+
+@admin.register(ROIRun)
+class ROIRunAdmin(admin.ModelAdmin):
+    """Admin interface for ROIRun model."""
+    
+    list_display = [
+        'id', 'status', 'cutoff', 'chunk_count', 'credited_count',
+        'total_roi_credited', 'created_at', 'completed_at'
+    ]
+    list_filter = ['status', 'created_at']
+    readonly_fields = [
+        'id', 'cutoff', 'status', 'cursor_next_roi_date', 'cursor_investment_id',
+        'chunk_count', 'credited_count', 'total_roi_credited', 'completed_at',
+        'last_error', 'created_at', 'updated_at'
+    ]
+    ordering = ['-created_at']
+    
+    def has_add_permission(self, request):
+        """ROI runs are created by the ROI crediting task only."""
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        """Keep the ROI run ledger intact."""
+        return False
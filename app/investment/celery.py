@@ -19,22 +19,23 @@ app.autodiscover_tasks()
 # Celery Beat Schedule for Investment Tasks
 app.conf.beat_schedule = {
     # Daily ROI crediting task - runs every day at 00:00 UTC
+    # Fans out across workers by user_id partition (see ROI_PARTITION_COUNT)
     'credit-daily-roi': {
-        'task': 'app.investment.tasks.credit_roi_task',
+        'task': 'app.investment.tasks.credit_roi_fanout_task',
         'schedule': crontab(hour=0, minute=0),
         'args': (),
     },
     
     # Weekly ROI crediting task - runs every Monday at 00:00 UTC
     'credit-weekly-roi': {
-        'task': 'app.investment.tasks.credit_roi_task',
+        'task': 'app.investment.tasks.credit_roi_fanout_task',
         'schedule': crontab(day_of_week=1, hour=0, minute=0),
         'args': (),
     },
     
     # Monthly ROI crediting task - runs on the 1st of every month at 00:00 UTC
     'credit-monthly-roi': {
-        'task': 'app.investment.tasks.credit_roi_task',
+        'task': 'app.investment.tasks.credit_roi_fanout_task',
         'schedule': crontab(day_of_month=1, hour=0, minute=0),
         'args': (),
     },
@@ -59,6 +60,34 @@ app.conf.beat_schedule = {
         'schedule': crontab(hour=3, minute=0),
         'args': (),
     },
+    
+    # Pay referral milestone bonuses - runs every 15 minutes
+    'evaluate-referral-milestones': {
+        'task': 'app.referral.tasks.evaluate_referral_milestones',
+        'schedule': crontab(minute='*/15'),
+        'args': (),
+    },
+    
+    # Rebuild referral profile totals and report drift - runs daily at 04:00 UTC
+    'reconcile-referral-stats': {
+        'task': 'app.referral.tasks.reconcile_referral_stats',
+        'schedule': crontab(hour=4, minute=0),
+        'args': (),
+    },
+    
+    # Credit Moralis webhook events left in the inbox - runs every minute
+    'process-moralis-webhook-inbox': {
+        'task': 'app.wallet.tasks.process_moralis_webhook_inbox',
+        'schedule': crontab(),
+        'args': (),
+    },
+    
+    # Sweep confirmed deposits to the master wallets in batches - runs every 5 minutes
+    'sweep-confirmed-deposits': {
+        'task': 'app.wallet.tasks.sweep_confirmed_deposits',
+        'schedule': crontab(minute='*/5'),
+        'args': (),
+    },
 }
 
 
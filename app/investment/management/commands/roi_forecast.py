@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from app.investment.services import ROIForecastService
+
+
+class Command(BaseCommand):
+    help = 'Forecast ROI payouts per day, plan and currency without crediting anything'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Number of days to forecast, starting today (default: 7)'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the forecast as JSON'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            forecast = ROIForecastService.forecast(days=options['days'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps(forecast, cls=DjangoJSONEncoder, indent=2))
+            return
+
+        if not forecast['rows']:
+            self.stdout.write(
+                self.style.SUCCESS(f"No ROI payouts due in the next {forecast['days']} days")
+            )
+            return
+
+        self.stdout.write(f"ROI forecast for the next {forecast['days']} days:")
+        for row in forecast['rows']:
+            self.stdout.write(
+                f"  {row['date']}  {row['plan_name']:<30} {row['currency']:<5} "
+                f"{row['cycle_count']:>8} cycles  {row['total_roi']}"
+            )
+
+        self.stdout.write('Totals:')
+        for currency, total in forecast['totals'].items():
+            self.stdout.write(self.style.SUCCESS(f'  {currency}: {total}'))
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:55
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ROIRun',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('cutoff', models.DateTimeField(help_text='Investments with next_roi_date at or before this time are due in this run')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('cursor_next_roi_date', models.DateTimeField(blank=True, help_text='next_roi_date of the last investment in the last committed chunk', null=True)),
+                ('cursor_investment_id', models.UUIDField(blank=True, help_text='ID of the last investment in the last committed chunk', null=True)),
+                ('chunk_count', models.PositiveIntegerField(default=0)),
+                ('credited_count', models.PositiveIntegerField(default=0)),
+                ('total_roi_credited', models.DecimalField(decimal_places=6, default=Decimal('0.000000'), max_digits=20)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'ROI Run',
+                'verbose_name_plural': 'ROI Runs',
+                'db_table': 'investment_roi_run',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='investment__status_f3bcff_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ROICycleCredit',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('cycle_date', models.DateTimeField(help_text='next_roi_date of the cycle that was credited')),
+                ('amount', models.DecimalField(decimal_places=6, max_digits=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('investment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='roi_cycle_credits', to='investment.investment')),
+                ('run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cycle_credits', to='investment.roirun')),
+            ],
+            options={
+                'verbose_name': 'ROI Cycle Credit',
+                'verbose_name_plural': 'ROI Cycle Credits',
+                'db_table': 'investment_roi_cycle_credit',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='roicyclecredit',
+            constraint=models.UniqueConstraint(fields=('investment', 'cycle_date'), name='unique_investment_roi_cycle'),
+        ),
+    ]
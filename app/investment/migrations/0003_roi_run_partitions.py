@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment', '0002_roi_run_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roirun',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='partitions', to='investment.roirun'),
+        ),
+        migrations.AddField(
+            model_name='roirun',
+            name='partition_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='roirun',
+            name='partition_index',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='roirun',
+            name='user_id_end',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='roirun',
+            name='user_id_start',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+    ]
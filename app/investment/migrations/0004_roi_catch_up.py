@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-16 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment', '0003_roi_run_partitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roirun',
+            name='catch_up',
+            field=models.BooleanField(default=False, help_text='Credit every elapsed cycle up to the cutoff instead of only the current one'),
+        ),
+        migrations.AddField(
+            model_name='roirun',
+            name='transaction_mode',
+            field=models.CharField(choices=[('per_cycle', 'One transaction per cycle'), ('aggregate', 'One transaction per investment')], default='per_cycle', max_length=20),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-16 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment', '0004_roi_catch_up'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='investment',
+            name='investment_next_ro_5430a8_idx',
+        ),
+        migrations.AddIndex(
+            model_name='investment',
+            index=models.Index(condition=models.Q(('is_active', True), ('status', 'active')), fields=['next_roi_date', 'id'], name='investment_roi_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='investment',
+            index=models.Index(condition=models.Q(('is_active', True), ('status', 'active')), fields=['end_date', 'id'], name='investment_maturity_due_idx'),
+        ),
+    ]
@@ -194,7 +194,18 @@ class Investment(TimeStampedModel):
             models.Index(fields=['user', 'status']),
             models.Index(fields=['plan', 'status']),
             models.Index(fields=['start_date', 'end_date']),
-            models.Index(fields=['next_roi_date']),
+            # Partial indexes over active investments only, so the ROI and
+            # maturity schedulers find due work without scanning history.
+            models.Index(
+                fields=['next_roi_date', 'id'],
+                condition=models.Q(status='active', is_active=True),
+                name='investment_roi_due_idx'
+            ),
+            models.Index(
+                fields=['end_date', 'id'],
+                condition=models.Q(status='active', is_active=True),
+                name='investment_maturity_due_idx'
+            ),
         ]
     
     def __str__(self):
@@ -395,3 +406,119 @@ class BreakdownRequest(TimeStampedModel):
         
         # Reject the investment breakdown
         self.investment.reject_breakdown()
+
+
+class ROIRun(TimeStampedModel):
+    """Ledger of ROI crediting runs with a resumable keyset cursor."""
+    
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    TRANSACTION_MODE_CHOICES = [
+        ('per_cycle', 'One transaction per cycle'),
+        ('aggregate', 'One transaction per investment'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    cutoff = models.DateTimeField(
+        help_text="Investments with next_roi_date at or before this time are due in this run"
+    )
+    status = models.CharField(
+        max_length=20, 
+        choices=STATUS_CHOICES, 
+        default='running'
+    )
+    cursor_next_roi_date = models.DateTimeField(
+        null=True, 
+        blank=True,
+        help_text="next_roi_date of the last investment in the last committed chunk"
+    )
+    cursor_investment_id = models.UUIDField(
+        null=True, 
+        blank=True,
+        help_text="ID of the last investment in the last committed chunk"
+    )
+    chunk_count = models.PositiveIntegerField(default=0)
+    credited_count = models.PositiveIntegerField(default=0)
+    total_roi_credited = models.DecimalField(
+        max_digits=20, 
+        decimal_places=6, 
+        default=Decimal('0.000000')
+    )
+    catch_up = models.BooleanField(
+        default=False,
+        help_text="Credit every elapsed cycle up to the cutoff instead of only the current one"
+    )
+    transaction_mode = models.CharField(
+        max_length=20,
+        choices=TRANSACTION_MODE_CHOICES,
+        default='per_cycle'
+    )
+    completed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, null=True)
+    
+    # Fan-out partitioning: a coordinator run has partition_count > 0 and one
+    # child run per partition covering the user_id range [start, end).
+    parent = models.ForeignKey(
+        'self', 
+        on_delete=models.CASCADE, 
+        null=True, 
+        blank=True, 
+        related_name='partitions'
+    )
+    partition_count = models.PositiveIntegerField(default=0)
+    partition_index = models.PositiveIntegerField(null=True, blank=True)
+    user_id_start = models.UUIDField(null=True, blank=True)
+    user_id_end = models.UUIDField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'investment_roi_run'
+        verbose_name = 'ROI Run'
+        verbose_name_plural = 'ROI Runs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        if self.partition_index is not None:
+            return f"ROI run {self.id} partition {self.partition_index} ({self.status}) - {self.credited_count} credited"
+        return f"ROI run {self.id} ({self.status}) - {self.credited_count} credited"
+
+
+class ROICycleCredit(models.Model):
+    """Idempotency record for one ROI cycle credited to one investment."""
+    
+    id = models.BigAutoField(primary_key=True)
+    investment = models.ForeignKey(
+        Investment, 
+        on_delete=models.CASCADE, 
+        related_name='roi_cycle_credits'
+    )
+    cycle_date = models.DateTimeField(help_text="next_roi_date of the cycle that was credited")
+    run = models.ForeignKey(
+        ROIRun, 
+        on_delete=models.SET_NULL, 
+        null=True, 
+        blank=True, 
+        related_name='cycle_credits'
+    )
+    amount = models.DecimalField(max_digits=20, decimal_places=6)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'investment_roi_cycle_credit'
+        verbose_name = 'ROI Cycle Credit'
+        verbose_name_plural = 'ROI Cycle Credits'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['investment', 'cycle_date'], 
+                name='unique_investment_roi_cycle'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.investment_id} - cycle {self.cycle_date} ({self.amount})"
@@ -0,0 +1,81 @@
+from decimal import Decimal
+from collections import defaultdict
+
+
+# Quantization applied to ROI amounts per wallet currency
+CURRENCY_QUANTUM = {
+    'inr': Decimal('0.01'),
+    'usdt': Decimal('0.000001'),
+}
+
+# Length of one ROI cycle in days per plan frequency, as in Investment._get_frequency_timedelta
+FREQUENCY_DAYS = {
+    'daily': 1,
+    'weekly': 7,
+    'monthly': 30,
+}
+
+
+class PlanCycleRate:
+    """Per-cycle ROI rate of an investment plan, computed once per plan."""
+
+    __slots__ = ('plan_id', 'rate', 'frequency', 'cycle_days')
+
+    def __init__(self, plan):
+        self.plan_id = plan.id
+        self.rate = Decimal(str(plan.get_roi_per_cycle()))
+        self.frequency = plan.frequency
+        self.cycle_days = FREQUENCY_DAYS.get(plan.frequency, 1)
+
+
+class ROICalculator:
+    """
+    Shared ROI computation for crediting, admin triggers and projections.
+
+    Per-cycle rates are cached per plan, so computing a batch costs one
+    multiply and one quantize per investment.
+    """
+
+    def __init__(self):
+        self._rates = {}
+
+    @staticmethod
+    def get_quantum(currency):
+        """Get the quantization step for a currency."""
+        return CURRENCY_QUANTUM.get(currency.lower(), CURRENCY_QUANTUM['usdt'])
+
+    def get_cycle_rate(self, plan):
+        """Get the cached per-cycle rate for a plan."""
+        cycle_rate = self._rates.get(plan.id)
+        if cycle_rate is None:
+            cycle_rate = self._rates[plan.id] = PlanCycleRate(plan)
+        return cycle_rate
+
+    def calculate(self, investment, cycles=1):
+        """Calculate the ROI amount for a number of cycles of one investment."""
+        rate = self.get_cycle_rate(investment.plan).rate
+        amount = (investment.amount * rate).quantize(self.get_quantum(investment.currency))
+        return amount * cycles
+
+    def calculate_batch(self, investments):
+        """
+        Calculate one cycle of ROI for a batch of investments.
+
+        Investments are grouped by plan and currency so that the rate and
+        quantization step are looked up once per group.
+
+        Returns:
+            list: (investment, roi_amount) pairs in the input order
+        """
+        groups = defaultdict(list)
+        for position, investment in enumerate(investments):
+            groups[(investment.plan_id, investment.currency.lower())].append((position, investment))
+
+        amounts = [None] * len(investments)
+        for (plan_id, currency), members in groups.items():
+            rate = self.get_cycle_rate(members[0][1].plan).rate
+            quantum = self.get_quantum(currency)
+            for position, investment in members:
+                amounts[position] = (investment.amount * rate).quantize(quantum)
+
+        return list(zip(investments, amounts))
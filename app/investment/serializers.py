@@ -1,7 +1,11 @@
+import logging
+
 from rest_framework import serializers
 from .models import InvestmentPlan, Investment, BreakdownRequest
 from app.users.models import User
 
+logger = logging.getLogger(__name__)
+
 
 class InvestmentPlanSerializer(serializers.ModelSerializer):
     """Serializer for InvestmentPlan model."""
@@ -190,88 +194,23 @@ class InvestmentCreateSerializer(serializers.ModelSerializer):
             return investment
     
     def _process_direct_payment(self, user, amount, currency, investment):
-        """Process direct payment by deducting from wallet and creating transaction."""
-        from app.wallet.models import WalletTransaction
-        from decimal import Decimal
+        """Process direct payment by debiting the wallet through the ledger."""
+        from app.wallet.services import WalletLedgerService
         
+        wallet_type = currency.lower()
         try:
-            if currency.upper() == 'INR':
-                # Get INR wallet and deduct balance
-                inr_wallet = user.inr_wallet
-                balance_before = inr_wallet.balance
-                
-                print(f"DEBUG WALLET: Processing INR payment - Amount: {amount}, Balance Before: {balance_before}")
-                
-                # Check if sufficient balance
-                if inr_wallet.balance < amount:
-                    raise serializers.ValidationError(f"Insufficient INR balance. Required: {amount}, Available: {inr_wallet.balance}")
-                
-                # Deduct balance and save
-                success = inr_wallet.deduct_balance(amount)
-                print(f"DEBUG WALLET: INR deduction success: {success}, New balance: {inr_wallet.balance}")
-                
-                if not success:
-                    raise serializers.ValidationError("Failed to deduct INR balance")
-                
-                inr_wallet.save()
-                print(f"DEBUG WALLET: INR wallet saved, final balance: {inr_wallet.balance}")
-                
-                # Create transaction record
-                transaction = WalletTransaction.objects.create(
-                    user=user,
-                    transaction_type='investment_purchase',
-                    amount=Decimal(str(amount)).quantize(Decimal('0.01')),
-                    wallet_type='inr',
-                    status='completed',
-                    reference_id=str(investment.id),
-                    description=f'Investment in {investment.plan.name}',
-                    balance_before=balance_before,
-                    balance_after=inr_wallet.balance
-                )
-                print(f"DEBUG WALLET: INR transaction created: {transaction.id}")
-                
-            else:  # USDT
-                # Get USDT wallet and deduct balance
-                usdt_wallet = user.usdt_wallet
-                balance_before = usdt_wallet.balance
-                
-                print(f"DEBUG WALLET: Processing USDT payment - Amount: {amount}, Balance Before: {balance_before}")
-                
-                # Check if sufficient balance
-                if usdt_wallet.balance < amount:
-                    raise serializers.ValidationError(f"Insufficient USDT balance. Required: {amount}, Available: {usdt_wallet.balance}")
-                
-                # Deduct balance and save
-                success = usdt_wallet.deduct_balance(amount)
-                print(f"DEBUG WALLET: USDT deduction success: {success}, New balance: {usdt_wallet.balance}")
-                
-                if not success:
-                    raise serializers.ValidationError("Failed to deduct USDT balance")
-                
-                usdt_wallet.save()
-                print(f"DEBUG WALLET: USDT wallet saved, final balance: {usdt_wallet.balance}")
-                
-                # Create transaction record
-                transaction = WalletTransaction.objects.create(
-                    user=user,
-                    transaction_type='investment_purchase',
-                    amount=Decimal(str(amount)).quantize(Decimal('0.000001')),
-                    wallet_type='usdt',
-                    status='completed',
-                    reference_id=str(investment.id),
-                    description=f'Investment in {investment.plan.name}',
-                    balance_before=balance_before,
-                    balance_after=usdt_wallet.balance
-                )
-                print(f"DEBUG WALLET: USDT transaction created: {transaction.id}")
-                
-        except Exception as e:
-            # If wallet deduction fails, delete the investment and raise error
-            print(f"DEBUG WALLET: Error in payment processing: {str(e)}")
+            # Active and sufficient-balance checks are applied atomically by the ledger
+            WalletLedgerService.debit(
+                user, wallet_type, amount, 'investment_purchase',
+                reference_id=str(investment.id),
+                description=f'Investment in {investment.plan.name}'
+            )
+        except ValueError as e:
+            # Insufficient balance or an inactive wallet: drop the investment
+            logger.warning(f"Payment for investment {investment.id} failed: {str(e)}")
             investment.delete()
             raise serializers.ValidationError(f"Payment processing failed: {str(e)}")
 
-
 class BreakdownRequestSerializer(serializers.ModelSerializer):
     """Serializer for BreakdownRequest model."""
     
@@ -0,0 +1,666 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from decimal import Decimal
+from collections import defaultdict
+from datetime import timedelta
+import logging
+import uuid
+
+from .models import Investment, InvestmentPlan, ROIRun, ROICycleCredit
+from .roi import ROICalculator
+from .signals import investments_matured
+from app.wallet.services import WalletLedgerService
+
+logger = logging.getLogger(__name__)
+
+
+class ROICreditService:
+    """Set-based ROI crediting engine used by the ROI Celery tasks."""
+
+    CHUNK_SIZE = 1000
+
+    @staticmethod
+    def get_due_investments(now=None):
+        """Get active investments whose next ROI date has passed."""
+        now = now or timezone.now()
+        return Investment.objects.filter(
+            Q(status='active') &
+            Q(is_active=True) &
+            Q(next_roi_date__lte=now)
+        )
+
+    @staticmethod
+    def calculate_roi_amount(investment):
+        """Calculate ROI amount for a single investment cycle."""
+        return ROICalculator().calculate(investment)
+
+    @staticmethod
+    def start_or_resume_run(run_id=None, now=None, catch_up=False, transaction_mode='per_cycle'):
+        """
+        Get the ROI run to work on.
+
+        An explicit run_id resumes that run. Otherwise the oldest run still
+        marked as running (left behind by a crash or a lost worker) is
+        resumed, and a new run is started only when there is none. A resumed
+        run keeps the catch-up settings it was started with.
+
+        Returns:
+            tuple: (ROIRun, created)
+        """
+        if run_id:
+            return ROIRun.objects.get(id=run_id), False
+
+        run = ROIRun.objects.filter(
+            status='running', parent__isnull=True, partition_count=0
+        ).order_by('created_at').first()
+        if run:
+            return run, False
+
+        return ROIRun.objects.create(
+            cutoff=now or timezone.now(),
+            catch_up=catch_up,
+            transaction_mode=transaction_mode
+        ), True
+
+    @staticmethod
+    def get_partition_bounds(partition_count):
+        """
+        Split the user_id space into non-overlapping UUID ranges.
+
+        User ids are random UUIDs, so equal-width ranges hold roughly the same
+        number of investments. Partitioning by user keeps each wallet row in
+        exactly one partition, so parallel workers never contend for it.
+
+        Returns:
+            list: (start, end) pairs; None means unbounded
+        """
+        space = 2 ** 128
+        bounds = []
+        for index in range(partition_count):
+            start = uuid.UUID(int=index * space // partition_count) if index else None
+            end = uuid.UUID(int=(index + 1) * space // partition_count) if index < partition_count - 1 else None
+            bounds.append((start, end))
+        return bounds
+
+    @staticmethod
+    def start_fanout_run(partition_count, now=None, catch_up=False, transaction_mode='per_cycle'):
+        """
+        Create a coordinator run with one child run per user_id partition.
+
+        Returns:
+            tuple: (parent ROIRun, list of child ROIRuns)
+        """
+        cutoff = now or timezone.now()
+        with transaction.atomic():
+            parent = ROIRun.objects.create(
+                cutoff=cutoff,
+                partition_count=partition_count,
+                catch_up=catch_up,
+                transaction_mode=transaction_mode
+            )
+            partitions = ROIRun.objects.bulk_create([
+                ROIRun(
+                    cutoff=cutoff,
+                    catch_up=catch_up,
+                    transaction_mode=transaction_mode,
+                    parent=parent,
+                    partition_index=index,
+                    user_id_start=start,
+                    user_id_end=end
+                )
+                for index, (start, end) in enumerate(ROICreditService.get_partition_bounds(partition_count))
+            ])
+        return parent, partitions
+
+    @staticmethod
+    def resume_fanout_run(now=None, stale_timeout=3600):
+        """
+        Claim the oldest failed coordinator run to resume.
+
+        A coordinator still marked as running is treated as failed once
+        neither it nor any of its partitions has been updated for
+        stale_timeout seconds: a partition was lost to a worker crash or a
+        lost chord, and neither the callback nor the errback will fire.
+
+        Its partitions that did not complete are resumed from their last
+        committed chunk, so no cycle is credited twice.
+
+        Returns:
+            tuple: (parent ROIRun, list of unfinished child ROIRuns), or (None, [])
+        """
+        stale_before = (now or timezone.now()) - timedelta(seconds=stale_timeout)
+        with transaction.atomic():
+            ROIRun.objects.filter(
+                status='running', parent__isnull=True, partition_count__gt=0,
+                updated_at__lt=stale_before
+            ).exclude(
+                partitions__updated_at__gte=stale_before
+            ).update(
+                status='failed',
+                last_error=f"No progress for {stale_timeout} seconds",
+                updated_at=timezone.now()
+            )
+
+            parent = ROIRun.objects.select_for_update(skip_locked=True).filter(
+                status='failed', parent__isnull=True, partition_count__gt=0
+            ).order_by('created_at').first()
+            if parent is None:
+                return None, []
+
+            parent.status = 'running'
+            parent.last_error = None
+            parent.save(update_fields=['status', 'last_error', 'updated_at'])
+        return parent, list(parent.partitions.exclude(status='completed'))
+
+    @staticmethod
+    def finalize_fanout_run(parent):
+        """Aggregate partition counts and totals into the coordinator run."""
+        partitions = parent.partitions.all()
+        totals = partitions.aggregate(
+            chunk_count=Sum('chunk_count'),
+            credited_count=Sum('credited_count'),
+            total_roi_credited=Sum('total_roi_credited')
+        )
+        pending = partitions.exclude(status='completed').count()
+
+        parent.chunk_count = totals['chunk_count'] or 0
+        parent.credited_count = totals['credited_count'] or 0
+        parent.total_roi_credited = totals['total_roi_credited'] or Decimal('0')
+        if pending:
+            parent.status = 'failed'
+            parent.last_error = f"{pending} partition(s) did not complete"
+        else:
+            parent.status = 'completed'
+            parent.completed_at = timezone.now()
+        parent.save(update_fields=[
+            'chunk_count', 'credited_count', 'total_roi_credited',
+            'status', 'last_error', 'completed_at', 'updated_at'
+        ])
+        return parent
+
+    @staticmethod
+    def get_run_chunk(run, chunk_size=None):
+        """
+        Lock and return the next keyset page of due investments for a run.
+
+        Pages are ordered by (next_roi_date, id) and start after the run
+        cursor. Investments already credited by this run are excluded, so
+        each run visits an investment at most once.
+        """
+        chunk_size = chunk_size or ROICreditService.CHUNK_SIZE
+        queryset = ROICreditService.get_due_investments(run.cutoff).filter(
+            Q(last_roi_credit__isnull=True) | Q(last_roi_credit__lt=run.cutoff)
+        )
+        if run.user_id_start is not None:
+            queryset = queryset.filter(user_id__gte=run.user_id_start)
+        if run.user_id_end is not None:
+            queryset = queryset.filter(user_id__lt=run.user_id_end)
+        if run.cursor_next_roi_date is not None:
+            queryset = queryset.filter(
+                Q(next_roi_date__gt=run.cursor_next_roi_date) |
+                Q(next_roi_date=run.cursor_next_roi_date, id__gt=run.cursor_investment_id)
+            )
+        return list(
+            queryset.select_related('plan')
+            .select_for_update(of=('self',))
+            .order_by('next_roi_date', 'id')[:chunk_size]
+        )
+
+    @staticmethod
+    def get_cycle_dates(investment, cutoff, catch_up=False):
+        """
+        Get the due dates of the cycles to credit for an investment.
+
+        Normally only the current cycle is credited. In catch-up mode every
+        whole cycle due up to the cutoff (and no later than end_date) is
+        returned, so a lagging investment catches up in a single run.
+        """
+        first = ROICreditService._cycle_date(investment)
+        if not catch_up:
+            return [first]
+
+        step = investment._get_frequency_timedelta()
+        limit = min(cutoff, investment.end_date) if investment.end_date else cutoff
+        extra_cycles = (limit - first) // step if limit > first else 0
+        return [first + step * index for index in range(extra_cycles + 1)]
+
+    @staticmethod
+    def credit_batch(investments, now=None, run=None, calculator=None,
+                     catch_up=False, transaction_mode='per_cycle'):
+        """
+        Credit due ROI cycles to a batch of investments with set-based writes.
+
+        Wallets are credited through WalletLedgerService.credit_many (one
+        UPDATE ... FROM (VALUES ...) per wallet currency and one bulk insert of
+        WalletTransaction rows) and the investments are advanced with one more
+        UPDATE, instead of several queries per investment. Balances recorded
+        on the transactions are the same as crediting the investments one by
+        one in the given order.
+
+        Every credit first claims its (investment, cycle) key in
+        ROICycleCredit; cycles that are already claimed are skipped, so a
+        resumed or double-scheduled run never credits a cycle twice.
+
+        Args:
+            investments: Investment instances with the plan loaded
+            now: Timestamp used as the credit time and catch-up cutoff
+            run: ROIRun the credits belong to
+            calculator: ROICalculator to reuse cached plan rates across batches
+            catch_up: Credit every elapsed cycle instead of only the current one
+            transaction_mode: 'per_cycle' writes one WalletTransaction per
+                cycle, 'aggregate' one per investment
+
+        Returns:
+            dict: credited_count and total_roi_credited for the batch
+        """
+        now = now or timezone.now()
+        empty_result = {'credited_count': 0, 'total_roi_credited': Decimal('0')}
+
+        calculator = calculator or ROICalculator()
+        credits = [
+            (investment, cycle_amount, ROICreditService.get_cycle_dates(investment, now, catch_up))
+            for investment, cycle_amount in calculator.calculate_batch(investments)
+            if cycle_amount > 0
+        ]
+        if not credits:
+            return empty_result
+
+        claimed = ROICreditService._claim_cycles(credits, now, run)
+        credits = [
+            (investment, cycle_amount, cycle_dates,
+             [cycle_date for cycle_date in cycle_dates if (investment.id, cycle_date) in claimed])
+            for investment, cycle_amount, cycle_dates in credits
+        ]
+        credits = [credit for credit in credits if credit[3]]
+        if not credits:
+            return empty_result
+
+        # Credit wallets first so that investments whose user has no wallet
+        # are left untouched for the next run.
+        wallet_credits = []
+        owners = []
+        for investment, cycle_amount, _, claimed_dates in credits:
+            if transaction_mode == 'aggregate':
+                entries = [(cycle_amount * len(claimed_dates), claimed_dates)]
+            else:
+                entries = [(cycle_amount, [cycle_date]) for cycle_date in claimed_dates]
+            for amount, entry_dates in entries:
+                wallet_credits.append(
+                    ROICreditService._build_roi_credit(investment, amount, entry_dates, now)
+                )
+                owners.append(investment.id)
+
+        transactions = WalletLedgerService.credit_many(wallet_credits, skip_missing=True)
+        missing_wallet = {
+            investment_id for investment_id, wallet_transaction in zip(owners, transactions)
+            if wallet_transaction is None
+        }
+
+        credited = []
+        released = []
+        for investment, cycle_amount, cycle_dates, claimed_dates in credits:
+            if investment.id in missing_wallet:
+                logger.error(
+                    f"Failed to credit ROI to wallet for investment {investment.id}: "
+                    f"no {investment.currency.upper()} wallet for user {investment.user_id}"
+                )
+                released.extend((investment.id, cycle_date) for cycle_date in claimed_dates)
+                continue
+
+            roi_amount = cycle_amount * len(claimed_dates)
+            next_roi_date = cycle_dates[-1] + investment._get_frequency_timedelta()
+            credited.append((investment, roi_amount, next_roi_date))
+
+        if released:
+            # Release the cycle keys so the next run can credit them
+            release = Q(pk__in=[])
+            for investment_id, cycle_date in released:
+                release |= Q(investment_id=investment_id, cycle_date=cycle_date)
+            ROICycleCredit.objects.filter(release).delete()
+
+        if not credited:
+            return empty_result
+
+        ROICreditService._advance_investments(credited, now)
+
+        return {
+            'credited_count': len(credited),
+            'total_roi_credited': sum((roi_amount for _, roi_amount, _ in credited), Decimal('0')),
+        }
+
+    @staticmethod
+    def _build_roi_credit(investment, amount, cycle_dates, now):
+        """Build the wallet credit for ROI credited for one or more cycles."""
+        metadata = {
+            'investment_id': str(investment.id),
+            'plan_name': investment.plan.name,
+            'plan_roi_rate': float(investment.plan.roi_rate),
+            'plan_frequency': investment.plan.frequency,
+            'roi_cycle_date': now.isoformat(),
+            'cycle_due_date': cycle_dates[0].isoformat(),
+        }
+        description = f"ROI credit for {investment.plan.name}"
+        if len(cycle_dates) > 1:
+            metadata['cycle_count'] = len(cycle_dates)
+            metadata['last_cycle_due_date'] = cycle_dates[-1].isoformat()
+            description = f"ROI credit for {investment.plan.name} ({len(cycle_dates)} cycles)"
+
+        return (
+            investment.user_id, investment.currency, amount, 'roi_credit',
+            str(investment.id), description, metadata
+        )
+
+    @staticmethod
+    def process_run(run, chunk_size=None):
+        """
+        Work through a run chunk by chunk, committing each chunk separately.
+
+        Each chunk is credited and the run cursor and totals are advanced in
+        the same transaction, so after a failure the run resumes right after
+        the last committed chunk.
+        """
+        if run.status != 'running':
+            run.status = 'running'
+            run.last_error = None
+            run.save(update_fields=['status', 'last_error', 'updated_at'])
+
+        calculator = ROICalculator()
+        try:
+            while True:
+                with transaction.atomic():
+                    chunk = ROICreditService.get_run_chunk(run, chunk_size)
+                    if not chunk:
+                        break
+
+                    result = ROICreditService.credit_batch(
+                        chunk, run.cutoff, run=run, calculator=calculator,
+                        catch_up=run.catch_up, transaction_mode=run.transaction_mode
+                    )
+                    last = chunk[-1]
+                    ROIRun.objects.filter(id=run.id).update(
+                        cursor_next_roi_date=last.next_roi_date,
+                        cursor_investment_id=last.id,
+                        chunk_count=F('chunk_count') + 1,
+                        credited_count=F('credited_count') + result['credited_count'],
+                        total_roi_credited=F('total_roi_credited') + result['total_roi_credited'],
+                        updated_at=timezone.now()
+                    )
+
+                run.refresh_from_db()
+                logger.info(
+                    f"ROI run {run.id} chunk {run.chunk_count} committed: "
+                    f"{result['credited_count']} investments, Total ROI: {result['total_roi_credited']}"
+                )
+        except Exception as e:
+            ROIRun.objects.filter(id=run.id).update(
+                status='failed', last_error=str(e), updated_at=timezone.now()
+            )
+            run.refresh_from_db()
+            raise
+
+        run.status = 'completed'
+        run.completed_at = timezone.now()
+        run.save(update_fields=['status', 'completed_at', 'updated_at'])
+        return run
+
+    @staticmethod
+    def credit_due_investments(now=None, chunk_size=None, catch_up=False, transaction_mode='per_cycle'):
+        """Start a new ROI run, credit every due investment and return the run totals."""
+        run = ROIRun.objects.create(
+            cutoff=now or timezone.now(),
+            catch_up=catch_up,
+            transaction_mode=transaction_mode
+        )
+        ROICreditService.process_run(run, chunk_size)
+        return {
+            'run_id': run.id,
+            'credited_count': run.credited_count,
+            'total_roi_credited': run.total_roi_credited,
+        }
+
+    @staticmethod
+    def _cycle_date(investment):
+        """Get the due date that identifies the investment's current ROI cycle."""
+        return investment.next_roi_date or (investment.start_date + investment._get_frequency_timedelta())
+
+    @staticmethod
+    def _claim_cycles(credits, now, run=None):
+        """
+        Insert idempotency keys for the cycles about to be credited.
+
+        Returns:
+            set: (investment_id, cycle_date) pairs that were not claimed before
+        """
+        table = connection.ops.quote_name(ROICycleCredit._meta.db_table)
+        rows = []
+        run_id = str(run.id) if run else None
+        for investment, cycle_amount, cycle_dates in credits:
+            for cycle_date in cycle_dates:
+                rows.append([str(investment.id), cycle_date, run_id, cycle_amount, now])
+
+        values_sql = ', '.join(
+            ['(%s::uuid, %s::timestamptz, %s::uuid, %s::numeric, %s::timestamptz)'] * len(rows)
+        )
+        sql = (
+            f"INSERT INTO {table} (investment_id, cycle_date, run_id, amount, created_at) "
+            f"VALUES {values_sql} "
+            f"ON CONFLICT (investment_id, cycle_date) DO NOTHING "
+            f"RETURNING investment_id, cycle_date"
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [param for row in rows for param in row])
+            return {(row[0], row[1]) for row in cursor.fetchall()}
+
+    @staticmethod
+    def _advance_investments(credits, now):
+        """Add ROI to investments and move them to their next cycle in one statement."""
+        table = connection.ops.quote_name(Investment._meta.db_table)
+        values_sql = ', '.join(
+            ['(%s::uuid, %s::numeric, %s::timestamptz, %s, %s::boolean)'] * len(credits)
+        )
+        params = [now, now]
+        for investment, roi_amount, next_roi_date in credits:
+            completed = investment.end_date is not None and now >= investment.end_date
+            params.extend([
+                str(investment.id),
+                roi_amount,
+                next_roi_date,
+                'completed' if completed else investment.status,
+                False if completed else investment.is_active,
+            ])
+
+        sql = (
+            f"UPDATE {table} AS i "
+            f"SET roi_accrued = i.roi_accrued + v.roi_amount, "
+            f"last_roi_credit = %s, next_roi_date = v.next_roi_date, "
+            f"status = v.status, is_active = v.is_active, updated_at = %s "
+            f"FROM (VALUES {values_sql}) AS v(id, roi_amount, next_roi_date, status, is_active) "
+            f"WHERE i.id = v.id"
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+class ROIForecastService:
+    """Read-only ROI payout forecast using the same calculator as the crediting engine."""
+
+    MAX_DAYS = 90
+    ITERATOR_CHUNK_SIZE = 5000
+
+    @staticmethod
+    def forecast(days=7, now=None, catch_up=None):
+        """
+        Forecast ROI payouts per day, plan and currency for the next days.
+
+        Active investments are streamed as plain value tuples without taking
+        row or wallet locks. Each investment is reduced to its schedule
+        (plan, currency, overdue cycles, first upcoming day, upcoming cycles),
+        so the per-day expansion runs once per distinct schedule instead of
+        once per investment. With catch-up, cycles that are already due are
+        reported on the first day. Without it the daily run pays one cycle per
+        investment, so overdue cycles are spread one per day and push the
+        upcoming ones back.
+
+        Args:
+            days: Number of days to forecast, starting today (UTC)
+            now: Timestamp the forecast starts from
+            catch_up: Forecast catch-up crediting (default: settings.ROI_CATCH_UP)
+
+        Returns:
+            dict: generated_at, days, rows per (date, plan, currency) and
+                totals per currency
+        """
+        if not 1 <= days <= ROIForecastService.MAX_DAYS:
+            raise ValueError(f"days must be between 1 and {ROIForecastService.MAX_DAYS}")
+
+        now = now or timezone.now()
+        if catch_up is None:
+            catch_up = getattr(settings, 'ROI_CATCH_UP', False)
+        one_day = timedelta(days=1)
+        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        last_instant = day_start + days * one_day - timedelta(microseconds=1)
+
+        plans = {plan.id: plan for plan in InvestmentPlan.objects.all()}
+        calculator = ROICalculator()
+
+        schedules = defaultdict(lambda: [Decimal('0'), 0])
+        investments = Investment.objects.filter(status='active', is_active=True).values_list(
+            'plan_id', 'currency', 'amount', 'next_roi_date', 'start_date', 'end_date'
+        )
+        for plan_id, currency, amount, next_roi_date, start_date, end_date in investments.iterator(
+            chunk_size=ROIForecastService.ITERATOR_CHUNK_SIZE
+        ):
+            cycle_rate = calculator.get_cycle_rate(plans[plan_id])
+            roi_amount = (amount * cycle_rate.rate).quantize(calculator.get_quantum(currency))
+            if roi_amount <= 0:
+                continue
+
+            step = cycle_rate.cycle_days * one_day
+            first = next_roi_date or start_date + step
+            overdue = ROIForecastService._count_cycles(first, step, now, end_date)
+            upcoming = ROIForecastService._count_cycles(first, step, last_instant, end_date) - overdue
+            first_day = (first + overdue * step - day_start) // one_day if upcoming else None
+            last_day = None
+            if not catch_up and end_date is not None:
+                # The run that reaches end_date completes the investment,
+                # whatever cycles it still has due
+                last_day = 0 if end_date <= now else -((day_start - end_date) // one_day)
+
+            schedule = schedules[(
+                plan_id, currency.upper(), cycle_rate.cycle_days, overdue, first_day, upcoming, last_day
+            )]
+            schedule[0] += roi_amount
+            schedule[1] += 1
+
+        buckets = defaultdict(lambda: [Decimal('0'), 0])
+        for schedule_key, (amount, count) in schedules.items():
+            plan_id, currency, cycle_days, overdue, first_day, upcoming, last_day = schedule_key
+            if catch_up:
+                if overdue:
+                    bucket = buckets[(0, plan_id, currency)]
+                    bucket[0] += amount * overdue
+                    bucket[1] += count * overdue
+                for cycle in range(upcoming):
+                    bucket = buckets[(first_day + cycle * cycle_days, plan_id, currency)]
+                    bucket[0] += amount
+                    bucket[1] += count
+                continue
+
+            day = 0
+            for cycle in range(overdue + upcoming):
+                due_day = first_day + (cycle - overdue) * cycle_days if cycle >= overdue else 0
+                day = max(day, due_day)
+                if day >= days or (last_day is not None and day > last_day):
+                    break
+                bucket = buckets[(day, plan_id, currency)]
+                bucket[0] += amount
+                bucket[1] += count
+                day += 1
+
+        rows = []
+        totals = defaultdict(Decimal)
+        for (day, plan_id, currency), (amount, cycle_count) in sorted(
+            buckets.items(), key=lambda item: (item[0][0], plans[item[0][1]].name, item[0][2])
+        ):
+            rows.append({
+                'date': (day_start + day * one_day).date().isoformat(),
+                'plan_id': str(plan_id),
+                'plan_name': plans[plan_id].name,
+                'currency': currency,
+                'cycle_count': cycle_count,
+                'total_roi': amount,
+            })
+            totals[currency] += amount
+
+        return {
+            'generated_at': now.isoformat(),
+            'days': days,
+            'rows': rows,
+            'totals': dict(totals),
+        }
+
+    @staticmethod
+    def _count_cycles(first, step, until, end_date=None):
+        """Count the cycles first + k * step due at or before until (and end_date)."""
+        if end_date is not None and end_date < until:
+            until = end_date
+        if first > until:
+            return 0
+        return (until - first) // step + 1
+
+
+class InvestmentMaturityService:
+    """Set-based completion of investments that reached their end date."""
+
+    CHUNK_SIZE = 1000
+
+    @staticmethod
+    def complete_matured_investments(now=None, chunk_size=None):
+        """
+        Mark matured investments as completed, one UPDATE ... RETURNING per chunk.
+
+        Each chunk is committed on its own and the returned rows are sent as
+        investments_matured work items after the commit, so receivers only
+        ever see investments that really were completed.
+
+        Returns:
+            dict: completed_count and chunk_count
+        """
+        now = now or timezone.now()
+        chunk_size = chunk_size or InvestmentMaturityService.CHUNK_SIZE
+        table = connection.ops.quote_name(Investment._meta.db_table)
+        sql = (
+            f"WITH matured AS ("
+            f"SELECT id FROM {table} "
+            f"WHERE status = 'active' AND is_active AND end_date <= %s "
+            f"ORDER BY end_date, id LIMIT %s FOR UPDATE"
+            f") "
+            f"UPDATE {table} AS i SET status = 'completed', is_active = false, updated_at = %s "
+            f"FROM matured WHERE i.id = matured.id "
+            f"RETURNING i.id, i.user_id, i.amount, i.currency, i.roi_accrued, i.end_date"
+        )
+        columns = ('id', 'user_id', 'amount', 'currency', 'roi_accrued', 'end_date')
+
+        completed_count = 0
+        chunk_count = 0
+        while True:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, [now, chunk_size, now])
+                    matured = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                if not matured:
+                    break
+
+                transaction.on_commit(
+                    lambda matured=matured: investments_matured.send(sender=Investment, investments=matured)
+                )
+
+            completed_count += len(matured)
+            chunk_count += 1
+            logger.info(f"Maturity chunk {chunk_count} committed: {len(matured)} investments completed")
+
+        return {'completed_count': completed_count, 'chunk_count': chunk_count}
@@ -1,8 +1,13 @@
 from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
+from django.dispatch import receiver, Signal
 from django.utils import timezone
 from .models import Investment, InvestmentPlan
 
+# Sent once per committed maturity chunk with investments=[{'id', 'user_id',
+# 'amount', 'currency', 'roi_accrued', 'end_date'}, ...]. Principal returns and
+# user notifications for matured investments hook in here.
+investments_matured = Signal()
+
 @receiver(post_save, sender=Investment)
 def investment_post_save_handler(sender, instance, created, **kwargs):
     """Handle post-save events for Investment model."""
@@ -10,9 +15,11 @@ def investment_post_save_handler(sender, instance, created, **kwargs):
         # Log investment creation
         print(f"New investment created: {instance.id} for user {instance.user.id}")
         
-        # Trigger referral bonus processing
+        # Update the investor's referral tree totals and trigger referral bonus processing
         try:
+            from app.referral.models import UserReferralProfile
             from app.referral.services import ReferralService
+            UserReferralProfile.record_investments([instance])
             ReferralService.process_investment_referral_bonus(instance)
         except ImportError:
             # Referral app might not be available
@@ -1,79 +1,169 @@
-from celery import shared_task
-from django.db import transaction
+from celery import shared_task, chord
+from django.conf import settings
 from django.utils import timezone
 from django.db.models import Q
 from decimal import Decimal
 import logging
 
-from .models import Investment
-from app.wallet.models import WalletTransaction
+from .models import Investment, BreakdownRequest, ROIRun
+from .services import ROICreditService, InvestmentMaturityService
+from app.wallet.services import WalletLedgerService
 
 logger = logging.getLogger(__name__)
 
 
 @shared_task(bind=True, max_retries=3)
-def credit_roi_task(self):
+def credit_roi_task(self, run_id=None, catch_up=None):
     """
     Celery task to credit ROI for active investments.
     This task should be scheduled to run based on the frequency of each investment plan.
+    
+    Work is recorded in an ROIRun and committed chunk by chunk, so a retry or a
+    redelivered task resumes the unfinished run from its last committed chunk
+    instead of starting over.
+    
+    With catch_up (default: settings.ROI_CATCH_UP) every cycle elapsed since an
+    investment's next ROI date is credited in the same run.
     """
+    run = None
+    if catch_up is None:
+        catch_up = getattr(settings, 'ROI_CATCH_UP', False)
     try:
-        with transaction.atomic():
+        if not run_id and not ROIRun.objects.filter(status='running').exists():
             # Get all active investments that are due for ROI
-            now = timezone.now()
-            due_investments = Investment.objects.filter(
-                Q(status='active') & 
-                Q(is_active=True) & 
-                Q(next_roi_date__lte=now)
-            ).select_related('user', 'plan')
-            
-            if not due_investments.exists():
+            if not ROICreditService.get_due_investments().exists():
                 logger.info("No investments due for ROI crediting")
                 return "No investments due for ROI crediting"
-            
-            credited_count = 0
-            total_roi_credited = Decimal('0')
-            
-            for investment in due_investments:
-                try:
-                    # Calculate ROI amount for this cycle
-                    roi_amount = calculate_roi_amount(investment)
-                    
-                    if roi_amount > 0:
-                        # Credit ROI to the investment
-                        investment.credit_roi(roi_amount)
-                        
-                        # Credit ROI to user's wallet
-                        credit_roi_to_wallet(investment, roi_amount)
-                        
-                        credited_count += 1
-                        total_roi_credited += roi_amount
-                        
-                        logger.info(
-                            f"ROI credited for investment {investment.id}: "
-                            f"{roi_amount} {investment.currency.upper()}"
-                        )
-                    
-                except Exception as e:
-                    logger.error(
-                        f"Failed to credit ROI for investment {investment.id}: {str(e)}"
-                    )
-                    # Continue with other investments
-                    continue
-            
-            logger.info(
-                f"ROI crediting completed: {credited_count} investments processed, "
-                f"Total ROI: {total_roi_credited}"
-            )
-            
-            return f"ROI crediting completed: {credited_count} investments processed"
-            
+        
+        run, created = ROICreditService.start_or_resume_run(
+            run_id,
+            catch_up=catch_up,
+            transaction_mode=getattr(settings, 'ROI_CATCH_UP_TRANSACTION_MODE', 'per_cycle')
+        )
+        if not created:
+            logger.info(f"Resuming ROI run {run.id} from chunk {run.chunk_count}")
+        
+        ROICreditService.process_run(run)
+        
+        logger.info(
+            f"ROI crediting completed: {run.credited_count} investments processed, "
+            f"Total ROI: {run.total_roi_credited}"
+        )
+        
+        return f"ROI crediting completed: {run.credited_count} investments processed"
+        
     except Exception as e:
         logger.error(f"ROI crediting task failed: {str(e)}")
-        # Retry the task
+        # Retry the task, resuming the same run
+        raise self.retry(
+            countdown=60, 
+            exc=e, 
+            kwargs={'run_id': str(run.id)} if run else {}
+        )
+
+
+@shared_task
+def credit_roi_fanout_task(partition_count=None, catch_up=None):
+    """
+    Coordinator task that fans ROI crediting out across Celery workers.
+    
+    Due investments are split into non-overlapping user_id partitions, one
+    child ROIRun per partition, and the partitions are credited in parallel
+    as a chord. The callback aggregates the partition counts and totals.
+    """
+    partition_count = partition_count or getattr(settings, 'ROI_PARTITION_COUNT', 8)
+    if catch_up is None:
+        catch_up = getattr(settings, 'ROI_CATCH_UP', False)
+    
+    # Runs whose partitions ran out of retries or stalled are resumed first,
+    # then today's run starts as usual
+    stale_timeout = getattr(settings, 'ROI_FANOUT_STALE_TIMEOUT', 3600)
+    resumed_count = 0
+    while True:
+        parent, partitions = ROICreditService.resume_fanout_run(stale_timeout=stale_timeout)
+        if parent is None:
+            break
+        logger.info(f"Resuming ROI run {parent.id}: {len(partitions)} partitions left")
+        _dispatch_fanout_run(parent, partitions)
+        resumed_count += 1
+    
+    if not ROICreditService.get_due_investments().exists():
+        logger.info("No investments due for ROI crediting")
+        return f"No investments due for ROI crediting, {resumed_count} run(s) resumed"
+    
+    parent, partitions = ROICreditService.start_fanout_run(
+        partition_count,
+        catch_up=catch_up,
+        transaction_mode=getattr(settings, 'ROI_CATCH_UP_TRANSACTION_MODE', 'per_cycle')
+    )
+    _dispatch_fanout_run(parent, partitions)
+    
+    logger.info(f"ROI run {parent.id} dispatched across {len(partitions)} partitions")
+    return f"ROI run {parent.id} dispatched across {len(partitions)} partitions, {resumed_count} run(s) resumed"
+
+
+def _dispatch_fanout_run(parent, partitions):
+    """Credit the partitions of a coordinator run in parallel as a chord."""
+    if not partitions:
+        finalize_roi_fanout_task.delay([], str(parent.id))
+    else:
+        chord(
+            [credit_roi_partition_task.s(str(partition.id)) for partition in partitions]
+        )(
+            finalize_roi_fanout_task.s(str(parent.id)).on_error(fail_roi_fanout_task.s(str(parent.id)))
+        )
+
+
+@shared_task(bind=True, max_retries=3)
+def credit_roi_partition_task(self, run_id):
+    """Credit ROI for one user_id partition of a fanned-out ROI run."""
+    try:
+        run = ROIRun.objects.get(id=run_id)
+        ROICreditService.process_run(run)
+        
+        logger.info(
+            f"ROI partition {run.partition_index} completed: {run.credited_count} investments processed, "
+            f"Total ROI: {run.total_roi_credited}"
+        )
+        
+        return {
+            'run_id': str(run.id),
+            'credited_count': run.credited_count,
+            'total_roi_credited': str(run.total_roi_credited),
+        }
+        
+    except Exception as e:
+        logger.error(f"ROI partition {run_id} failed: {str(e)}")
+        # Retry the partition, resuming from its last committed chunk
         raise self.retry(countdown=60, exc=e)
 
 
+@shared_task
+def finalize_roi_fanout_task(results, parent_run_id):
+    """Chord callback that aggregates partition results into the coordinator run."""
+    parent = ROICreditService.finalize_fanout_run(ROIRun.objects.get(id=parent_run_id))
+    
+    logger.info(
+        f"ROI crediting completed: {parent.credited_count} investments processed "
+        f"across {parent.partition_count} partitions, Total ROI: {parent.total_roi_credited}"
+    )
+    
+    return f"ROI crediting completed: {parent.credited_count} investments processed"
+
+
+@shared_task
+def fail_roi_fanout_task(request, exc, traceback, parent_run_id):
+    """
+    Chord errback, called when a partition runs out of retries and the
+    callback never fires. Marks the coordinator run failed so the next
+    fan-out resumes it.
+    """
+    parent = ROICreditService.finalize_fanout_run(ROIRun.objects.get(id=parent_run_id))
+    
+    logger.error(f"ROI run {parent.id} failed: {parent.last_error or exc}")
+    return f"ROI run {parent.id} failed"
+
+
 def calculate_roi_amount(investment):
     """
     Calculate ROI amount for a single investment cycle.
@@ -85,19 +175,7 @@ def calculate_roi_amount(investment):
         Decimal: ROI amount for this cycle
     """
     try:
-        # Get ROI rate per cycle from the plan
-        roi_rate_per_cycle = investment.plan.get_roi_per_cycle()
-        
-        # Calculate ROI amount
-        roi_amount = investment.amount * Decimal(str(roi_rate_per_cycle))
-        
-        # Round to appropriate decimal places
-        if investment.currency == 'inr':
-            roi_amount = roi_amount.quantize(Decimal('0.01'))
-        else:  # usdt
-            roi_amount = roi_amount.quantize(Decimal('0.000001'))
-        
-        return roi_amount
+        return ROICreditService.calculate_roi_amount(investment)
         
     except Exception as e:
         logger.error(f"Failed to calculate ROI for investment {investment.id}: {str(e)}")
@@ -114,33 +192,14 @@ def credit_roi_to_wallet(investment, roi_amount):
     """
     try:
         user = investment.user
-        currency = investment.currency
-        
-        # Get the appropriate wallet
-        if currency == 'inr':
-            wallet = user.inr_wallet
-            chain_type = None
-        else:  # usdt
-            wallet = user.usdt_wallet
-            chain_type = wallet.chain_type
+        currency = investment.currency.lower()
         
-        # Record balance before credit
-        balance_before = wallet.balance
-        
-        # Credit ROI to wallet
-        wallet.add_balance(roi_amount)
-        wallet.save()
-        
-        # Log the ROI transaction
-        WalletTransaction.objects.create(
-            user=user,
-            transaction_type='roi_credit',
-            wallet_type=currency,
-            chain_type=chain_type,
-            amount=roi_amount,
-            balance_before=balance_before,
-            balance_after=wallet.balance,
-            status='completed',
+        # Credit ROI and log the transaction atomically on the wallet row
+        wallet_transaction = WalletLedgerService.credit(
+            user,
+            currency,
+            roi_amount,
+            'roi_credit',
             reference_id=str(investment.id),
             description=f"ROI credit for {investment.plan.name}",
             metadata={
@@ -154,7 +213,7 @@ def credit_roi_to_wallet(investment, roi_amount):
         
         logger.info(
             f"ROI credited to {currency.upper()} wallet for user {user.username}: "
-            f"{roi_amount} (Balance: {balance_before} → {wallet.balance})"
+            f"{roi_amount} (Balance: {wallet_transaction.balance_before} → {wallet_transaction.balance_after})"
         )
         
     except Exception as e:
@@ -171,29 +230,14 @@ def process_completed_investments():
     This task should be run daily to clean up completed investments.
     """
     try:
-        with transaction.atomic():
-            # Get all investments that have reached their end date
-            now = timezone.now()
-            completed_investments = Investment.objects.filter(
-                Q(status='active') & 
-                Q(is_active=True) & 
-                Q(end_date__lte=now)
-            )
-            
-            if not completed_investments.exists():
-                logger.info("No investments to mark as completed")
-                return "No investments to mark as completed"
-            
-            # Mark investments as completed
-            for investment in completed_investments:
-                investment.status = 'completed'
-                investment.is_active = False
-                investment.save(update_fields=['status', 'is_active', 'updated_at'])
-                
-                logger.info(f"Investment {investment.id} marked as completed")
-            
-            logger.info(f"Processed {completed_investments.count()} completed investments")
-            return f"Processed {completed_investments.count()} completed investments"
+        result = InvestmentMaturityService.complete_matured_investments()
+        
+        if not result['completed_count']:
+            logger.info("No investments to mark as completed")
+            return "No investments to mark as completed"
+        
+        logger.info(f"Processed {result['completed_count']} completed investments")
+        return f"Processed {result['completed_count']} completed investments"
             
     except Exception as e:
         logger.error(f"Failed to process completed investments: {str(e)}")
@@ -1,8 +1,9 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from django.db.models import Q
 from decimal import Decimal
-from datetime import timedelta
+from datetime import date, timedelta
 import uuid
 
 from .models import InvestmentPlan, Investment, BreakdownRequest
@@ -530,3 +531,525 @@ class InvestmentValidationTest(TestCase):
         # Test approving non-pending investment
         with self.assertRaises(ValueError):
             investment.approve_breakdown()
+
+
+class ROICreditServiceTest(TestCase):
+    """Test cases for the set-based ROI crediting engine."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            username='roiuser',
+            email='roi@example.com',
+            password='testpass123'
+        )
+        self.plan = InvestmentPlan.objects.create(
+            name="ROI Daily Plan",
+            fixed_amount=Decimal('1000.00'),
+            roi_rate=Decimal('2.00'),
+            frequency='daily',
+            duration_days=30,
+            breakdown_window_days=10
+        )
+        self.inr_wallet, _ = INRWallet.objects.get_or_create(user=self.user)
+        self.inr_wallet.balance = Decimal('500.00')
+        self.inr_wallet.save()
+        self.usdt_wallet, _ = USDTWallet.objects.get_or_create(user=self.user)
+        self.usdt_wallet.balance = Decimal('10.000000')
+        self.usdt_wallet.save()
+        
+        start_date = timezone.now() - timedelta(days=1, hours=1)
+        self.inr_investments = [
+            Investment.objects.create(
+                user=self.user, plan=self.plan, amount=amount,
+                currency='INR', start_date=start_date
+            )
+            for amount in (Decimal('1000.00'), Decimal('2500.00'))
+        ]
+        self.usdt_investment = Investment.objects.create(
+            user=self.user, plan=self.plan, amount=Decimal('333.333333'),
+            currency='USDT', start_date=start_date
+        )
+    
+    def test_credit_batch_matches_per_investment_results(self):
+        """Test that a batch credit produces the same rows as crediting one by one."""
+        from .services import ROICreditService
+        
+        result = ROICreditService.credit_due_investments()
+        
+        self.assertEqual(result['credited_count'], 3)
+        self.assertEqual(result['total_roi_credited'], Decimal('20.00') + Decimal('50.00') + Decimal('6.666667'))
+        
+        self.inr_wallet.refresh_from_db()
+        self.usdt_wallet.refresh_from_db()
+        self.assertEqual(self.inr_wallet.balance, Decimal('570.00'))
+        self.assertEqual(self.usdt_wallet.balance, Decimal('16.666667'))
+        
+        for investment, expected_roi in zip(self.inr_investments, (Decimal('20.00'), Decimal('50.00'))):
+            previous_next_roi_date = investment.next_roi_date
+            investment.refresh_from_db()
+            self.assertEqual(investment.roi_accrued, expected_roi)
+            self.assertEqual(investment.next_roi_date, previous_next_roi_date + timedelta(days=1))
+            self.assertIsNotNone(investment.last_roi_credit)
+        
+        transactions = WalletTransaction.objects.filter(
+            user=self.user, transaction_type='roi_credit', wallet_type='inr'
+        ).order_by('balance_before')
+        self.assertEqual(len(transactions), 2)
+        self.assertEqual(transactions[0].balance_before, Decimal('500.00'))
+        self.assertEqual(transactions[0].balance_after, transactions[1].balance_before)
+        self.assertEqual(transactions[1].balance_after, Decimal('570.00'))
+        self.assertEqual(
+            sorted(tx.amount for tx in transactions), [Decimal('20.00'), Decimal('50.00')]
+        )
+        usdt_transaction = WalletTransaction.objects.get(user=self.user, wallet_type='usdt')
+        self.assertEqual(usdt_transaction.amount, Decimal('6.666667'))
+        self.assertEqual(usdt_transaction.chain_type, self.usdt_wallet.chain_type)
+    
+    def test_investments_not_due_are_skipped(self):
+        """Test that investments with a future ROI date are not credited."""
+        from .services import ROICreditService
+        
+        Investment.objects.filter(id=self.usdt_investment.id).update(
+            next_roi_date=timezone.now() + timedelta(hours=1)
+        )
+        
+        result = ROICreditService.credit_due_investments()
+        
+        self.assertEqual(result['credited_count'], 2)
+        self.usdt_investment.refresh_from_db()
+        self.assertEqual(self.usdt_investment.roi_accrued, Decimal('0'))
+    
+    def test_failed_run_resumes_from_last_committed_chunk(self):
+        """Test that a failed run resumes after its last committed chunk."""
+        from unittest.mock import patch
+        from .models import ROIRun
+        from .services import ROICreditService
+        
+        run = ROIRun.objects.create(cutoff=timezone.now())
+        original_credit_batch = ROICreditService.credit_batch
+        calls = []
+        
+        def failing_credit_batch(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError("worker lost")
+            return original_credit_batch(*args, **kwargs)
+        
+        with patch.object(ROICreditService, 'credit_batch', side_effect=failing_credit_batch):
+            with self.assertRaises(RuntimeError):
+                ROICreditService.process_run(run, chunk_size=1)
+        
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'failed')
+        self.assertEqual(run.chunk_count, 1)
+        self.assertEqual(run.credited_count, 1)
+        
+        ROICreditService.process_run(run, chunk_size=1)
+        
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'completed')
+        self.assertEqual(run.credited_count, 3)
+        self.assertEqual(
+            WalletTransaction.objects.filter(user=self.user, transaction_type='roi_credit').count(), 3
+        )
+    
+    def test_cycle_is_never_credited_twice(self):
+        """Test that crediting the same cycle again is a no-op."""
+        from .services import ROICreditService
+        
+        stale_investments = list(Investment.objects.select_related('plan').filter(user=self.user))
+        
+        first = ROICreditService.credit_batch(stale_investments)
+        second = ROICreditService.credit_batch(stale_investments)
+        
+        self.assertEqual(first['credited_count'], 3)
+        self.assertEqual(second['credited_count'], 0)
+        self.inr_wallet.refresh_from_db()
+        self.assertEqual(self.inr_wallet.balance, Decimal('570.00'))
+    
+    def test_credit_roi_task_records_completed_run(self):
+        """Test that the ROI task records its work in an ROI run."""
+        from .models import ROIRun
+        from .tasks import credit_roi_task
+        
+        result = credit_roi_task.apply()
+        
+        self.assertEqual(result.get(), "ROI crediting completed: 3 investments processed")
+        run = ROIRun.objects.get()
+        self.assertEqual(run.status, 'completed')
+        self.assertEqual(run.credited_count, 3)
+        self.assertEqual(credit_roi_task.apply().get(), "No investments due for ROI crediting")
+
+    def test_catch_up_credits_every_elapsed_cycle(self):
+        """Test that catch-up mode credits all elapsed cycles with one transaction each."""
+        from .services import ROICreditService
+
+        lagging_date = timezone.now() - timedelta(days=2, hours=1)
+        Investment.objects.filter(user=self.user).update(next_roi_date=lagging_date)
+
+        result = ROICreditService.credit_due_investments(catch_up=True)
+
+        self.assertEqual(result['credited_count'], 3)
+        self.inr_wallet.refresh_from_db()
+        self.assertEqual(self.inr_wallet.balance, Decimal('710.00'))
+        self.assertEqual(
+            WalletTransaction.objects.filter(user=self.user, wallet_type='inr').count(), 6
+        )
+        investment = Investment.objects.get(id=self.inr_investments[0].id)
+        self.assertEqual(investment.roi_accrued, Decimal('60.00'))
+        self.assertEqual(investment.next_roi_date, lagging_date + timedelta(days=3))
+        self.assertEqual(ROICreditService.credit_due_investments(catch_up=True)['credited_count'], 0)
+
+    def test_catch_up_aggregate_writes_one_transaction(self):
+        """Test that aggregate catch-up writes one transaction per investment."""
+        from .services import ROICreditService
+
+        Investment.objects.filter(id=self.usdt_investment.id).update(
+            next_roi_date=timezone.now() - timedelta(days=2, hours=1)
+        )
+
+        ROICreditService.credit_due_investments(catch_up=True, transaction_mode='aggregate')
+
+        usdt_transaction = WalletTransaction.objects.get(user=self.user, wallet_type='usdt')
+        self.assertEqual(usdt_transaction.amount, Decimal('20.000001'))
+        self.assertEqual(usdt_transaction.balance_after, Decimal('30.000001'))
+        self.assertEqual(usdt_transaction.metadata['cycle_count'], 3)
+
+
+class ROIFanoutTest(TestCase):
+    """Test cases for partitioned ROI runs."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.plan = InvestmentPlan.objects.create(
+            name="Fanout Daily Plan",
+            fixed_amount=Decimal('1000.00'),
+            roi_rate=Decimal('1.00'),
+            frequency='daily',
+            duration_days=30,
+            breakdown_window_days=10
+        )
+        start_date = timezone.now() - timedelta(days=1, hours=1)
+        self.users = []
+        for index in range(6):
+            user = User.objects.create_user(
+                username=f'fanout{index}',
+                email=f'fanout{index}@example.com',
+                password='testpass123'
+            )
+            INRWallet.objects.get_or_create(user=user)
+            Investment.objects.create(
+                user=user, plan=self.plan, amount=Decimal('1000.00'),
+                currency='INR', start_date=start_date
+            )
+            self.users.append(user)
+    
+    def test_partition_bounds_cover_uuid_space_without_overlap(self):
+        """Test that partition bounds are contiguous and non-overlapping."""
+        from .services import ROICreditService
+        
+        bounds = ROICreditService.get_partition_bounds(4)
+        
+        self.assertEqual(len(bounds), 4)
+        self.assertIsNone(bounds[0][0])
+        self.assertIsNone(bounds[-1][1])
+        for (_, end), (start, _) in zip(bounds, bounds[1:]):
+            self.assertEqual(end, start)
+    
+    def test_partitions_credit_each_investment_once(self):
+        """Test that partition runs together credit every due investment once."""
+        from .services import ROICreditService
+        
+        parent, partitions = ROICreditService.start_fanout_run(3)
+        for partition in partitions:
+            ROICreditService.process_run(partition)
+        parent = ROICreditService.finalize_fanout_run(parent)
+        
+        self.assertEqual(parent.status, 'completed')
+        self.assertEqual(parent.credited_count, 6)
+        self.assertEqual(parent.total_roi_credited, Decimal('60.00'))
+        self.assertEqual(
+            WalletTransaction.objects.filter(transaction_type='roi_credit').count(), 6
+        )
+        for user in self.users:
+            self.assertEqual(INRWallet.objects.get(user=user).balance, Decimal('10.00'))
+    
+    def test_failed_partition_is_resumed(self):
+        """Test that a partition out of retries fails the run and the next fan-out resumes it."""
+        from .models import ROIRun
+        from .services import ROICreditService
+        from .tasks import fail_roi_fanout_task
+        
+        parent, partitions = ROICreditService.start_fanout_run(3)
+        for partition in partitions[1:]:
+            ROICreditService.process_run(partition)
+        ROIRun.objects.filter(id=partitions[0].id).update(status='failed', last_error='DB down')
+        
+        # The chord errback runs instead of the callback
+        fail_roi_fanout_task.run(None, RuntimeError('DB down'), None, str(parent.id))
+        parent.refresh_from_db()
+        self.assertEqual(parent.status, 'failed')
+        
+        resumed, unfinished = ROICreditService.resume_fanout_run()
+        self.assertEqual(resumed.id, parent.id)
+        self.assertEqual([run.id for run in unfinished], [partitions[0].id])
+        self.assertEqual(ROICreditService.resume_fanout_run(), (None, []))
+        
+        ROICreditService.process_run(unfinished[0])
+        parent = ROICreditService.finalize_fanout_run(resumed)
+        self.assertEqual((parent.status, parent.credited_count), ('completed', 6))
+        self.assertEqual(
+            WalletTransaction.objects.filter(transaction_type='roi_credit').count(), 6
+        )
+
+    
+    def test_stalled_run_is_resumed(self):
+        """Test that a running coordinator whose partitions stopped updating is resumed."""
+        from .models import ROIRun
+        from .services import ROICreditService
+        
+        parent, partitions = ROICreditService.start_fanout_run(3)
+        ROICreditService.process_run(partitions[0])
+        
+        # A run that is still making progress is left alone
+        self.assertEqual(ROICreditService.resume_fanout_run(stale_timeout=3600), (None, []))
+        
+        # The other partitions were lost with their worker, so no callback fires
+        ROIRun.objects.filter(Q(id=parent.id) | Q(parent=parent)).update(
+            updated_at=timezone.now() - timedelta(hours=2)
+        )
+        resumed, unfinished = ROICreditService.resume_fanout_run(stale_timeout=3600)
+        
+        self.assertEqual(resumed.id, parent.id)
+        self.assertEqual((resumed.status, resumed.last_error), ('running', None))
+        self.assertEqual({run.id for run in unfinished}, {run.id for run in partitions[1:]})
+        
+        for partition in unfinished:
+            ROICreditService.process_run(partition)
+        parent = ROICreditService.finalize_fanout_run(resumed)
+        self.assertEqual((parent.status, parent.credited_count), ('completed', 6))
+    
+    def test_fanout_starts_new_run_after_resuming(self):
+        """Test that resuming a failed run does not hold back the run for today's cutoff."""
+        from unittest.mock import patch
+        from .models import ROIRun
+        from .services import ROICreditService
+        from .tasks import credit_roi_fanout_task
+        
+        failed, _ = ROICreditService.start_fanout_run(2)
+        ROIRun.objects.filter(id=failed.id).update(status='failed')
+        
+        with patch('app.investment.tasks._dispatch_fanout_run') as dispatch:
+            credit_roi_fanout_task.run(partition_count=2)
+        
+        dispatched = [call.args[0] for call in dispatch.call_args_list]
+        self.assertEqual(len(dispatched), 2)
+        self.assertEqual(dispatched[0].id, failed.id)
+        self.assertNotEqual(dispatched[1].id, failed.id)
+        self.assertEqual(ROIRun.objects.filter(parent__isnull=True, partition_count=2).count(), 2)
+
+
+class ROICalculatorTest(TestCase):
+    """Test cases for the shared ROI calculator."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            username='calcuser',
+            email='calc@example.com',
+            password='testpass123'
+        )
+        self.weekly_plan = InvestmentPlan.objects.create(
+            name="Calc Weekly Plan",
+            fixed_amount=Decimal('1000.00'),
+            roi_rate=Decimal('10.00'),
+            frequency='weekly',
+            duration_days=70,
+            breakdown_window_days=10
+        )
+        self.daily_plan = InvestmentPlan.objects.create(
+            name="Calc Daily Plan",
+            fixed_amount=Decimal('1000.00'),
+            roi_rate=Decimal('1.50'),
+            frequency='daily',
+            duration_days=30,
+            breakdown_window_days=10
+        )
+    
+    def test_batch_matches_single_calculation(self):
+        """Test that batch amounts equal the per-investment calculation."""
+        from .roi import ROICalculator
+        
+        investments = [
+            Investment(user=self.user, plan=plan, amount=amount, currency=currency)
+            for plan in (self.weekly_plan, self.daily_plan)
+            for amount in (Decimal('1000.00'), Decimal('1234.567891'))
+            for currency in ('INR', 'USDT')
+        ]
+        calculator = ROICalculator()
+        
+        batch = calculator.calculate_batch(investments)
+        
+        self.assertEqual([investment for investment, _ in batch], investments)
+        for investment, amount in batch:
+            expected = investment.amount * Decimal(str(investment.plan.get_roi_per_cycle()))
+            quantum = Decimal('0.01') if investment.currency == 'INR' else Decimal('0.000001')
+            self.assertEqual(amount, expected.quantize(quantum))
+        self.assertEqual(batch[0][1], Decimal('14.29'))
+        self.assertEqual(batch[1][1], Decimal('14.285714'))
+
+
+class ROIForecastTest(TestCase):
+    """Test cases for the read-only ROI forecast."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            username='forecastuser',
+            email='forecast@example.com',
+            password='testpass123'
+        )
+        self.plan = InvestmentPlan.objects.create(
+            name="Forecast Daily Plan",
+            fixed_amount=Decimal('1000.00'),
+            roi_rate=Decimal('2.00'),
+            frequency='daily',
+            duration_days=30,
+            breakdown_window_days=10
+        )
+        self.now = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.inr_investment = Investment.objects.create(
+            user=self.user, plan=self.plan, amount=Decimal('1000.00'),
+            currency='INR', start_date=self.now - timedelta(days=1, hours=1)
+        )
+        self.usdt_investment = Investment.objects.create(
+            user=self.user, plan=self.plan, amount=Decimal('333.333333'),
+            currency='USDT', start_date=self.now - timedelta(days=1, hours=1)
+        )
+        Investment.objects.filter(id=self.usdt_investment.id).update(end_date=self.now + timedelta(days=1))
+    
+    def test_forecast_totals_per_day_plan_and_currency(self):
+        """Test that the forecast buckets each cycle on its day and stops at end_date."""
+        from .services import ROIForecastService
+        
+        forecast = ROIForecastService.forecast(days=3, now=self.now)
+        
+        rows = [(row['date'], row['currency'], row['total_roi']) for row in forecast['rows']]
+        today = self.now.date()
+        self.assertEqual(rows, [
+            (today.isoformat(), 'INR', Decimal('20.00')),
+            (today.isoformat(), 'USDT', Decimal('6.666667')),
+            ((today + timedelta(days=1)).isoformat(), 'INR', Decimal('20.00')),
+            ((today + timedelta(days=1)).isoformat(), 'USDT', Decimal('6.666667')),
+            ((today + timedelta(days=2)).isoformat(), 'INR', Decimal('20.00')),
+        ])
+        self.assertEqual(forecast['totals'], {'INR': Decimal('60.00'), 'USDT': Decimal('13.333334')})
+        self.assertFalse(WalletTransaction.objects.exists())
+    
+    def test_forecast_matches_credited_amount(self):
+        """Test that today's forecast equals what the crediting engine pays."""
+        from .services import ROICreditService, ROIForecastService
+        
+        INRWallet.objects.get_or_create(user=self.user)
+        USDTWallet.objects.get_or_create(user=self.user)
+        forecast = ROIForecastService.forecast(days=1, now=self.now)
+        result = ROICreditService.credit_due_investments(now=self.now)
+        
+        self.assertEqual(sum(forecast['totals'].values()), result['total_roi_credited'])
+    
+    def test_forecast_overdue_cycles_follow_catch_up_setting(self):
+        """Test that overdue cycles land on day 0 with catch-up and one per day without it."""
+        from .services import ROIForecastService
+        
+        lagging_plan = InvestmentPlan.objects.create(
+            name="Forecast Lagging Plan",
+            fixed_amount=Decimal('1000.00'),
+            roi_rate=Decimal('1.00'),
+            frequency='daily',
+            duration_days=30,
+            breakdown_window_days=10
+        )
+        Investment.objects.create(
+            user=self.user, plan=lagging_plan, amount=Decimal('1000.00'),
+            currency='INR', start_date=self.now - timedelta(days=3, hours=1)
+        )
+        today = self.now.date()
+        
+        def lagging_rows():
+            forecast = ROIForecastService.forecast(days=4, now=self.now)
+            return [
+                ((date.fromisoformat(row['date']) - today).days, row['cycle_count'])
+                for row in forecast['rows'] if row['plan_name'] == lagging_plan.name
+            ]
+        
+        # Three cycles are overdue and one more falls due on each following day
+        with override_settings(ROI_CATCH_UP=True):
+            self.assertEqual(lagging_rows(), [(0, 3), (1, 1), (2, 1), (3, 1)])
+        
+        # One cycle per run: the backlog delays the upcoming cycles past the horizon
+        with override_settings(ROI_CATCH_UP=False):
+            self.assertEqual(lagging_rows(), [(0, 1), (1, 1), (2, 1), (3, 1)])
+    
+    def test_forecast_rejects_out_of_range_days(self):
+        """Test that the forecast horizon is bounded."""
+        from .services import ROIForecastService
+        
+        with self.assertRaises(ValueError):
+            ROIForecastService.forecast(days=0)
+
+
+class InvestmentMaturityTest(TestCase):
+    """Test cases for set-based completion of matured investments."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            username='maturityuser',
+            email='maturity@example.com',
+            password='testpass123'
+        )
+        self.plan = InvestmentPlan.objects.create(
+            name="Maturity Daily Plan",
+            fixed_amount=Decimal('1000.00'),
+            roi_rate=Decimal('1.00'),
+            frequency='daily',
+            duration_days=30,
+            breakdown_window_days=10
+        )
+        self.investments = [
+            Investment.objects.create(
+                user=self.user, plan=self.plan, amount=Decimal('1000.00'),
+                currency='INR', start_date=timezone.now() - timedelta(days=days)
+            )
+            for days in (31, 32, 33, 5)
+        ]
+    
+    def test_matured_investments_completed_in_chunks(self):
+        """Test that matured investments are completed with accurate counts and work items."""
+        from .services import InvestmentMaturityService
+        from .signals import investments_matured
+        
+        received = []
+        
+        def receiver(sender, investments, **kwargs):
+            received.extend(investment['id'] for investment in investments)
+        
+        investments_matured.connect(receiver)
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                result = InvestmentMaturityService.complete_matured_investments(chunk_size=2)
+        finally:
+            investments_matured.disconnect(receiver)
+        
+        self.assertEqual(result, {'completed_count': 3, 'chunk_count': 2})
+        self.assertEqual(set(received), {investment.id for investment in self.investments[:3]})
+        self.assertEqual(Investment.objects.filter(status='completed', is_active=False).count(), 3)
+        self.assertEqual(Investment.objects.get(id=self.investments[3].id).status, 'active')
+    
+    def test_task_reports_processed_count(self):
+        """Test that the maturity task reports the number of completed investments."""
+        from .tasks import process_completed_investments
+        
+        self.assertEqual(process_completed_investments(), "Processed 3 completed investments")
+        self.assertEqual(process_completed_investments(), "No investments to mark as completed")
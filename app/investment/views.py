@@ -4,9 +4,12 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from django.db.models import Sum, Count, Q
 from decimal import Decimal
 
+from app.wallet.services import WalletLedgerService
+
 from .models import InvestmentPlan, Investment, BreakdownRequest
 from .serializers import (
     InvestmentPlanSerializer, InvestmentPlanListSerializer,
@@ -184,28 +187,9 @@ class AdminBreakdownRequestViewSet(viewsets.ReadOnlyModelViewSet):
                 currency = investment.currency
                 user = investment.user
                 
-                if currency == 'inr':
-                    wallet = user.inr_wallet
-                else:  # usdt
-                    wallet = user.usdt_wallet
-                
-                # Record balance before credit
-                balance_before = wallet.balance
-                
                 # Credit balance
-                wallet.add_balance(final_amount)
-                wallet.save()
-                
-                # Log transaction
-                WalletTransaction.objects.create(
-                    user=user,
-                    transaction_type='refund',
-                    wallet_type=currency,
-                    chain_type=None if currency == 'inr' else wallet.chain_type,
-                    amount=final_amount,
-                    balance_before=balance_before,
-                    balance_after=wallet.balance,
-                    status='completed',
+                WalletLedgerService.credit(
+                    user, currency, final_amount, 'refund',
                     reference_id=str(breakdown_request.id),
                     description=f"Breakdown payout for {investment.plan.name}",
                     metadata={
@@ -219,19 +203,8 @@ class AdminBreakdownRequestViewSet(viewsets.ReadOnlyModelViewSet):
                 
                 # If ROI was accrued, credit it to wallet
                 if investment.roi_accrued > 0:
-                    roi_balance_before = wallet.balance
-                    wallet.add_balance(investment.roi_accrued)
-                    wallet.save()
-                    
-                    WalletTransaction.objects.create(
-                        user=user,
-                        transaction_type='roi_credit',
-                        wallet_type=currency,
-                        chain_type=None if currency == 'inr' else wallet.chain_type,
-                        amount=investment.roi_accrued,
-                        balance_before=roi_balance_before,
-                        balance_after=wallet.balance,
-                        status='completed',
+                    WalletLedgerService.credit(
+                        user, currency, investment.roi_accrued, 'roi_credit',
                         reference_id=str(investment.id),
                         description=f"ROI settlement for {investment.plan.name} breakdown",
                         metadata={
@@ -273,28 +246,9 @@ class AdminBreakdownRequestViewSet(viewsets.ReadOnlyModelViewSet):
                     currency = investment.currency
                     user = investment.user
                     
-                    if currency == 'inr':
-                        wallet = user.inr_wallet
-                    else:  # usdt
-                        wallet = user.usdt_wallet
-                    
-                    # Record balance before credit
-                    balance_before = wallet.balance
-                    
                     # Credit ROI
-                    wallet.add_balance(investment.roi_accrued)
-                    wallet.save()
-                    
-                    # Log transaction
-                    WalletTransaction.objects.create(
-                        user=user,
-                        transaction_type='roi_credit',
-                        wallet_type=currency,
-                        chain_type=None if currency == 'inr' else wallet.chain_type,
-                        amount=investment.roi_accrued,
-                        balance_before=balance_before,
-                        balance_after=wallet.balance,
-                        status='completed',
+                    WalletLedgerService.credit(
+                        user, currency, investment.roi_accrued, 'roi_credit',
                         reference_id=str(investment.id),
                         description=f"ROI settlement for {investment.plan.name} breakdown rejection",
                         metadata={
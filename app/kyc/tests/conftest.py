@@ -222,6 +222,13 @@ class KYCVerificationLogFactory(DjangoModelFactory):
 
 
 # Test Fixtures
+@pytest.fixture(autouse=True)
+def temp_media_root(tmp_path):
+    """Write uploaded files to a temporary MEDIA_ROOT instead of the checked-in media tree"""
+    with override_settings(MEDIA_ROOT=str(tmp_path)):
+        yield
+
+
 @pytest.fixture
 def admin_user():
     """Admin user for testing admin operations"""
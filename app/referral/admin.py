@@ -5,7 +5,7 @@ from django.urls import reverse
 from django.utils.safestring import mark_safe
 from .models import (
     Referral, ReferralEarning, ReferralMilestone, 
-    UserReferralProfile, ReferralConfig
+    UserReferralProfile, ReferralConfig, ReferralEarningDaily
 )
 
 
@@ -333,9 +333,13 @@ def get_referral_stats():
         'total_users': User.objects.count(),
         'total_profiles': UserReferralProfile.objects.count(),
         'total_referrals': Referral.objects.count(),
-        'total_earnings': ReferralEarning.objects.filter(status='credited').aggregate(
+        'total_earnings': ReferralEarningDaily.objects.aggregate(
             total=Sum('amount')
         )['total'] or 0,
+        'earnings_by_currency': {
+            row['currency']: row['total']
+            for row in ReferralEarningDaily.objects.values('currency').annotate(total=Sum('amount'))
+        },
         'active_milestones': ReferralMilestone.objects.filter(is_active=True).count(),
         'pending_earnings': ReferralEarning.objects.filter(status='pending').count(),
     }
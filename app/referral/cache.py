@@ -0,0 +1,90 @@
+"""
+Two-level cache for the referral catalogue (active config and milestones).
+
+Reads are served from process memory for REFERRAL_LOCAL_CACHE_TTL seconds,
+then from the shared Django cache, and only then from the database. The
+save/delete signals of ReferralConfig and ReferralMilestone invalidate both
+levels; other processes pick the change up once their local entry expires.
+
+That relies on the Django cache being shared by all processes (Redis, see
+CACHES). With a process-local backend an invalidation cannot reach other
+processes, so entries are kept there for REFERRAL_LOCAL_CACHE_TTL only and
+edits still show up everywhere within that time.
+"""
+import time
+import logging
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_CONFIG_KEY = 'referral:active_config'
+ACTIVE_MILESTONES_KEY = 'referral:active_milestones'
+
+# Set while a debounced milestone evaluation is queued
+MILESTONE_CHECK_PENDING_KEY = 'referral:milestone_check_pending'
+
+_MISSING = object()
+_local = {}
+
+
+def get_or_load(key, loader):
+    """
+    Get a catalogue entry from process memory, the shared cache or the loader.
+    
+    When the shared cache is unreachable the entry is loaded from the
+    database and kept in process memory only.
+    
+    Args:
+        key: Cache key of the entry
+        loader: Callable that reads the entry from the database
+    """
+    now = time.monotonic()
+    entry = _local.get(key)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    
+    local_ttl = getattr(settings, 'REFERRAL_LOCAL_CACHE_TTL', 30)
+    try:
+        value = cache.get(key, _MISSING)
+    except Exception as e:
+        # A cache outage must not take signups and payouts down with it
+        logger.error(f"Referral cache read of {key} failed, loading from the database: {str(e)}")
+        value = loader()
+        _local[key] = (now + local_ttl, value)
+        return value
+    if value is _MISSING:
+        value = loader()
+        if isinstance(caches['default'], (LocMemCache, DummyCache)):
+            # Only this process would ever see an invalidation
+            timeout = local_ttl
+        else:
+            timeout = getattr(settings, 'REFERRAL_CACHE_TIMEOUT', 3600)
+        try:
+            cache.set(key, value, timeout)
+        except Exception as e:
+            logger.error(f"Referral cache write of {key} failed: {str(e)}")
+    
+    _local[key] = (now + local_ttl, value)
+    return value
+
+
+def invalidate(*keys):
+    """
+    Drop catalogue entries from both cache levels.
+    
+    The entries are dropped right away and again once the surrounding
+    transaction commits, so a reader cannot re-cache the old rows in between.
+    """
+    def _drop():
+        cache.delete_many(keys)
+        for key in keys:
+            _local.pop(key, None)
+    
+    _drop()
+    transaction.on_commit(_drop)
+    logger.info(f"Invalidated referral cache entries: {', '.join(keys)}")
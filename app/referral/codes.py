@@ -0,0 +1,76 @@
+"""
+Referral code allocation.
+
+Codes are drawn from a database sequence and scrambled with a keyed Feistel
+permutation over the 8-character code space. A permutation is a bijection, so
+distinct sequence numbers always give distinct codes and allocating a code
+never has to query for collisions; many codes are allocated with one
+nextval() round trip. Without the key, consecutive codes look unrelated.
+"""
+import hashlib
+import hmac
+import string
+
+from django.conf import settings
+from django.db import connection
+
+ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 8
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+
+CODE_SEQUENCE = 'referral_code_seq'
+
+# The Feistel network permutes 42-bit numbers; results outside the code space
+# are fed through again ("cycle walking"), which keeps the mapping a bijection
+HALF_BITS = 21
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+
+
+def _round_value(key, round_index, value):
+    digest = hmac.new(key, f"{round_index}:{value}".encode(), hashlib.sha256).digest()
+    return int.from_bytes(digest[:4], 'big') & HALF_MASK
+
+
+def permute(number, key=None):
+    """Map a number in [0, CODE_SPACE) to a unique, unpredictable number in the same range."""
+    key = key or getattr(settings, 'REFERRAL_CODE_KEY', settings.SECRET_KEY).encode()
+    while True:
+        left, right = number >> HALF_BITS, number & HALF_MASK
+        for round_index in range(ROUNDS):
+            left, right = right, left ^ _round_value(key, round_index, right)
+        number = (left << HALF_BITS) | right
+        if number < CODE_SPACE:
+            return number
+
+
+def encode(number):
+    """Encode a number in [0, CODE_SPACE) as a fixed-length referral code."""
+    chars = []
+    for _ in range(CODE_LENGTH):
+        number, index = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+def next_codes(count=1):
+    """
+    Allocate referral codes from the code sequence.
+    
+    Args:
+        count: Number of codes to allocate
+        
+    Returns:
+        list: count distinct codes
+    """
+    if count <= 0:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT nextval('{CODE_SEQUENCE}') FROM generate_series(1, %s)",
+            [count]
+        )
+        numbers = [row[0] for row in cursor.fetchall()]
+    
+    key = getattr(settings, 'REFERRAL_CODE_KEY', settings.SECRET_KEY).encode()
+    return [encode(permute(number % CODE_SPACE, key)) for number in numbers]
@@ -0,0 +1,235 @@
+"""
+Compact binary export of the referral graph for offline analysis.
+
+The file holds one node per referral profile in fixed-width little-endian
+columns, so a loader can memory-map it and read any column without parsing:
+
+    header         magic, version, node count, edge count
+    user_ids       16-byte UUID per node
+    parents        int32 node index of the direct referrer, -1 for roots
+    joined         int64 Unix timestamp of the user joining
+    invested_inr   float64 total invested in INR
+    invested_usdt  float64 total invested in USDT
+    child_offsets  uint32 per node plus one, into children
+    children       uint32 node indexes of the direct referrals (level-1 edges)
+
+Nodes are written in referral path order, which is a depth-first preorder of
+the hierarchy: every referrer comes before its downline. Every section starts
+on an 8-byte boundary.
+"""
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import uuid
+from array import array
+from collections import Counter
+
+
+MAGIC = b'REFGRAPH'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQ')
+
+# (name, array typecode) of the per-node columns after the user ids
+NODE_COLUMNS = [
+    ('parents', 'i'),
+    ('joined', 'q'),
+    ('invested_inr', 'd'),
+    ('invested_usdt', 'd'),
+]
+
+
+def _padding(size):
+    return b'\0' * (-size % 8)
+
+
+def _write_array(handle, values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    values.tofile(handle)
+
+
+def export_graph(path, chunk_size=10000):
+    """
+    Stream every referral profile into a graph file at path.
+
+    Profiles are read through a server-side cursor, chunk_size rows at a time;
+    the per-node columns are spooled to temporary files, so memory holds only
+    the user id to node index map and the parent column.
+
+    Args:
+        path: Output file path
+        chunk_size: Rows fetched per cursor round trip
+
+    Returns:
+        dict: node_count and edge_count
+    """
+    from .models import UserReferralProfile
+
+    rows = UserReferralProfile.objects.order_by(
+        # Arrays compare element by element, so a path sorts directly before its downline
+        'referral_path'
+    ).values_list(
+        'user_id', 'referred_by_id', 'user__date_joined', 'total_invested_inr', 'total_invested_usdt'
+    ).iterator(chunk_size=chunk_size)
+
+    index_of = {}
+    parents = array('i')
+    with tempfile.TemporaryDirectory() as spool:
+        id_file = open(os.path.join(spool, 'user_ids'), 'w+b')
+        column_files = {name: open(os.path.join(spool, name), 'w+b') for name, _ in NODE_COLUMNS[1:]}
+        try:
+            buffers = {name: array(typecode) for name, typecode in NODE_COLUMNS[1:]}
+            ids = bytearray()
+            for user_id, referred_by_id, joined, invested_inr, invested_usdt in rows:
+                index_of[user_id] = len(index_of)
+                ids += user_id.bytes
+                # A referrer that sorts after its referral only happens for stale paths; treat it as a root
+                parents.append(index_of.get(referred_by_id, -1))
+                buffers['joined'].append(int(joined.timestamp()) if joined else 0)
+                buffers['invested_inr'].append(float(invested_inr))
+                buffers['invested_usdt'].append(float(invested_usdt))
+                if len(ids) >= chunk_size * 16:
+                    id_file.write(ids)
+                    ids = bytearray()
+                    for name, values in buffers.items():
+                        _write_array(column_files[name], values)
+                        del values[:]
+            id_file.write(ids)
+            for name, values in buffers.items():
+                _write_array(column_files[name], values)
+
+            node_count = len(parents)
+            child_offsets = array('I', [0]) * (node_count + 1)
+            for parent in parents:
+                if parent >= 0:
+                    child_offsets[parent + 1] += 1
+            for index in range(node_count):
+                child_offsets[index + 1] += child_offsets[index]
+            edge_count = child_offsets[node_count]
+            children = array('I', [0]) * edge_count
+            fill = array('I', child_offsets[:node_count])
+            for index, parent in enumerate(parents):
+                if parent >= 0:
+                    children[fill[parent]] = index
+                    fill[parent] += 1
+
+            with open(path, 'wb') as output:
+                output.write(HEADER.pack(MAGIC, VERSION, 0, node_count, edge_count))
+                id_file.seek(0)
+                _copy(id_file, output)
+                output.write(_padding(node_count * 16))
+                _write_array(output, parents)
+                output.write(_padding(node_count * parents.itemsize))
+                for name, typecode in NODE_COLUMNS[1:]:
+                    column_files[name].seek(0)
+                    _copy(column_files[name], output)
+                    output.write(_padding(node_count * array(typecode).itemsize))
+                for values in (child_offsets, children):
+                    _write_array(output, values)
+                    output.write(_padding(len(values) * values.itemsize))
+        finally:
+            id_file.close()
+            for handle in column_files.values():
+                handle.close()
+
+    return {'node_count': node_count, 'edge_count': edge_count}
+
+
+def _copy(source, target, block_size=1 << 20):
+    while True:
+        block = source.read(block_size)
+        if not block:
+            return
+        target.write(block)
+
+
+class ReferralGraph:
+    """
+    Read-only, memory-mapped view of a graph file written by export_graph.
+
+    Columns are exposed as memoryviews over the mapping, so opening a graph
+    reads only the header; pages are loaded as columns are touched.
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise ValueError("Referral graph files can only be mapped on little-endian machines")
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.node_count, self.edge_count = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} referral graph file")
+
+        view = memoryview(self._map)
+        offset = HEADER.size
+        self._user_ids = view[offset:offset + self.node_count * 16]
+        offset += self.node_count * 16 + len(_padding(self.node_count * 16))
+        sections = NODE_COLUMNS + [('child_offsets', 'I'), ('children', 'I')]
+        for name, typecode in sections:
+            count = {'child_offsets': self.node_count + 1, 'children': self.edge_count}.get(name, self.node_count)
+            size = count * array(typecode).itemsize
+            setattr(self, name, view[offset:offset + size].cast(typecode))
+            offset += size + len(_padding(size))
+        self._index = None
+
+    def __len__(self):
+        return self.node_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the column views and unmap the file."""
+        for name in ['_user_ids', 'child_offsets', 'children'] + [name for name, _ in NODE_COLUMNS]:
+            column = self.__dict__.pop(name, None)
+            if column is not None:
+                column.release()
+        self._map.close()
+        self._file.close()
+
+    def user_id(self, node):
+        """Get the user id of a node."""
+        return uuid.UUID(bytes=bytes(self._user_ids[node * 16:node * 16 + 16]))
+
+    def index_of(self, user_id):
+        """Get the node index of a user id; builds the lookup table on first use."""
+        if self._index is None:
+            self._index = {
+                uuid.UUID(bytes=bytes(self._user_ids[node * 16:node * 16 + 16])): node
+                for node in range(self.node_count)
+            }
+        return self._index[uuid.UUID(str(user_id))]
+
+    def get_children(self, node):
+        """Get the node indexes of the direct referrals of a node."""
+        return self.children[self.child_offsets[node]:self.child_offsets[node + 1]]
+
+    def get_depths(self):
+        """Get the number of referrers above every node."""
+        depths = array('I', [0]) * self.node_count
+        parents = self.parents
+        for node in range(self.node_count):
+            if parents[node] >= 0:
+                depths[node] = depths[parents[node]] + 1
+        return depths
+
+    def get_downline_sizes(self):
+        """Get the number of users in every node's downline, at all levels."""
+        sizes = array('I', [0]) * self.node_count
+        parents = self.parents
+        # Referrers precede their downline, so a reverse pass sees every node's subtree complete
+        for node in range(self.node_count - 1, -1, -1):
+            if parents[node] >= 0:
+                sizes[parents[node]] += sizes[node] + 1
+        return sizes
+
+    def get_depth_distribution(self):
+        """Get the number of users at every depth of the hierarchy."""
+        return dict(sorted(Counter(self.get_depths()).items()))
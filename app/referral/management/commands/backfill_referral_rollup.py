@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.referral.models import ReferralEarningDaily
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily referral earnings rollup from the credited earnings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='First day to rebuild as YYYY-MM-DD (default: the whole history)'
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"Invalid --since date: {options['since']}")
+
+        rows = ReferralEarningDaily.rebuild(since=since)
+        scope = f"since {since}" if since else "for the whole history"
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} daily referral earnings rows {scope}"))
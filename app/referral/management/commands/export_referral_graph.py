@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.referral.graph import export_graph
+
+
+class Command(BaseCommand):
+    help = 'Export the referral graph to a compact binary file for offline analysis (see app.referral.graph)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Output file path')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Rows fetched per server-side cursor round trip (default: 10000)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            result = export_graph(options['path'], chunk_size=options['chunk_size'])
+        except OSError as e:
+            raise CommandError(f"Could not write {options['path']}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {result['node_count']} users and {result['edge_count']} direct referral edges "
+            f"to {options['path']}"
+        ))
@@ -0,0 +1,52 @@
+import csv
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.referral.services import ReferralService
+
+
+class Command(BaseCommand):
+    help = 'Onboard users with their referrer codes in bulk from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='CSV file with a header row, or JSONL file with one user object per line'
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='Input format (default: from the file extension)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows per INSERT (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.json') else 'csv')
+
+        try:
+            with open(path, newline='', encoding='utf-8') as handle:
+                if file_format == 'csv':
+                    rows = list(csv.DictReader(handle))
+                else:
+                    rows = [json.loads(line) for line in handle if line.strip()]
+        except OSError as e:
+            raise CommandError(f"Could not read {path}: {e}")
+        except json.JSONDecodeError as e:
+            raise CommandError(f"Invalid JSONL in {path}: {e}")
+
+        result = ReferralService.bulk_onboard_users(rows, batch_size=options['batch_size'])
+
+        for row in result['skipped']:
+            self.stdout.write(self.style.WARNING(f"Line {row['line']} ({row['email'] or '-'}): {row['reason']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created_count']} users with {result['referral_count']} referral rows, "
+            f"skipped {len(result['skipped'])} rows"
+        ))
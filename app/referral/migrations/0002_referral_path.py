@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-16 19:13
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+def backfill_referral_paths(apps, schema_editor):
+    """Build referral paths and depths from the existing referred_by links."""
+    UserReferralProfile = apps.get_model('referral', 'UserReferralProfile')
+    parents = dict(UserReferralProfile.objects.values_list('user_id', 'referred_by_id'))
+    paths = {}
+
+    def resolve(user_id):
+        # Walk up to the first resolved ancestor, stopping at broken or cyclic links
+        chain = []
+        current = user_id
+        while current is not None and current not in paths and current not in chain:
+            chain.append(current)
+            current = parents.get(current)
+        parent_path, parent_depth = paths.get(current, ([], -1))
+        for member in reversed(chain):
+            parent_path = parent_path + [member]
+            parent_depth += 1
+            paths[member] = (parent_path, parent_depth)
+        return paths[user_id]
+
+    profiles = []
+    for profile in UserReferralProfile.objects.only('id', 'user_id').iterator(chunk_size=2000):
+        profile.referral_path, profile.referral_depth = resolve(profile.user_id)
+        profiles.append(profile)
+        if len(profiles) >= 2000:
+            UserReferralProfile.objects.bulk_update(profiles, ['referral_path', 'referral_depth'])
+            profiles = []
+    if profiles:
+        UserReferralProfile.objects.bulk_update(profiles, ['referral_path', 'referral_depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referral', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userreferralprofile',
+            name='referral_depth',
+            field=models.PositiveIntegerField(default=0, help_text='Number of referrers above this user'),
+        ),
+        migrations.AddField(
+            model_name='userreferralprofile',
+            name='referral_path',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.UUIDField(), blank=True, default=list, help_text='User ids from the top referrer down to this user', size=None),
+        ),
+        migrations.RunPython(backfill_referral_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='userreferralprofile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['referral_path'], name='referral_profile_path_idx'),
+        ),
+    ]
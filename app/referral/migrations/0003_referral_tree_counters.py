@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-16 19:41
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+BACKFILL_INVESTED_TOTALS = """
+    UPDATE user_referral_profiles AS p
+    SET total_invested_inr = v.inr,
+        total_invested_usdt = v.usdt
+    FROM (
+        SELECT user_id,
+               COALESCE(SUM(amount) FILTER (WHERE UPPER(currency) <> 'USDT'), 0) AS inr,
+               COALESCE(SUM(amount) FILTER (WHERE UPPER(currency) = 'USDT'), 0) AS usdt
+        FROM investment
+        GROUP BY user_id
+    ) AS v
+    WHERE p.user_id = v.user_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referral', '0002_referral_path'),
+        ('investment', '0005_active_due_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userreferralprofile',
+            name='total_invested_inr',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Total amount this user has invested in INR', max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='userreferralprofile',
+            name='total_invested_usdt',
+            field=models.DecimalField(decimal_places=6, default=Decimal('0.000000'), help_text='Total amount this user has invested in USDT', max_digits=20),
+        ),
+        migrations.RunSQL(BACKFILL_INVESTED_TOTALS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='userreferralprofile',
+            index=models.Index(fields=['referred_by', 'created_at', 'id'], name='referral_profile_children_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-16 20:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referral', '0003_referral_tree_counters'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE SEQUENCE IF NOT EXISTS referral_code_seq START WITH 1",
+            "DROP SEQUENCE IF EXISTS referral_code_seq",
+        ),
+    ]
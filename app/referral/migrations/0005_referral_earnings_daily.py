@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-16 19:52
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('referral', '0004_referral_code_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralEarningDaily',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('level', models.PositiveIntegerField(help_text='Referral level of the earnings')),
+                ('currency', models.CharField(choices=[('INR', 'Indian Rupee'), ('USDT', 'Tether')], max_length=4)),
+                ('day', models.DateField(help_text='Day the earnings were credited')),
+                ('earning_count', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=6, default=Decimal('0.000000'), max_digits=20)),
+                ('user', models.ForeignKey(help_text='User who earned the referral bonuses', on_delete=django.db.models.deletion.CASCADE, related_name='referral_earnings_daily', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Referral Earning Daily Rollup',
+                'verbose_name_plural': 'Referral Earning Daily Rollups',
+                'db_table': 'referral_earnings_daily',
+                'indexes': [models.Index(fields=['day', 'currency'], name='referral_ea_day_4e9003_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='referralearningdaily',
+            constraint=models.UniqueConstraint(fields=('user', 'level', 'currency', 'day'), name='referral_earnings_daily_unique'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-16 21:16
+
+from decimal import Decimal
+from django.db import migrations, models
+
+# Every profile adds itself and its invested totals to each user id on its
+# path above it
+BACKFILL_DOWNLINE_TOTALS = """
+    UPDATE user_referral_profiles AS p
+    SET downline_count = v.downline_count,
+        downline_invested_inr = v.inr,
+        downline_invested_usdt = v.usdt
+    FROM (
+        SELECT a.ancestor_id AS user_id,
+               COUNT(*) AS downline_count,
+               SUM(d.total_invested_inr) AS inr,
+               SUM(d.total_invested_usdt) AS usdt
+        FROM user_referral_profiles AS d
+        CROSS JOIN LATERAL unnest(d.referral_path) AS a(ancestor_id)
+        WHERE a.ancestor_id <> d.user_id
+        GROUP BY a.ancestor_id
+    ) AS v
+    WHERE p.user_id = v.user_id
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referral', '0005_referral_earnings_daily'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userreferralprofile',
+            name='downline_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of users below this user, at any depth'),
+        ),
+        migrations.AddField(
+            model_name='userreferralprofile',
+            name='downline_invested_inr',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Total amount the users below this user have invested in INR', max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='userreferralprofile',
+            name='downline_invested_usdt',
+            field=models.DecimalField(decimal_places=6, default=Decimal('0.000000'), help_text='Total amount the users below this user have invested in USDT', max_digits=20),
+        ),
+        migrations.RunSQL(BACKFILL_DOWNLINE_TOTALS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referral', '0006_referral_downline_totals'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='referralearning',
+            constraint=models.UniqueConstraint(fields=('referral', 'investment'), name='referral_earnings_investment_unique'),
+        ),
+    ]
@@ -1,11 +1,17 @@
-from django.db import models
+from django.db import models, connection, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from decimal import Decimal
+from collections import Counter, defaultdict
 import uuid
 
+from . import codes as referral_codes
+from .cache import get_or_load, ACTIVE_CONFIG_KEY, ACTIVE_MILESTONES_KEY
+
 User = get_user_model()
 
 
@@ -60,8 +66,8 @@ class ReferralConfig(TimeStampedModel):
     
     @classmethod
     def get_active_config(cls):
-        """Get the active referral configuration."""
-        return cls.objects.filter(is_active=True).first()
+        """Get the active referral configuration (cached, see app.referral.cache)."""
+        return get_or_load(ACTIVE_CONFIG_KEY, lambda: cls.objects.filter(is_active=True).first())
     
     def get_percentage_for_level(self, level):
         """Get referral percentage for a specific level."""
@@ -189,75 +195,50 @@ class ReferralEarning(TimeStampedModel):
             models.Index(fields=['level', 'created_at']),
             models.Index(fields=['currency', 'created_at']),
         ]
+        constraints = [
+            # One earning per referral per investment, so a bonus is never paid twice
+            models.UniqueConstraint(
+                fields=['referral', 'investment'],
+                name='referral_earnings_investment_unique'
+            ),
+        ]
+    
+    # Whether this earning is already included in the referrer's profile totals
+    _counted_in_stats = False
     
     def __str__(self):
         return f"{self.referral.user.email} - {self.amount} {self.currency} (Level {self.level})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counted_in_stats = instance.__dict__.get('status') == 'credited'
+        return instance
+    
     def credit_to_wallet(self):
         """Credit the referral bonus to the user's wallet."""
         if self.status != 'pending':
             return False
         
         try:
+            from app.wallet.services import WalletLedgerService
             user = self.referral.user
+            wallet_model = WalletLedgerService.get_wallet_model(self.currency)
+            wallet_model.objects.get_or_create(user=user)
             
-            if self.currency == 'INR':
-                # Credit to INR wallet
-                from app.wallet.models import INRWallet
-                wallet, created = INRWallet.objects.get_or_create(
-                    user=user,
-                    defaults={'balance': Decimal('0.00'), 'status': 'active', 'is_active': True}
-                )
-                
-                if wallet.add_balance(self.amount):
-                    # Create transaction log
-                    from app.wallet.models import WalletTransaction
-                    WalletTransaction.objects.create(
-                        user=user,
-                        transaction_type='referral_bonus',
-                        wallet_type='inr',
-                        amount=self.amount,
-                        balance_before=wallet.balance - self.amount,
-                        balance_after=wallet.balance,
-                        status='completed',
-                        reference_id=str(self.investment.id),
-                        description=f"Referral bonus from {self.referral.referred_user.email} (Level {self.level})"
-                    )
-                    
-                    self.status = 'credited'
-                    self.credited_at = timezone.now()
-                    self.save(update_fields=['status', 'credited_at'])
-                    return True
-                    
-            elif self.currency == 'USDT':
-                # Credit to USDT wallet
-                from app.wallet.models import USDTWallet
-                wallet, created = USDTWallet.objects.get_or_create(
-                    user=user,
-                    defaults={'balance': Decimal('0.000000'), 'status': 'active', 'is_active': True}
-                )
-                
-                if wallet.add_balance(self.amount):
-                    # Create transaction log
-                    from app.wallet.models import WalletTransaction
-                    WalletTransaction.objects.create(
-                        user=user,
-                        transaction_type='referral_bonus',
-                        wallet_type='usdt',
-                        amount=self.amount,
-                        balance_before=wallet.balance - self.amount,
-                        balance_after=wallet.balance,
-                        status='completed',
-                        reference_id=str(self.investment.id),
-                        description=f"Referral bonus from {self.referral.referred_user.email} (Level {self.level})"
-                    )
-                    
-                    self.status = 'credited'
-                    self.credited_at = timezone.now()
-                    self.save(update_fields=['status', 'credited_at'])
-                    return True
+            WalletLedgerService.credit(
+                user,
+                self.currency,
+                self.amount,
+                'referral_bonus',
+                reference_id=str(self.investment.id),
+                description=f"Referral bonus from {self.referral.referred_user.email} (Level {self.level})"
+            )
             
-            return False
+            self.status = 'credited'
+            self.credited_at = timezone.now()
+            self.save(update_fields=['status', 'credited_at'])
+            return True
             
         except Exception as e:
             self.status = 'failed'
@@ -317,6 +298,11 @@ class ReferralMilestone(TimeStampedModel):
     
     def __str__(self):
         return f"{self.name} - {self.condition_value} {self.condition_type} → {self.bonus_amount} {self.currency}"
+    
+    @classmethod
+    def get_active_milestones(cls):
+        """Get the active milestones (cached, see app.referral.cache)."""
+        return get_or_load(ACTIVE_MILESTONES_KEY, lambda: list(cls.objects.filter(is_active=True)))
 
 
 class UserReferralProfile(TimeStampedModel):
@@ -364,6 +350,55 @@ class UserReferralProfile(TimeStampedModel):
         help_text="Total referral earnings in USDT"
     )
     last_earning_date = models.DateTimeField(null=True, blank=True)
+    total_invested_inr = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        help_text="Total amount this user has invested in INR"
+    )
+    total_invested_usdt = models.DecimalField(
+        max_digits=20,
+        decimal_places=6,
+        default=Decimal('0.000000'),
+        help_text="Total amount this user has invested in USDT"
+    )
+    downline_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of users below this user, at any depth"
+    )
+    downline_invested_inr = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        help_text="Total amount the users below this user have invested in INR"
+    )
+    downline_invested_usdt = models.DecimalField(
+        max_digits=20,
+        decimal_places=6,
+        default=Decimal('0.000000'),
+        help_text="Total amount the users below this user have invested in USDT"
+    )
+    
+    # Materialized path of the referral hierarchy: [<root user id>, ..., <user id>].
+    # Ancestors are read from the path itself and a whole downline is one
+    # GIN-indexed containment query, however deep the chain is.
+    referral_path = ArrayField(
+        models.UUIDField(),
+        blank=True,
+        default=list,
+        help_text="User ids from the top referrer down to this user"
+    )
+    referral_depth = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of referrers above this user"
+    )
+    
+    STATS_FIELDS = [
+        'total_referrals', 'total_earnings', 'total_earnings_inr',
+        'total_earnings_usdt', 'last_earning_date',
+        'total_invested_inr', 'total_invested_usdt',
+        'downline_count', 'downline_invested_inr', 'downline_invested_usdt',
+    ]
     
     class Meta:
         db_table = 'user_referral_profiles'
@@ -373,25 +408,271 @@ class UserReferralProfile(TimeStampedModel):
             models.Index(fields=['referral_code']),
             models.Index(fields=['referred_by']),
             models.Index(fields=['total_referrals']),
+            GinIndex(fields=['referral_path'], name='referral_profile_path_idx'),
+            # Keyset pagination over the direct referrals of a user
+            models.Index(
+                fields=['referred_by', 'created_at', 'id'],
+                name='referral_profile_children_idx'
+            ),
         ]
     
     def __str__(self):
         return f"Referral Profile - {self.user.email} (Code: {self.referral_code})"
     
+    def save(self, *args, **kwargs):
+        """Place a new profile in the referral hierarchy below its referrer, if any."""
+        placed = False
+        if not self.referral_path:
+            parent = None
+            if self.referred_by_id:
+                parent = UserReferralProfile.objects.filter(user_id=self.referred_by_id).only(
+                    'referral_path', 'referral_depth'
+                ).first()
+            self.referral_path = self.build_referral_path(
+                self.user_id, parent.referral_path if parent else None
+            )
+            self.referral_depth = parent.referral_depth + 1 if parent else 0
+            placed = parent is not None
+        super().save(*args, **kwargs)
+        if placed:
+            UserReferralProfile.record_downline([self])
+    
+    @classmethod
+    def build_referral_path(cls, user_id, parent_path=None):
+        """Build the referral path of a user below a parent path."""
+        return list(parent_path or []) + [uuid.UUID(str(user_id))]
+    
+    def get_ancestor_ids(self, max_levels=None):
+        """Get the user ids of the referrers above this user, nearest first."""
+        ancestor_ids = list(reversed(self.referral_path[:-1]))
+        return ancestor_ids[:max_levels] if max_levels else ancestor_ids
+    
+    def get_descendants(self, max_depth=None):
+        """Get the profiles below this user, optionally limited to max_depth levels."""
+        descendants = UserReferralProfile.objects.filter(
+            referral_path__contains=[self.user_id],
+            referral_depth__gt=self.referral_depth
+        )
+        if max_depth:
+            descendants = descendants.filter(referral_depth__lte=self.referral_depth + max_depth)
+        return descendants
+    
+    def set_referrer(self, referrer_profile):
+        """
+        Attach this user below a referrer.
+        
+        Only a user without a referrer or downline can be attached: the
+        Referral rows and counters of a moved downline would still point at
+        the old upline.
+        
+        Raises:
+            ValueError: If the referrer is this user, or this user already has
+                another referrer or a downline of its own
+        """
+        if referrer_profile.user_id == self.user_id:
+            raise ValueError("A user cannot be referred by themselves")
+        if self.referred_by_id == referrer_profile.user_id:
+            return
+        if self.referred_by_id is not None:
+            raise ValueError("This user already has a referrer")
+        if UserReferralProfile.objects.filter(referred_by_id=self.user_id).exists():
+            raise ValueError("A user with a downline cannot be moved below another referrer")
+        
+        self.referred_by = referrer_profile.user
+        self.referral_path = self.build_referral_path(self.user_id, referrer_profile.referral_path)
+        self.referral_depth = referrer_profile.referral_depth + 1
+        # Leave the counters alone: they are maintained with F() increments
+        self.save(update_fields=['referred_by', 'referral_path', 'referral_depth', 'updated_at'])
+        UserReferralProfile.record_downline([self])
+    
     def generate_referral_code(self):
         """Generate a unique referral code for the user."""
-        import random
-        import string
+        self.referral_code = UserReferralProfile.allocate_referral_codes(1)[0]
+    
+    @classmethod
+    def allocate_referral_codes(cls, count):
+        """
+        Allocate unique referral codes in bulk (see app.referral.codes).
+        
+        Sequence-derived codes never collide with each other; the batch is
+        checked once against codes issued before the allocator existed.
+        
+        Args:
+            count: Number of codes to allocate
+            
+        Returns:
+            list: count unique referral codes
+        """
+        codes = []
+        while len(codes) < count:
+            candidates = referral_codes.next_codes(count - len(codes))
+            taken = set(cls.objects.filter(referral_code__in=candidates).values_list('referral_code', flat=True))
+            codes.extend(code for code in candidates if code not in taken)
+        return codes
+    
+    @classmethod
+    def create_profiles(cls, users, batch_size=1000):
+        """
+        Create top-level referral profiles for many users at once.
+        
+        Args:
+            users: Users without a referral profile
+            batch_size: Number of profiles per INSERT
+            
+        Returns:
+            list: The created profiles
+        """
+        users = list(users)
+        codes = cls.allocate_referral_codes(len(users))
+        profiles = [
+            cls(
+                user=user,
+                referral_code=code,
+                referral_path=cls.build_referral_path(user.id),
+                referral_depth=0
+            )
+            for user, code in zip(users, codes)
+        ]
+        return cls.objects.bulk_create(profiles, batch_size=batch_size)
+    
+    @classmethod
+    def record_referrals(cls, user_ids):
+        """
+        Add new referrals to the referrers' totals with atomic F() increments.
+        
+        Args:
+            user_ids: Referrer user id per new referral (repeats count twice)
+        """
+        by_count = defaultdict(list)
+        for user_id, count in Counter(user_ids).items():
+            by_count[count].append(user_id)
+        for count, ids in by_count.items():
+            cls.objects.filter(user_id__in=ids).update(
+                total_referrals=models.F('total_referrals') + count
+            )
+    
+    @classmethod
+    def record_earnings(cls, earnings, reverse=False):
+        """
+        Add credited earnings to (or, with reverse, take them off) the
+        referrers' totals in a single UPDATE ... FROM (VALUES ...).
+        
+        Args:
+            earnings: ReferralEarning instances with their referral loaded
+            reverse: Subtract the earnings, e.g. when a credit is cancelled
+        """
+        sign = -1 if reverse else 1
+        deltas = {}
+        for earning in earnings:
+            inr, usdt, last_at = deltas.get(earning.referral.user_id, (Decimal('0'), Decimal('0'), None))
+            if earning.currency == 'INR':
+                inr += sign * earning.amount
+            else:
+                usdt += sign * earning.amount
+            if not reverse and earning.credited_at and (last_at is None or earning.credited_at > last_at):
+                last_at = earning.credited_at
+            deltas[earning.referral.user_id] = (inr, usdt, last_at)
+            earning._counted_in_stats = not reverse
+        if not deltas:
+            return
+        
+        rows = [(str(user_id), inr, usdt, last_at) for user_id, (inr, usdt, last_at) in deltas.items()]
+        placeholders = ', '.join(['(%s::uuid, %s::numeric, %s::numeric, %s::timestamptz)'] * len(rows))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {cls._meta.db_table} AS p
+                SET total_earnings_inr = p.total_earnings_inr + v.inr,
+                    total_earnings_usdt = p.total_earnings_usdt + v.usdt,
+                    total_earnings = p.total_earnings + v.inr + v.usdt,
+                    last_earning_date = GREATEST(p.last_earning_date, v.last_at),
+                    updated_at = NOW()
+                FROM (VALUES {placeholders}) AS v(user_id, inr, usdt, last_at)
+                WHERE p.user_id = v.user_id
+                """,
+                [value for row in rows for value in row]
+            )
+    
+    @classmethod
+    def record_downline(cls, profiles):
+        """
+        Add newly placed users, and whatever they have invested so far, to the
+        downline totals of every user above them.
+        
+        Args:
+            profiles: Profiles just placed below a referrer, with their referral_path
+        """
+        rows = defaultdict(lambda: [Decimal('0'), Decimal('0'), 0, Decimal('0'), Decimal('0')])
+        for profile in profiles:
+            for ancestor_id in profile.referral_path[:-1]:
+                row = rows[ancestor_id]
+                row[2] += 1
+                row[3] += profile.total_invested_inr
+                row[4] += profile.total_invested_usdt
+        cls._add_totals(rows)
+    
+    @classmethod
+    def record_investments(cls, investments):
+        """
+        Add new investments to their investors' invested totals and to the
+        downline totals of everyone above them, in a single
+        UPDATE ... FROM (VALUES ...). The ancestors are read from the
+        investors' referral paths with one more query.
+        
+        Args:
+            investments: Investment instances (or objects with user_id, amount, currency)
+        """
+        deltas = {}
+        for investment in investments:
+            inr, usdt = deltas.get(investment.user_id, (Decimal('0'), Decimal('0')))
+            if investment.currency.upper() == 'USDT':
+                usdt += investment.amount
+            else:
+                inr += investment.amount
+            deltas[investment.user_id] = (inr, usdt)
+        if not deltas:
+            return
         
-        # Generate 8-character alphanumeric code
-        while True:
-            code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-            if not UserReferralProfile.objects.filter(referral_code=code).exists():
-                self.referral_code = code
-                break
+        rows = defaultdict(lambda: [Decimal('0'), Decimal('0'), 0, Decimal('0'), Decimal('0')])
+        paths = dict(cls.objects.filter(user_id__in=deltas).values_list('user_id', 'referral_path'))
+        for user_id, (inr, usdt) in deltas.items():
+            rows[user_id][0] += inr
+            rows[user_id][1] += usdt
+            for ancestor_id in (paths.get(user_id) or [])[:-1]:
+                rows[ancestor_id][3] += inr
+                rows[ancestor_id][4] += usdt
+        cls._add_totals(rows)
+    
+    @classmethod
+    def _add_totals(cls, rows):
+        """
+        Add (invested_inr, invested_usdt, downline_count, downline_invested_inr,
+        downline_invested_usdt) increments per user id in a single statement.
+        """
+        if not rows:
+            return
+        values = [(str(user_id), *row) for user_id, row in rows.items()]
+        placeholders = ', '.join(
+            ['(%s::uuid, %s::numeric, %s::numeric, %s::integer, %s::numeric, %s::numeric)'] * len(values)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {cls._meta.db_table} AS p
+                SET total_invested_inr = p.total_invested_inr + v.inr,
+                    total_invested_usdt = p.total_invested_usdt + v.usdt,
+                    downline_count = p.downline_count + v.downline_count,
+                    downline_invested_inr = p.downline_invested_inr + v.downline_inr,
+                    downline_invested_usdt = p.downline_invested_usdt + v.downline_usdt,
+                    updated_at = NOW()
+                FROM (VALUES {placeholders}) AS v(user_id, inr, usdt, downline_count, downline_inr, downline_usdt)
+                WHERE p.user_id = v.user_id
+                """,
+                [value for row in values for value in row]
+            )
     
     def update_stats(self):
-        """Update referral statistics."""
+        """Recount referral statistics from scratch (see ReferralService.reconcile_referral_stats)."""
         # Count total referrals
         self.total_referrals = Referral.objects.filter(user=self.user).count()
         
@@ -416,7 +697,145 @@ class UserReferralProfile(TimeStampedModel):
         if last_earning:
             self.last_earning_date = last_earning.credited_at
         
-        self.save()
-
+        # Calculate invested totals
+        invested = defaultdict(Decimal)
+        for row in self.user.investments.values('currency').annotate(total=models.Sum('amount')):
+            invested[row['currency'].upper()] += row['total']
+        self.total_invested_inr = invested.get('INR') or Decimal('0.00')
+        self.total_invested_usdt = invested.get('USDT') or Decimal('0.000000')
+        
+        # Downline totals, from the investments of every user below
+        from app.investment.models import Investment
+        
+        downline = self.get_descendants()
+        self.downline_count = downline.count()
+        invested = defaultdict(Decimal)
+        for row in Investment.objects.filter(
+            user_id__in=downline.values('user_id')
+        ).values('currency').annotate(total=models.Sum('amount')):
+            invested['USDT' if row['currency'].upper() == 'USDT' else 'INR'] += row['total']
+        self.downline_invested_inr = invested.get('INR') or Decimal('0.00')
+        self.downline_invested_usdt = invested.get('USDT') or Decimal('0.000000')
+        
+        self.save(update_fields=self.STATS_FIELDS + ['updated_at'])
 
 
+class ReferralEarningDaily(TimeStampedModel):
+    """Daily rollup of credited referral earnings per user, level and currency."""
+    
+    CURRENCY_CHOICES = [
+        ('INR', 'Indian Rupee'),
+        ('USDT', 'Tether'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='referral_earnings_daily',
+        help_text="User who earned the referral bonuses"
+    )
+    level = models.PositiveIntegerField(help_text="Referral level of the earnings")
+    currency = models.CharField(max_length=4, choices=CURRENCY_CHOICES)
+    day = models.DateField(help_text="Day the earnings were credited")
+    earning_count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=20, decimal_places=6, default=Decimal('0.000000'))
+    
+    class Meta:
+        db_table = 'referral_earnings_daily'
+        verbose_name = 'Referral Earning Daily Rollup'
+        verbose_name_plural = 'Referral Earning Daily Rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'level', 'currency', 'day'],
+                name='referral_earnings_daily_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'currency']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} {self.day} L{self.level}: {self.amount} {self.currency} ({self.earning_count})"
+    
+    @staticmethod
+    def get_day(earning):
+        """Get the rollup day of an earning, in the project time zone."""
+        return timezone.localdate(earning.credited_at or earning.created_at or timezone.now())
+    
+    @classmethod
+    def record(cls, earnings, reverse=False):
+        """
+        Add credited earnings to (or, with reverse, take them off) the daily
+        rollup with one INSERT ... ON CONFLICT DO UPDATE.
+        
+        Args:
+            earnings: ReferralEarning instances with their referral loaded
+            reverse: Subtract the earnings, e.g. when a credit is cancelled
+        """
+        sign = -1 if reverse else 1
+        buckets = defaultdict(lambda: [0, Decimal('0')])
+        for earning in earnings:
+            bucket = buckets[(earning.referral.user_id, earning.level, earning.currency, cls.get_day(earning))]
+            bucket[0] += sign
+            bucket[1] += sign * earning.amount
+        if not buckets:
+            return
+        
+        now = timezone.now()
+        rows = [
+            (str(uuid.uuid4()), str(user_id), level, currency, day, count, amount, now, now)
+            for (user_id, level, currency, day), (count, amount) in buckets.items()
+        ]
+        placeholders = ', '.join(['(%s::uuid, %s::uuid, %s, %s, %s, %s, %s, %s, %s)'] * len(rows))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {cls._meta.db_table} AS r
+                    (id, user_id, level, currency, day, earning_count, amount, created_at, updated_at)
+                VALUES {placeholders}
+                ON CONFLICT (user_id, level, currency, day) DO UPDATE
+                SET earning_count = r.earning_count + EXCLUDED.earning_count,
+                    amount = r.amount + EXCLUDED.amount,
+                    updated_at = EXCLUDED.updated_at
+                """,
+                [value for row in rows for value in row]
+            )
+    
+    @classmethod
+    def rebuild(cls, since=None):
+        """
+        Rebuild the rollup from the credited earnings, optionally from a day on.
+        
+        Args:
+            since: First day to rebuild (everything by default)
+            
+        Returns:
+            int: Number of rollup rows written
+        """
+        day_sql = "(COALESCE(e.credited_at, e.created_at) AT TIME ZONE %s)::date"
+        params = [settings.TIME_ZONE]
+        where = "e.status = 'credited'"
+        if since:
+            where += f" AND {day_sql} >= %s"
+            params += [settings.TIME_ZONE, since]
+        
+        with transaction.atomic(), connection.cursor() as cursor:
+            if since:
+                cls.objects.filter(day__gte=since).delete()
+            else:
+                cursor.execute(f"DELETE FROM {cls._meta.db_table}")
+            cursor.execute(
+                f"""
+                INSERT INTO {cls._meta.db_table}
+                    (id, user_id, level, currency, day, earning_count, amount, created_at, updated_at)
+                SELECT gen_random_uuid(), r.user_id, e.level, e.currency, {day_sql},
+                       COUNT(*), SUM(e.amount), NOW(), NOW()
+                FROM {ReferralEarning._meta.db_table} e
+                JOIN {Referral._meta.db_table} r ON r.id = e.referral_id
+                WHERE {where}
+                GROUP BY 2, 3, 4, 5
+                """,
+                params
+            )
+            return cursor.rowcount
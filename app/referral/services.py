@@ -1,13 +1,18 @@
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import Count, Exists, Max, OuterRef, Q, Sum
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from datetime import datetime, timedelta
 from decimal import Decimal
+from collections import defaultdict
 from typing import List, Dict, Optional, Tuple
+import base64
 import logging
+import uuid
 
 from .models import (
     Referral, ReferralEarning, ReferralMilestone, 
-    UserReferralProfile, ReferralConfig
+    UserReferralProfile, ReferralConfig, ReferralEarningDaily
 )
 
 logger = logging.getLogger(__name__)
@@ -34,13 +39,9 @@ class ReferralService:
                 # Create or get user referral profile
                 profile, created = UserReferralProfile.objects.get_or_create(
                     user=user,
-                    defaults={'referral_code': None}
+                    defaults={'referral_code': lambda: UserReferralProfile.allocate_referral_codes(1)[0]}
                 )
                 
-                if created:
-                    profile.generate_referral_code()
-                    profile.save()
-                
                 # If no referrer code provided, just create the profile
                 if not referrer_code:
                     return True
@@ -60,9 +61,8 @@ class ReferralService:
                     logger.warning(f"User {user.email} attempted self-referral")
                     return True
                 
-                # Set the referred_by field on the user's profile
-                profile.referred_by = referrer
-                profile.save()
+                # Attach the user below the referrer in the referral hierarchy
+                profile.set_referrer(referrer_profile)
                 
                 # Get referral configuration
                 config = ReferralConfig.get_active_config()
@@ -72,12 +72,9 @@ class ReferralService:
                 
                 # Create referral relationships for all levels
                 ReferralService._create_multi_level_referrals(
-                    user, referrer, config.max_levels
+                    user, referrer, config.max_levels, referrer_profile
                 )
                 
-                # Update referrer's stats
-                referrer_profile.update_stats()
-                
                 return True
                 
         except Exception as e:
@@ -88,36 +85,254 @@ class ReferralService:
     def _create_multi_level_referrals(
         new_user: User, 
         direct_referrer: User, 
-        max_levels: int
+        max_levels: int,
+        referrer_profile: UserReferralProfile = None
     ) -> None:
         """
         Create multi-level referral relationships.
         
+        The referrers for every level are read from the direct referrer's
+        referral path, so the whole chain costs a constant number of queries
+        however deep the downline is.
+        
         Args:
             new_user: The newly registered user
             direct_referrer: The user who directly referred them
             max_levels: Maximum number of levels to create
+            referrer_profile: The direct referrer's profile, if already loaded
         """
-        current_referrer = direct_referrer
-        level = 1
+        referrer_profile = referrer_profile or UserReferralProfile.objects.get(user=direct_referrer)
+        chain = [direct_referrer.id] + referrer_profile.get_ancestor_ids(max_levels)
         
-        while level <= max_levels and current_referrer:
-            # Create referral relationship
-            referral, created = Referral.objects.get_or_create(
-                user=current_referrer,
+        existing = set(
+            Referral.objects.filter(referred_user=new_user).values_list('user_id', 'level')
+        )
+        referrals = [
+            Referral(
+                user_id=chain[level - 1],
                 referred_user=new_user,
                 level=level,
-                defaults={
-                    'referrer': ReferralService._get_referrer_for_user(current_referrer)
-                }
+                referrer_id=chain[level] if level < len(chain) else None
             )
+            for level in range(1, min(max_levels, len(chain)) + 1)
+            if (chain[level - 1], level) not in existing
+        ]
+        if not referrals:
+            return
+        
+        Referral.objects.bulk_create(referrals)
+        UserReferralProfile.record_referrals([referral.user_id for referral in referrals])
+        
+        logger.info(f"Created {len(referrals)} referral levels for {new_user.email} under {direct_referrer.email}")
+    
+    @staticmethod
+    def bulk_onboard_users(rows, batch_size: int = 1000) -> Dict:
+        """
+        Create many users with their referral chains in a constant number of queries.
+        
+        Each row is a dict with an email and optionally username, password,
+        first_name, last_name, phone_number, referral_code (a code to give the
+        new user, so other rows can refer to it) and referrer_code. Referrer
+        codes are resolved against existing profiles and the batch itself in
+        one query; users are placed in topological order so a referrer in the
+        same batch is always placed before the users it referred. Rows without
+        a password get an unusable one. The post_save signals do not run for
+        bulk inserts, so wallets, wallet addresses, profiles, referral rows and
+        the ancestors' referral counters are all written here.
+        
+        Args:
+            rows: Iterable of row dicts
+            batch_size: Number of objects per INSERT
             
-            if created:
-                logger.info(f"Created referral: {current_referrer.email} → {new_user.email} (Level {level})")
+        Returns:
+            Dict: created_count, referral_count and the skipped rows with reasons
+        """
+        from django.contrib.auth.hashers import make_password
+        from decouple import config as env_config
+        from app.wallet.models import INRWallet, USDTWallet, WalletAddress
+        from app.crud.wallet import WalletAddressService, WalletService
+        
+        skipped = []
+        entries = []
+        seen_emails, seen_usernames, seen_codes = set(), set(), set()
+        for line, row in enumerate(rows, start=1):
+            email = User.objects.normalize_email((row.get('email') or '').strip())
+            username = (row.get('username') or '').strip() or email
+            code = (row.get('referral_code') or '').strip() or None
+            if not email:
+                skipped.append({'line': line, 'email': email, 'reason': 'missing email'})
+            elif email in seen_emails or username in seen_usernames:
+                skipped.append({'line': line, 'email': email, 'reason': 'duplicate user in batch'})
+            elif code and code in seen_codes:
+                skipped.append({'line': line, 'email': email, 'reason': 'duplicate referral code in batch'})
+            else:
+                seen_emails.add(email)
+                seen_usernames.add(username)
+                if code:
+                    seen_codes.add(code)
+                entries.append({
+                    'line': line,
+                    'user': User(
+                        id=uuid.uuid4(),
+                        email=email,
+                        username=username,
+                        first_name=(row.get('first_name') or '').strip(),
+                        last_name=(row.get('last_name') or '').strip(),
+                        phone_number=(row.get('phone_number') or '').strip() or None,
+                        password=make_password(row.get('password') or None),
+                    ),
+                    'code': code,
+                    'referrer_code': (row.get('referrer_code') or '').strip() or None,
+                })
+        
+        # One query each for taken users and for every code the batch mentions
+        taken_emails, taken_usernames = set(), set()
+        for email, username in User.objects.filter(
+            Q(email__in=seen_emails) | Q(username__in=seen_usernames)
+        ).values_list('email', 'username'):
+            taken_emails.add(email)
+            taken_usernames.add(username)
+        referrer_codes = {entry['referrer_code'] for entry in entries if entry['referrer_code']}
+        known_codes = {
+            code: (user_id, path)
+            for code, user_id, path in UserReferralProfile.objects.filter(
+                referral_code__in=referrer_codes | seen_codes
+            ).values_list('referral_code', 'user_id', 'referral_path')
+        }
+        
+        accepted = []
+        for entry in entries:
+            user = entry['user']
+            if user.email in taken_emails or user.username in taken_usernames:
+                skipped.append({'line': entry['line'], 'email': user.email, 'reason': 'user already exists'})
+            elif entry['code'] in known_codes:
+                skipped.append({'line': entry['line'], 'email': user.email, 'reason': 'referral code already taken'})
+            else:
+                accepted.append(entry)
+        
+        # Place referrers before the users they referred (depth-first topological order)
+        by_code = {entry['code']: entry for entry in accepted if entry['code']}
+        ordered = []
+        state = {}
+        for root in accepted:
+            stack = [root]
+            while stack:
+                entry = stack[-1]
+                key = id(entry)
+                if state.get(key) == 'done':
+                    stack.pop()
+                    continue
+                parent = by_code.get(entry['referrer_code'])
+                if parent is entry:
+                    entry['referrer_code'] = parent = None
+                if state.get(key) is None and parent is not None and state.get(id(parent)) != 'done':
+                    state[key] = 'open'
+                    if state.get(id(parent)) == 'open':
+                        # Referral cycle inside the batch: break it at this user
+                        logger.warning(f"Referral cycle in batch, onboarding {entry['user'].email} without a referrer")
+                        entry['referrer_code'] = None
+                        continue
+                    stack.append(parent)
+                    continue
+                state[key] = 'done'
+                ordered.append(entry)
+                stack.pop()
+        
+        config = ReferralConfig.get_active_config()
+        if config is None:
+            logger.error("No active referral configuration found, onboarding users without referral rows")
+        max_levels = config.max_levels if config else 0
+        
+        codes = iter(UserReferralProfile.allocate_referral_codes(
+            sum(1 for entry in ordered if not entry['code'])
+        ))
+        paths = {code: path for code, (user_id, path) in known_codes.items()}
+        profiles = []
+        referrals = []
+        for entry in ordered:
+            user = entry['user']
+            entry['code'] = entry['code'] or next(codes)
+            referrer_code = entry['referrer_code']
+            parent_path = paths.get(referrer_code) if referrer_code else None
+            if referrer_code and parent_path is None:
+                logger.warning(f"Invalid referral code {referrer_code} for {user.email}")
+            
+            path = UserReferralProfile.build_referral_path(user.id, parent_path)
+            paths[entry['code']] = path
+            chain = list(reversed(path))[1:]
+            profiles.append(UserReferralProfile(
+                user=user,
+                referral_code=entry['code'],
+                referred_by_id=chain[0] if chain else None,
+                referral_path=path,
+                referral_depth=len(chain)
+            ))
+            chain = chain[:max_levels]
+            referrals.extend(
+                Referral(
+                    user_id=chain[level - 1],
+                    referred_user=user,
+                    level=level,
+                    referrer_id=chain[level] if level < len(chain) else None
+                )
+                for level in range(1, len(chain) + 1)
+            )
+        
+        users = [entry['user'] for entry in ordered]
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=batch_size)
+            INRWallet.objects.bulk_create([INRWallet(user=user) for user in users], batch_size=batch_size)
+            USDTWallet.objects.bulk_create([USDTWallet(user=user) for user in users], batch_size=batch_size)
+            WalletAddress.objects.bulk_create([
+                WalletAddress(
+                    user=user,
+                    chain_type='erc20',
+                    address=WalletAddressService.generate_address(user, 'erc20')
+                )
+                for user in users
+            ], batch_size=batch_size)
+            UserReferralProfile.objects.bulk_create(profiles, batch_size=batch_size)
+            Referral.objects.bulk_create(referrals, batch_size=batch_size)
+            # Ancestor totals are bumped once for the whole batch
+            UserReferralProfile.record_referrals([referral.user_id for referral in referrals])
+            UserReferralProfile.record_downline(profiles)
+        
+        if env_config('USE_DUMMY_WALLETS', default='True').lower() == 'false':
+            # Real wallets are generated one user at a time, as on signup
+            for user in users:
+                WalletService.get_or_create_usdt_wallet(user)
+        
+        if referrals:
+            ReferralService._schedule_milestone_checks()
+        
+        logger.info(
+            f"Onboarded {len(users)} users with {len(referrals)} referral rows, skipped {len(skipped)} rows"
+        )
+        return {
+            'created_count': len(users),
+            'referral_count': len(referrals),
+            'skipped': sorted(skipped, key=lambda row: row['line']),
+        }
+    
+    @staticmethod
+    def get_ancestors(user: User, max_levels: int = None) -> List[User]:
+        """
+        Get the referrers above a user, nearest first.
+        
+        Args:
+            user: The user to get referrers for
+            max_levels: Maximum number of levels to return
             
-            # Move up the chain for next level
-            current_referrer = ReferralService._get_referrer_for_user(current_referrer)
-            level += 1
+        Returns:
+            List[User]: Direct referrer first, then their referrer, and so on
+        """
+        profile = UserReferralProfile.objects.filter(user=user).only('referral_path').first()
+        if profile is None:
+            return []
+        
+        ancestor_ids = profile.get_ancestor_ids(max_levels)
+        users = User.objects.in_bulk(ancestor_ids)
+        return [users[ancestor_id] for ancestor_id in ancestor_ids if ancestor_id in users]
     
     @staticmethod
     def _get_referrer_for_user(user: User) -> Optional[User]:
@@ -151,104 +366,287 @@ class ReferralService:
             bool: True if all bonuses were processed successfully
         """
         try:
-            with transaction.atomic():
-                # Get referral configuration
-                config = ReferralConfig.get_active_config()
-                if not config:
-                    logger.error("No active referral configuration found")
-                    return False
-                
-                # Get the user who made the investment
-                investor = investment.user
-                
-                # Find all referral relationships for this user
-                referrals = Referral.objects.filter(
-                    referred_user=investor,
-                    level__lte=config.max_levels
-                ).select_related('user')
-                
-                if not referrals:
-                    logger.info(f"No referrals found for investor {investor.email}")
-                    return True
-                
-                # Process referral bonuses for each level
-                success_count = 0
-                for referral in referrals:
-                    if ReferralService._process_single_referral_bonus(
-                        referral, investment, config
-                    ):
-                        success_count += 1
-                
-                logger.info(f"Processed {success_count}/{len(referrals)} referral bonuses for investment {investment.id}")
-                return success_count == len(referrals)
-                
+            # Get referral configuration
+            config = ReferralConfig.get_active_config()
+            if not config:
+                logger.error("No active referral configuration found")
+                return False
+            
+            earnings = ReferralService.distribute_referral_bonuses([investment], config)
+            logger.info(f"Processed {len(earnings)} referral bonuses for investment {investment.id}")
+            return True
+            
         except Exception as e:
             logger.error(f"Error processing referral bonus for investment {investment.id}: {str(e)}")
             return False
     
     @staticmethod
-    def _process_single_referral_bonus(
-        referral: Referral, 
-        investment, 
-        config: ReferralConfig
-    ) -> bool:
+    def distribute_referral_bonuses(investments, config: ReferralConfig = None) -> List[ReferralEarning]:
         """
-        Process referral bonus for a single referral relationship.
+        Pay every referral level for a batch of investments at once.
+        
+        Level payouts are computed in memory from the referral config, the
+        earnings are bulk-created and the wallets are credited with one
+        statement per currency. An earning is unique per referral and
+        investment and is inserted with ON CONFLICT DO NOTHING; only the rows
+        this call inserted are credited, so a replayed or concurrent batch
+        pays nothing twice. Referrer totals are incremented in the same
+        transaction; milestones are evaluated by a debounced task after
+        commit.
         
         Args:
-            referral: The referral relationship
-            investment: The investment that triggered the bonus
-            config: The referral configuration
+            investments: Investments that triggered the bonuses
+            config: Referral configuration (defaults to the active one)
             
         Returns:
-            bool: True if bonus was processed successfully
+            List[ReferralEarning]: The earnings that were credited
         """
+        from app.wallet.services import WalletLedgerService
+        from app.investment.roi import CURRENCY_QUANTUM
+        
+        investments = list(investments)
+        config = config or ReferralConfig.get_active_config()
+        if not investments or not config:
+            return []
+        
+        with transaction.atomic():
+            referrals_by_investor = defaultdict(list)
+            referrals = Referral.objects.filter(
+                referred_user_id__in={investment.user_id for investment in investments},
+                level__lte=config.max_levels
+            ).select_related('referred_user')
+            for referral in referrals:
+                referrals_by_investor[referral.referred_user_id].append(referral)
+            
+            if not referrals_by_investor:
+                return []
+            
+            already_paid = set(
+                ReferralEarning.objects.filter(
+                    investment_id__in=[investment.id for investment in investments],
+                    referral__in=[r for group in referrals_by_investor.values() for r in group]
+                ).values_list('investment_id', 'referral_id')
+            )
+            
+            now = timezone.now()
+            earnings = []
+            for investment in investments:
+                currency = 'USDT' if investment.currency.upper() == 'USDT' else 'INR'
+                quantum = CURRENCY_QUANTUM[currency.lower()]
+                for referral in referrals_by_investor.get(investment.user_id, []):
+                    if (investment.id, referral.id) in already_paid:
+                        continue
+                    percentage = config.get_percentage_for_level(referral.level)
+                    if percentage <= 0:
+                        continue
+                    bonus_amount = (investment.amount * percentage / Decimal('100.00')).quantize(quantum)
+                    if bonus_amount <= 0:
+                        continue
+                    earnings.append(ReferralEarning(
+                        referral=referral,
+                        investment=investment,
+                        level=referral.level,
+                        amount=bonus_amount,
+                        currency=currency,
+                        percentage_used=percentage,
+                        status='credited',
+                        credited_at=now
+                    ))
+            
+            if not earnings:
+                return []
+            
+            # A concurrent batch may have inserted some of these earnings
+            # since the check above; the conflicting rows are skipped and
+            # only the ones inserted here are paid
+            ReferralEarning.objects.bulk_create(earnings, ignore_conflicts=True)
+            inserted_ids = set(
+                ReferralEarning.objects.filter(
+                    id__in=[earning.id for earning in earnings]
+                ).values_list('id', flat=True)
+            )
+            earnings = [earning for earning in earnings if earning.id in inserted_ids]
+            if not earnings:
+                return []
+            
+            # Referrers without a wallet get one, as credit_to_wallet did
+            for currency in ('INR', 'USDT'):
+                wallet_model = WalletLedgerService.get_wallet_model(currency)
+                user_ids = {earning.referral.user_id for earning in earnings if earning.currency == currency}
+                if user_ids:
+                    wallet_model.objects.bulk_create(
+                        [wallet_model(user_id=user_id) for user_id in user_ids],
+                        ignore_conflicts=True
+                    )
+            
+            UserReferralProfile.record_earnings(earnings)
+            ReferralEarningDaily.record(earnings)
+            WalletLedgerService.credit_many([
+                (
+                    earning.referral.user_id,
+                    earning.currency,
+                    earning.amount,
+                    'referral_bonus',
+                    str(earning.investment.id),
+                    f"Referral bonus from {earning.referral.referred_user.email} (Level {earning.level})"
+                )
+                for earning in earnings
+            ])
+            
+            transaction.on_commit(ReferralService._schedule_milestone_checks)
+        
+        logger.info(f"Credited {len(earnings)} referral bonuses for {len(investments)} investments")
+        return earnings
+    
+    @staticmethod
+    def _schedule_milestone_checks() -> None:
+        """
+        Queue a debounced milestone evaluation after referral bonuses are paid.
+        
+        At most one evaluation is queued per REFERRAL_MILESTONE_CHECK_DELAY
+        window, however many bonus batches commit in it.
+        """
+        from django.conf import settings
+        from django.core.cache import cache
+        from .cache import MILESTONE_CHECK_PENDING_KEY
+        from .tasks import evaluate_referral_milestones
+        
+        delay = getattr(settings, 'REFERRAL_MILESTONE_CHECK_DELAY', 60)
+        if not cache.add(MILESTONE_CHECK_PENDING_KEY, True, delay * 2):
+            return
+        
         try:
-            # Get percentage for this level
-            percentage = config.get_percentage_for_level(referral.level)
-            if percentage <= 0:
-                return True
+            evaluate_referral_milestones.apply_async(countdown=delay)
+        except Exception as e:
+            cache.delete(MILESTONE_CHECK_PENDING_KEY)
+            logger.error(f"Could not queue milestone evaluation, leaving it to the periodic run: {str(e)}")
+    
+    @staticmethod
+    def reconcile_referral_stats(batch_size: int = 1000, fix: bool = True) -> Dict:
+        """
+        Rebuild the incrementally maintained profile totals in bulk and report drift.
+        
+        Profiles are walked in user_id order, batch_size at a time; each batch
+        costs one referral count, one earnings aggregate, one investments
+        aggregate, one downline aggregate and, when fix is set, one bulk
+        update of the drifted profiles.
+        
+        Args:
+            batch_size: Number of profiles per batch
+            fix: Write the recomputed totals back to drifted profiles
             
-            # Calculate bonus amount
-            investment_amount = investment.amount
-            bonus_amount = (investment_amount * percentage) / Decimal('100.00')
-            
-            # Determine currency
-            currency = 'USDT' if investment.currency == 'USDT' else 'INR'
-            
-            # Create referral earning record
-            earning = ReferralEarning.objects.create(
-                referral=referral,
-                investment=investment,
-                level=referral.level,
-                amount=bonus_amount,
-                currency=currency,
-                percentage_used=percentage,
-                status='pending'
+        Returns:
+            Dict: checked_count, drift_count and a sample of drifted profiles
+        """
+        from app.investment.models import Investment
+        
+        checked_count = 0
+        drifted = []
+        last_user_id = None
+        
+        while True:
+            profiles = UserReferralProfile.objects.order_by('user_id')
+            if last_user_id is not None:
+                profiles = profiles.filter(user_id__gt=last_user_id)
+            profiles = list(profiles.only('id', 'user_id', *UserReferralProfile.STATS_FIELDS)[:batch_size])
+            if not profiles:
+                break
+            last_user_id = profiles[-1].user_id
+            checked_count += len(profiles)
+            user_ids = [profile.user_id for profile in profiles]
+            
+            referral_counts = dict(
+                Referral.objects.filter(user_id__in=user_ids).values('user_id').annotate(
+                    count=Count('id')
+                ).values_list('user_id', 'count')
+            )
+            earnings = defaultdict(dict)
+            last_earning_dates = {}
+            rows = ReferralEarning.objects.filter(
+                referral__user_id__in=user_ids, status='credited'
+            ).values('referral__user_id', 'currency').annotate(
+                total=Sum('amount'), last_at=Max('credited_at')
             )
+            for row in rows:
+                user_id = row['referral__user_id']
+                earnings[user_id][row['currency']] = row['total']
+                if row['last_at'] and (last_earning_dates.get(user_id) is None or row['last_at'] > last_earning_dates[user_id]):
+                    last_earning_dates[user_id] = row['last_at']
             
-            # Credit bonus to wallet
-            if earning.credit_to_wallet():
-                logger.info(f"Credited {bonus_amount} {currency} referral bonus to {referral.user.email}")
-                
-                # Update user's referral stats
-                try:
-                    profile = referral.user.referral_profile
-                    profile.update_stats()
-                except UserReferralProfile.DoesNotExist:
-                    pass
-                
-                # Check for milestones
-                ReferralService.check_milestones(referral.user)
-                
-                return True
-            else:
-                logger.error(f"Failed to credit referral bonus for {referral.user.email}")
-                return False
+            invested = defaultdict(lambda: defaultdict(Decimal))
+            rows = Investment.objects.filter(user_id__in=user_ids).values('user_id', 'currency').annotate(
+                total=Sum('amount')
+            )
+            for row in rows:
+                invested[row['user_id']]['USDT' if row['currency'].upper() == 'USDT' else 'INR'] += row['total']
+            
+            # Every profile whose path holds a batch user is in its downline
+            batch_ids = [str(user_id) for user_id in user_ids]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    SELECT a.ancestor_id, COUNT(*), COALESCE(SUM(i.inr), 0), COALESCE(SUM(i.usdt), 0)
+                    FROM {UserReferralProfile._meta.db_table} AS d
+                    CROSS JOIN LATERAL unnest(d.referral_path) AS a(ancestor_id)
+                    LEFT JOIN LATERAL (
+                        SELECT SUM(amount) FILTER (WHERE UPPER(currency) <> 'USDT') AS inr,
+                               SUM(amount) FILTER (WHERE UPPER(currency) = 'USDT') AS usdt
+                        FROM {Investment._meta.db_table}
+                        WHERE user_id = d.user_id
+                    ) AS i ON TRUE
+                    WHERE d.referral_path && %s::uuid[]
+                      AND a.ancestor_id = ANY(%s::uuid[])
+                      AND a.ancestor_id <> d.user_id
+                    GROUP BY a.ancestor_id
+                    """,
+                    [batch_ids, batch_ids]
+                )
+                downline = {row[0]: row[1:] for row in cursor.fetchall()}
+            
+            batch_drifted = []
+            for profile in profiles:
+                expected = {
+                    'total_referrals': referral_counts.get(profile.user_id, 0),
+                    'total_earnings_inr': earnings[profile.user_id].get('INR') or Decimal('0.00'),
+                    'total_earnings_usdt': earnings[profile.user_id].get('USDT') or Decimal('0.000000'),
+                    'last_earning_date': last_earning_dates.get(profile.user_id, profile.last_earning_date),
+                }
+                expected['total_earnings'] = expected['total_earnings_inr'] + expected['total_earnings_usdt']
+                expected['total_invested_inr'] = invested[profile.user_id]['INR']
+                expected['total_invested_usdt'] = invested[profile.user_id]['USDT']
+                count, downline_inr, downline_usdt = downline.get(profile.user_id, (0, Decimal('0'), Decimal('0')))
+                expected['downline_count'] = count
+                expected['downline_invested_inr'] = downline_inr
+                expected['downline_invested_usdt'] = downline_usdt
                 
-        except Exception as e:
-            logger.error(f"Error processing referral bonus: {str(e)}")
-            return False
+                drift = {
+                    field: (getattr(profile, field), value)
+                    for field, value in expected.items()
+                    if getattr(profile, field) != value
+                }
+                if drift:
+                    drifted.append({'user_id': str(profile.user_id), 'drift': drift})
+                    for field, value in expected.items():
+                        setattr(profile, field, value)
+                    batch_drifted.append(profile)
+            
+            if fix and batch_drifted:
+                UserReferralProfile.objects.bulk_update(batch_drifted, UserReferralProfile.STATS_FIELDS)
+        
+        if drifted:
+            logger.warning(
+                f"Referral stats drift on {len(drifted)}/{checked_count} profiles"
+                f"{' (fixed)' if fix else ''}: {drifted[:10]}"
+            )
+        else:
+            logger.info(f"Referral stats reconciled for {checked_count} profiles, no drift")
+        
+        return {
+            'checked_count': checked_count,
+            'drift_count': len(drifted),
+            'fixed': fix,
+            'drifted': drifted[:100],
+        }
     
     @staticmethod
     def check_milestones(user: User) -> List[ReferralMilestone]:
@@ -262,152 +660,107 @@ class ReferralService:
             List[ReferralMilestone]: List of milestones that were triggered
         """
         try:
-            # Get user's referral profile
-            try:
-                profile = user.referral_profile
-            except UserReferralProfile.DoesNotExist:
-                return []
-            
-            # Get active milestones
-            milestones = ReferralMilestone.objects.filter(is_active=True)
-            
-            triggered_milestones = []
-            
-            for milestone in milestones:
-                if ReferralService._check_single_milestone(profile, milestone):
-                    triggered_milestones.append(milestone)
-            
-            return triggered_milestones
+            paid = ReferralService.evaluate_milestones(user_ids=[user.id])
+            return [milestone for milestone, user_ids in paid.items() if user_ids]
             
         except Exception as e:
             logger.error(f"Error checking milestones for user {user.email}: {str(e)}")
             return []
     
     @staticmethod
-    def _check_single_milestone(
-        profile: UserReferralProfile, 
-        milestone: ReferralMilestone
-    ) -> bool:
+    def evaluate_milestones(user_ids: List = None, milestones: List[ReferralMilestone] = None) -> Dict:
         """
-        Check if a single milestone has been reached.
+        Pay every user who newly reached an active milestone.
+        
+        Each milestone costs one query over the profile counters, anti-joined
+        against the milestone bonuses already paid, and one bulk credit.
         
         Args:
-            profile: The user's referral profile
-            milestone: The milestone to check
+            user_ids: Only consider these users (all users by default)
+            milestones: Milestones to evaluate (the active ones by default)
             
         Returns:
-            bool: True if milestone was triggered
+            Dict: milestone -> list of user ids that were paid
         """
-        try:
-            # Check if milestone condition is met
-            condition_met = False
-            
-            if milestone.condition_type == 'total_referrals':
-                condition_met = profile.total_referrals >= milestone.condition_value
-            elif milestone.condition_type == 'total_earnings':
-                if milestone.currency == 'INR':
-                    condition_met = profile.total_earnings_inr >= milestone.condition_value
-                elif milestone.currency == 'USDT':
-                    condition_met = profile.total_earnings_usdt >= milestone.condition_value
-            
-            if not condition_met:
-                return False
-            
-            # Check if milestone bonus was already given
-            from app.wallet.models import WalletTransaction
-            
-            existing_bonus = WalletTransaction.objects.filter(
-                user=profile.user,
-                transaction_type='milestone_bonus',
-                reference_id=str(milestone.id)
-            ).exists()
-            
-            if existing_bonus:
-                return False
-            
-            # Credit milestone bonus
-            if ReferralService._credit_milestone_bonus(profile.user, milestone):
-                logger.info(f"Milestone bonus credited: {milestone.name} for {profile.user.email}")
-                return True
-            
-            return False
-            
-        except Exception as e:
-            logger.error(f"Error checking milestone {milestone.name}: {str(e)}")
-            return False
+        if milestones is None:
+            milestones = ReferralMilestone.get_active_milestones()
+        
+        paid = {}
+        for milestone in milestones:
+            try:
+                paid[milestone] = ReferralService._pay_milestone(milestone, user_ids)
+            except Exception as e:
+                logger.error(f"Error evaluating milestone {milestone.name}: {str(e)}")
+                paid[milestone] = []
+        return paid
     
     @staticmethod
-    def _credit_milestone_bonus(user: User, milestone: ReferralMilestone) -> bool:
+    def _get_milestone_field(milestone: ReferralMilestone) -> Optional[str]:
+        """Get the profile counter a milestone condition is measured on."""
+        if milestone.condition_type == 'total_referrals':
+            return 'total_referrals'
+        if milestone.condition_type == 'total_earnings':
+            return {'INR': 'total_earnings_inr', 'USDT': 'total_earnings_usdt'}.get(milestone.currency)
+        return None
+    
+    @staticmethod
+    def _pay_milestone(milestone: ReferralMilestone, user_ids: List = None) -> List:
         """
-        Credit milestone bonus to user's wallet.
+        Find the users who crossed one milestone and credit their bonuses in bulk.
         
         Args:
-            user: The user to credit bonus to
-            milestone: The milestone that was reached
+            milestone: The milestone to evaluate
+            user_ids: Only consider these users (all users by default)
             
         Returns:
-            bool: True if bonus was credited successfully
+            List: IDs of the users that were paid
         """
-        try:
-            if milestone.currency == 'INR':
-                # Credit to INR wallet
-                from app.wallet.models import INRWallet, WalletTransaction
-                
-                wallet, created = INRWallet.objects.get_or_create(
-                    user=user,
-                    defaults={'balance': Decimal('0.00'), 'status': 'active', 'is_active': True}
-                )
-                
-                # Store balance before adding
-                balance_before = wallet.balance
-                
-                if wallet.add_balance(milestone.bonus_amount):
-                    # Create transaction log
-                    WalletTransaction.objects.create(
-                        user=user,
-                        transaction_type='milestone_bonus',
-                        wallet_type='inr',
-                        amount=milestone.bonus_amount,
-                        balance_before=balance_before,
-                        balance_after=wallet.balance,
-                        status='completed',
-                        reference_id=str(milestone.id),
-                        description=f"Milestone bonus: {milestone.name}"
-                    )
-                    return True
-                    
-            elif milestone.currency == 'USDT':
-                # Credit to USDT wallet
-                from app.wallet.models import USDTWallet, WalletTransaction
-                
-                wallet, created = USDTWallet.objects.get_or_create(
-                    user=user,
-                    defaults={'balance': Decimal('0.000000'), 'status': 'active', 'is_active': True}
-                )
-                
-                # Store balance before adding
-                balance_before = wallet.balance
-                
-                if wallet.add_balance(milestone.bonus_amount):
-                    # Create transaction log
-                    WalletTransaction.objects.create(
-                        user=user,
-                        transaction_type='milestone_bonus',
-                        wallet_type='usdt',
-                        amount=milestone.bonus_amount,
-                        balance_before=balance_before,
-                        balance_after=wallet.balance,
-                        status='completed',
-                        reference_id=str(milestone.id),
-                        description=f"Milestone bonus: {milestone.name}"
-                    )
-                    return True
+        from app.wallet.models import WalletTransaction
+        from app.wallet.services import WalletLedgerService
+        
+        field = ReferralService._get_milestone_field(milestone)
+        if field is None:
+            return []
+        
+        with transaction.atomic():
+            # Serialise evaluations of the same milestone so nobody is paid twice
+            if not ReferralMilestone.objects.select_for_update().filter(id=milestone.id, is_active=True).exists():
+                return []
             
-            return False
+            already_paid = WalletTransaction.objects.filter(
+                user_id=OuterRef('user_id'),
+                transaction_type='milestone_bonus',
+                reference_id=str(milestone.id)
+            )
+            eligible = UserReferralProfile.objects.filter(
+                **{f'{field}__gte': milestone.condition_value}
+            ).filter(~Exists(already_paid))
+            if user_ids is not None:
+                eligible = eligible.filter(user_id__in=user_ids)
             
-        except Exception as e:
-            logger.error(f"Error crediting milestone bonus: {str(e)}")
-            return False
+            paid_user_ids = list(eligible.order_by('user_id').values_list('user_id', flat=True))
+            if not paid_user_ids:
+                return []
+            
+            wallet_model = WalletLedgerService.get_wallet_model(milestone.currency)
+            wallet_model.objects.bulk_create(
+                [wallet_model(user_id=user_id) for user_id in paid_user_ids],
+                ignore_conflicts=True
+            )
+            WalletLedgerService.credit_many([
+                (
+                    user_id,
+                    milestone.currency,
+                    milestone.bonus_amount,
+                    'milestone_bonus',
+                    str(milestone.id),
+                    f"Milestone bonus: {milestone.name}"
+                )
+                for user_id in paid_user_ids
+            ])
+        
+        logger.info(f"Milestone bonus credited: {milestone.name} for {len(paid_user_ids)} users")
+        return paid_user_ids
     
     @staticmethod
     def get_user_referral_tree(user: User, max_levels: int = 3) -> Dict:
@@ -434,44 +787,32 @@ class ReferralService:
                 'total_earnings': '0.00'
             }
             
-            # Get direct referrals (level 1)
-            direct_referrals = Referral.objects.filter(
-                user=user,
-                level=1
-            ).select_related('referred_user')
+            profile = UserReferralProfile.objects.filter(user=user).first()
+            if profile is None:
+                return tree
             
-            for referral in direct_referrals:
-                referred_user = referral.referred_user
-                direct_referral_data = {
-                    'id': str(referred_user.id),
-                    'user_id': str(referred_user.id),
-                    'email': referred_user.email,
-                    'join_date': referral.created_at,
-                    'level': referral.level,
-                    'sub_referrals': []
+            # Get the first two levels of the downline in one path query
+            downline = profile.get_descendants(
+                max_depth=2 if max_levels > 1 else 1
+            ).select_related('user').order_by('referral_depth', 'created_at')
+            
+            direct_referrals = {}
+            for member in downline:
+                member_data = {
+                    'id': str(member.user.id),
+                    'user_id': str(member.user.id),
+                    'email': member.user.email,
+                    'join_date': member.created_at,
+                    'level': member.referral_depth - profile.referral_depth
                 }
-                
-                # Get sub-referrals for this user (level 2)
-                if max_levels > 1:
-                    sub_referrals = Referral.objects.filter(
-                        user=referred_user,
-                        level=1
-                    ).select_related('referred_user')
-                    
-                    for sub_ref in sub_referrals:
-                        sub_user = sub_ref.referred_user
-                        sub_referral_data = {
-                            'id': str(sub_user.id),
-                            'user_id': str(sub_user.id),
-                            'email': sub_user.email,
-                            'join_date': sub_ref.created_at,
-                            'level': 2
-                        }
-                        direct_referral_data['sub_referrals'].append(sub_referral_data)
-                        # Also add to top-level sub_referrals for backward compatibility
-                        tree['sub_referrals'].append(sub_referral_data)
-                
-                tree['direct_referrals'].append(direct_referral_data)
+                if member_data['level'] == 1:
+                    member_data['sub_referrals'] = []
+                    direct_referrals[member.user_id] = member_data
+                    tree['direct_referrals'].append(member_data)
+                elif member.referred_by_id in direct_referrals:
+                    direct_referrals[member.referred_by_id]['sub_referrals'].append(member_data)
+                    # Also add to top-level sub_referrals for backward compatibility
+                    tree['sub_referrals'].append(member_data)
             
             # Update totals
             tree['total_referrals'] = len(tree['direct_referrals'])
@@ -487,6 +828,116 @@ class ReferralService:
             logger.error(f"Error getting referral tree for user {user.email}: {str(e)}")
             return {}
     
+    TREE_PAGE_SIZE = 50
+    TREE_MAX_PAGE_SIZE = 200
+    
+    @staticmethod
+    def get_referral_tree_level(
+        user: User,
+        parent_user_id=None,
+        cursor: str = None,
+        page_size: int = TREE_PAGE_SIZE,
+        max_depth: int = None
+    ) -> Dict:
+        """
+        Get one page of the direct referrals of a node in a user's referral tree.
+        
+        Nodes are returned in join order with keyset pagination and carry the
+        precomputed profile counters, so the frontend can expand them lazily.
+        
+        Args:
+            user: The user whose tree is browsed
+            parent_user_id: The node to expand (the user itself by default)
+            cursor: next_cursor of the previous page
+            page_size: Number of nodes per page (capped at TREE_MAX_PAGE_SIZE)
+            max_depth: Deepest level below the user that may be listed
+            
+        Returns:
+            Dict: parent node, level, results and next_cursor
+            
+        Raises:
+            ValueError: If the node is outside the tree or too deep, or the cursor is invalid
+        """
+        root = UserReferralProfile.objects.filter(user=user).select_related('user').first()
+        if root is None:
+            raise ValueError("Referral profile not found")
+        
+        parent = root
+        if parent_user_id and str(parent_user_id) != str(root.user_id):
+            try:
+                parent_user_id = uuid.UUID(str(parent_user_id))
+            except ValueError:
+                raise ValueError("Invalid node id")
+            parent = UserReferralProfile.objects.filter(
+                user_id=parent_user_id,
+                referral_path__contains=[root.user_id]
+            ).select_related('user').first()
+            if parent is None:
+                raise ValueError("Node is not in this referral tree")
+        
+        level = parent.referral_depth - root.referral_depth + 1
+        if max_depth and level > max_depth:
+            raise ValueError(f"Only {max_depth} levels of the referral tree can be expanded")
+        
+        page_size = max(1, min(int(page_size), ReferralService.TREE_MAX_PAGE_SIZE))
+        children = UserReferralProfile.objects.filter(
+            referred_by_id=parent.user_id
+        ).select_related('user').order_by('created_at', 'id')
+        if cursor:
+            created_at, profile_id = ReferralService._decode_tree_cursor(cursor)
+            children = children.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=profile_id)
+            )
+        
+        page = list(children[:page_size + 1])
+        next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            next_cursor = ReferralService._encode_tree_cursor(page[-1])
+        
+        expandable = not max_depth or level < max_depth
+        return {
+            'parent': ReferralService._tree_node(parent, level - 1, True),
+            'level': level,
+            'results': [ReferralService._tree_node(member, level, expandable) for member in page],
+            'next_cursor': next_cursor,
+        }
+    
+    @staticmethod
+    def _tree_node(profile: UserReferralProfile, level: int, expandable: bool) -> Dict:
+        """Build a referral tree node from a profile and its counters."""
+        return {
+            'user_id': str(profile.user_id),
+            'email': profile.user.email,
+            'referral_code': profile.referral_code,
+            'joined_at': profile.created_at,
+            'level': level,
+            # Referrals within the configured max_levels, not the whole downline
+            'total_referrals': profile.total_referrals,
+            'total_invested_inr': str(profile.total_invested_inr),
+            'total_invested_usdt': str(profile.total_invested_usdt),
+            'downline_count': profile.downline_count,
+            'downline_invested_inr': str(profile.downline_invested_inr),
+            'downline_invested_usdt': str(profile.downline_invested_usdt),
+            'has_children': profile.downline_count > 0,
+            'expandable': expandable and profile.downline_count > 0,
+        }
+    
+    @staticmethod
+    def _encode_tree_cursor(profile: UserReferralProfile) -> str:
+        """Encode the keyset position after a tree node."""
+        position = f"{profile.created_at.isoformat()}|{profile.id}"
+        return base64.urlsafe_b64encode(position.encode()).decode()
+    
+    @staticmethod
+    def _decode_tree_cursor(cursor: str) -> Tuple:
+        """Decode a tree cursor into its (created_at, profile id) position."""
+        try:
+            created_at, profile_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return datetime.fromisoformat(created_at), uuid.UUID(profile_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("Invalid cursor")
+    
     @staticmethod
     def get_referral_earnings(user: User, filters: Dict = None) -> List[Dict]:
         """
@@ -544,6 +995,9 @@ class ReferralService:
             logger.error(f"Error getting referral earnings for user {user.email}: {str(e)}")
             return []
     
+    # Days of daily earnings included in the earnings summary
+    SUMMARY_DAYS = 30
+    
     @staticmethod
     def get_referral_earnings_summary(user: User) -> Dict:
         """
@@ -591,6 +1045,32 @@ class ReferralService:
                     'created_at': earning.created_at
                 })
             
+            # Breakdowns come from the daily rollup, not the earnings history
+            rollup = ReferralEarningDaily.objects.filter(user=user)
+            summary['earnings_by_level'] = [
+                {
+                    'level': row['level'],
+                    'currency': row['currency'],
+                    'count': row['count'],
+                    'amount': str(row['amount'])
+                }
+                for row in rollup.values('level', 'currency').annotate(
+                    count=Sum('earning_count'), amount=Sum('amount')
+                ).order_by('level', 'currency')
+            ]
+            since = timezone.localdate() - timedelta(days=ReferralService.SUMMARY_DAYS - 1)
+            summary['daily_earnings'] = [
+                {
+                    'day': row['day'],
+                    'currency': row['currency'],
+                    'count': row['count'],
+                    'amount': str(row['amount'])
+                }
+                for row in rollup.filter(day__gte=since).values('day', 'currency').annotate(
+                    count=Sum('earning_count'), amount=Sum('amount')
+                ).order_by('day', 'currency')
+            ]
+            
             return summary
             
         except Exception as e:
@@ -6,9 +6,10 @@ import logging
 
 from .models import (
     Referral, ReferralEarning, ReferralMilestone, 
-    UserReferralProfile, ReferralConfig
+    UserReferralProfile, ReferralConfig, ReferralEarningDaily
 )
 from .services import ReferralService
+from .cache import invalidate, ACTIVE_CONFIG_KEY, ACTIVE_MILESTONES_KEY
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -22,9 +23,10 @@ def create_user_referral_profile(sender, instance, created, **kwargs):
     if created:
         try:
             # Create referral profile for new user
-            profile = UserReferralProfile.objects.create(user=instance)
-            profile.generate_referral_code()
-            profile.save()
+            UserReferralProfile.objects.get_or_create(
+                user=instance,
+                defaults={'referral_code': lambda: UserReferralProfile.allocate_referral_codes(1)[0]}
+            )
             
             logger.info(f"Created referral profile for user {instance.email}")
             
@@ -35,18 +37,20 @@ def create_user_referral_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=ReferralEarning)
 def update_user_stats_on_earning(sender, instance, created, **kwargs):
     """
-    Update user referral statistics when a new earning is created or updated.
+    Add an earning to the referrer's totals when it becomes credited, or take
+    it off again when a credited earning is cancelled.
     """
-    if created or instance.status == 'credited':
-        try:
-            # Update the user's referral profile stats
-            if hasattr(instance.referral, 'user') and instance.referral.user:
-                profile = instance.referral.user.referral_profile
-                profile.update_stats()
-                logger.info(f"Updated stats for user {instance.referral.user.email}")
-                
-        except Exception as e:
-            logger.error(f"Error updating user stats: {str(e)}")
+    credited = instance.status == 'credited'
+    if credited == instance._counted_in_stats:
+        return
+    
+    try:
+        UserReferralProfile.record_earnings([instance], reverse=not credited)
+        ReferralEarningDaily.record([instance], reverse=not credited)
+        logger.info(f"Updated stats for user {instance.referral.user_id}")
+        
+    except Exception as e:
+        logger.error(f"Error updating user stats: {str(e)}")
 
 
 @receiver(post_save, sender=Referral)
@@ -57,10 +61,9 @@ def update_referrer_stats_on_referral(sender, instance, created, **kwargs):
     if created:
         try:
             # Update the referrer's stats
-            if instance.user:
-                profile = instance.user.referral_profile
-                profile.update_stats()
-                logger.info(f"Updated referrer stats for user {instance.user.email}")
+            if instance.user_id:
+                UserReferralProfile.record_referrals([instance.user_id])
+                logger.info(f"Updated referrer stats for user {instance.user_id}")
                 
         except Exception as e:
             logger.error(f"Error updating referrer stats: {str(e)}")
@@ -96,6 +99,15 @@ def milestone_post_save_handler(sender, instance, created, **kwargs):
         logger.info(f"Created new milestone: {instance.name}")
     else:
         logger.info(f"Updated milestone: {instance.name}")
+    invalidate(ACTIVE_MILESTONES_KEY)
+
+
+@receiver(post_delete, sender=ReferralMilestone)
+def milestone_post_delete_handler(sender, instance, **kwargs):
+    """
+    Drop a deleted milestone from the cached milestone list.
+    """
+    invalidate(ACTIVE_MILESTONES_KEY)
 
 
 @receiver(post_save, sender=ReferralConfig)
@@ -107,6 +119,15 @@ def config_post_save_handler(sender, instance, created, **kwargs):
         logger.info(f"Created new referral configuration with {instance.max_levels} levels")
     else:
         logger.info(f"Updated referral configuration: L1:{instance.level_1_percentage}%, L2:{instance.level_2_percentage}%, L3:{instance.level_3_percentage}%")
+    invalidate(ACTIVE_CONFIG_KEY)
+
+
+@receiver(post_delete, sender=ReferralConfig)
+def config_post_delete_handler(sender, instance, **kwargs):
+    """
+    Drop a deleted configuration from the cache.
+    """
+    invalidate(ACTIVE_CONFIG_KEY)
 
 
 # Cleanup signals
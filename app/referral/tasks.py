@@ -0,0 +1,33 @@
+from celery import shared_task
+from django.core.cache import cache
+import logging
+
+from .cache import MILESTONE_CHECK_PENDING_KEY
+from .services import ReferralService
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def evaluate_referral_milestones(user_ids=None):
+    """
+    Task to pay milestone bonuses to every user who newly reached one.
+    Runs periodically and, debounced, after referral bonuses are paid.
+    """
+    # Bonuses committed from here on queue the next evaluation
+    cache.delete(MILESTONE_CHECK_PENDING_KEY)
+    
+    paid = ReferralService.evaluate_milestones(user_ids=user_ids)
+    paid_count = sum(len(users) for users in paid.values())
+    logger.info(f"Evaluated {len(paid)} milestones, paid {paid_count} bonuses")
+    return f"Evaluated {len(paid)} milestones, paid {paid_count} bonuses"
+
+
+@shared_task
+def reconcile_referral_stats(fix=True):
+    """
+    Task to rebuild the incrementally maintained referral profile totals.
+    This task should be run daily to catch and repair any drift.
+    """
+    result = ReferralService.reconcile_referral_stats(fix=fix)
+    return f"Reconciled {result['checked_count']} referral profiles, {result['drift_count']} drifted"
@@ -6,6 +6,8 @@ from django.db import IntegrityError
 from django.contrib.auth import get_user_model
 from django.db.models.signals import post_save
 from app.referral.signals import create_user_referral_profile
+from unittest.mock import patch
+from app.referral import codes as referral_codes
 
 from ..models import (
     Referral, ReferralEarning, ReferralMilestone, 
@@ -514,3 +516,37 @@ class ReferralModelValidationTest(ReferralTestBase):
         # Should maintain precision
         self.assertEqual(earning.amount, Decimal('123.456789'))
         self.assertEqual(earning.percentage_used, Decimal('12.34'))
+
+
+class ReferralCodeAllocatorTest(ReferralTestBase):
+    """Test cases for sequence-based referral code allocation."""
+
+    def test_permutation_is_collision_free(self):
+        """Test that consecutive numbers map to distinct, well-formed codes."""
+        codes = [referral_codes.encode(referral_codes.permute(number)) for number in range(1, 5001)]
+
+        self.assertEqual(len(set(codes)), len(codes))
+        self.assertTrue(all(len(code) == 8 and code.isalnum() and code.upper() == code for code in codes))
+        self.assertNotEqual(codes[1], referral_codes.encode(2))
+
+    def test_bulk_allocation_skips_existing_codes(self):
+        """Test that a batch of codes costs two queries and avoids codes already issued."""
+        with self.assertNumQueries(2):
+            codes = UserReferralProfile.allocate_referral_codes(500)
+        self.assertEqual(len(set(codes)), 500)
+
+        user = UserFactory()
+        UserReferralProfileFactory(user=user, referral_code=referral_codes.next_codes(1)[0])
+        with patch.object(referral_codes, 'next_codes', side_effect=[[user.referral_profile.referral_code, 'FRESH001'], ['FRESH002']]):
+            self.assertEqual(UserReferralProfile.allocate_referral_codes(2), ['FRESH001', 'FRESH002'])
+
+    def test_create_profiles_in_bulk(self):
+        """Test that profiles for many users are created with codes and root paths."""
+        users = [UserFactory() for _ in range(3)]
+
+        with self.assertNumQueries(3):
+            UserReferralProfile.create_profiles(users)
+
+        profiles = UserReferralProfile.objects.filter(user__in=users)
+        self.assertEqual(len({profile.referral_code for profile in profiles}), 3)
+        self.assertTrue(all(profile.get_ancestor_ids() == [] for profile in profiles))
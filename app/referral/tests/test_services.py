@@ -1,4 +1,8 @@
+import os
+import tempfile
 from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.utils import timezone
@@ -7,9 +11,15 @@ from freezegun import freeze_time
 
 from app.referral.models import (
     ReferralConfig, UserReferralProfile, Referral, 
-    ReferralEarning, ReferralMilestone
+    ReferralEarning, ReferralMilestone, ReferralEarningDaily
 )
 from app.referral.services import ReferralService
+from app.referral.graph import ReferralGraph
+from django.core.cache import cache
+from app.referral.cache import (
+    invalidate, ACTIVE_CONFIG_KEY, ACTIVE_MILESTONES_KEY, MILESTONE_CHECK_PENDING_KEY
+)
+from app.investment.models import Investment, InvestmentPlan
 from app.referral.tests.factories import (
     UserFactory, ReferralConfigFactory, UserReferralProfileFactory,
     ReferralFactory, ReferralMilestoneFactory, ReferralEarningFactory
@@ -241,9 +251,11 @@ class ReferralServiceTestCase(TestCase):
 
     def test_check_milestones_success(self):
         """Test checking and triggering milestones successfully."""
-        # Create user profile with stats
-        profile = UserReferralProfileFactory(
-            user=self.user1,
+        from app.wallet.models import INRWallet
+
+        invalidate(ACTIVE_MILESTONES_KEY)
+        # Set the user's referral stats
+        UserReferralProfile.objects.filter(user=self.user1).update(
             total_referrals=15,
             total_earnings_inr=Decimal('500.00'),
             total_earnings_usdt=Decimal('100.00')
@@ -264,23 +276,20 @@ class ReferralServiceTestCase(TestCase):
             condition_type="total_earnings",
             condition_value=Decimal('500.00'),
             bonus_amount=Decimal('25.00'),
-            currency="USDT",
+            currency="INR",
             is_active=True
         )
         
-        # Mock wallet crediting
-        with patch.object(ReferralService, '_credit_milestone_bonus') as mock_credit:
-            mock_credit.return_value = True
-            
-            triggered_milestones = ReferralService.check_milestones(self.user1)
-            
-            # Check both milestones were triggered
-            self.assertEqual(len(triggered_milestones), 2)
-            self.assertIn(milestone1, triggered_milestones)
-            self.assertIn(milestone2, triggered_milestones)
-            
-            # Check _credit_milestone_bonus was called twice
-            self.assertEqual(mock_credit.call_count, 2)
+        triggered_milestones = ReferralService.check_milestones(self.user1)
+        
+        # Check both milestones were triggered and paid
+        self.assertEqual(len(triggered_milestones), 2)
+        self.assertIn(milestone1, triggered_milestones)
+        self.assertIn(milestone2, triggered_milestones)
+        self.assertEqual(INRWallet.objects.get(user=self.user1).balance, Decimal('75.00'))
+        
+        # Nothing is paid twice
+        self.assertEqual(ReferralService.check_milestones(self.user1), [])
 
     def test_check_milestones_no_eligible(self):
         """Test checking milestones when none are eligible."""
@@ -341,15 +350,11 @@ class ReferralServiceTestCase(TestCase):
         # Check no milestones were triggered (already credited)
         self.assertEqual(len(triggered_milestones), 0)
 
-    @patch('app.wallet.models.INRWallet.objects.get_or_create')
-    @patch('app.wallet.models.WalletTransaction.objects.create')
-    def test_credit_milestone_bonus_inr(self, mock_create_transaction, mock_get_wallet):
+    def test_pay_milestone_inr(self):
         """Test crediting milestone bonus to INR wallet."""
-        # Mock wallet
-        mock_wallet = MagicMock()
-        mock_get_wallet.return_value = (mock_wallet, True)
-        
-        # Create milestone
+        from app.wallet.models import INRWallet, WalletTransaction
+
+        UserReferralProfile.objects.filter(user=self.user1).update(total_referrals=10)
         milestone = ReferralMilestoneFactory(
             name="Test Milestone",
             condition_type="total_referrals",
@@ -359,35 +364,23 @@ class ReferralServiceTestCase(TestCase):
             is_active=True
         )
         
-        # Mock transaction creation
-        mock_transaction = MagicMock()
-        mock_create_transaction.return_value = mock_transaction
-        
-        result = ReferralService._credit_milestone_bonus(self.user1, milestone)
+        paid = ReferralService._pay_milestone(milestone, [self.user1.id, self.user2.id])
         
-        self.assertTrue(result)
+        # Only the user who reached the milestone is paid
+        self.assertEqual(paid, [self.user1.id])
+        self.assertEqual(INRWallet.objects.get(user=self.user1).balance, Decimal('100.00'))
         
-        # Check wallet balance was updated
-        mock_wallet.balance.__iadd__.assert_called_once_with(Decimal('100.00'))
-        mock_wallet.save.assert_called_once()
-        
-        # Check transaction was created
-        mock_create_transaction.assert_called_once()
-        call_args = mock_create_transaction.call_args
-        self.assertEqual(call_args[1]['transaction_type'], 'milestone_bonus')
-        self.assertEqual(call_args[1]['amount'], Decimal('100.00'))
-        self.assertEqual(call_args[1]['currency'], 'INR')
-        self.assertEqual(call_args[1]['reference_id'], milestone.id)
-
-    @patch('app.wallet.models.USDTWallet.objects.get_or_create')
-    @patch('app.wallet.models.WalletTransaction.objects.create')
-    def test_credit_milestone_bonus_usdt(self, mock_create_transaction, mock_get_wallet):
+        wallet_transaction = WalletTransaction.objects.get(user=self.user1, transaction_type='milestone_bonus')
+        self.assertEqual(wallet_transaction.amount, Decimal('100.00'))
+        self.assertEqual(wallet_transaction.wallet_type, 'inr')
+        self.assertEqual(wallet_transaction.reference_id, str(milestone.id))
+        self.assertEqual(wallet_transaction.balance_after, Decimal('100.00'))
+
+    def test_pay_milestone_usdt(self):
         """Test crediting milestone bonus to USDT wallet."""
-        # Mock wallet
-        mock_wallet = MagicMock()
-        mock_get_wallet.return_value = (mock_wallet, True)
-        
-        # Create milestone
+        from app.wallet.models import USDTWallet, WalletTransaction
+
+        UserReferralProfile.objects.filter(user=self.user1).update(total_referrals=12)
         milestone = ReferralMilestoneFactory(
             name="Test Milestone",
             condition_type="total_referrals",
@@ -397,22 +390,12 @@ class ReferralServiceTestCase(TestCase):
             is_active=True
         )
         
-        # Mock transaction creation
-        mock_transaction = MagicMock()
-        mock_create_transaction.return_value = mock_transaction
-        
-        result = ReferralService._credit_milestone_bonus(self.user1, milestone)
-        
-        self.assertTrue(result)
-        
-        # Check wallet balance was updated
-        mock_wallet.balance.__iadd__.assert_called_once_with(Decimal('50.00'))
-        mock_wallet.save.assert_called_once()
+        self.assertEqual(ReferralService._pay_milestone(milestone), [self.user1.id])
+        self.assertEqual(ReferralService._pay_milestone(milestone), [])
         
-        # Check transaction was created
-        mock_create_transaction.assert_called_once()
-        call_args = mock_create_transaction.call_args
-        self.assertEqual(call_args[1]['currency'], 'USDT')
+        self.assertEqual(USDTWallet.objects.get(user=self.user1).balance, Decimal('50.00'))
+        wallet_transaction = WalletTransaction.objects.get(user=self.user1, transaction_type='milestone_bonus')
+        self.assertEqual(wallet_transaction.wallet_type, 'usdt')
 
     def test_get_user_referral_tree(self):
         """Test getting user referral tree structure."""
@@ -513,4 +496,591 @@ class ReferralServiceTestCase(TestCase):
         self.assertIsNone(referrer)
 
 
+class ReferralHierarchyTestCase(TestCase):
+    """Test cases for the materialized-path referral hierarchy."""
+
+    def setUp(self):
+        """Set up a four-user referral chain: user1 → user2 → user3 → user4."""
+        self.config = ReferralConfigFactory(max_levels=3, is_active=True)
+        self.users = [UserFactory() for _ in range(4)]
+        for referrer, user in zip(self.users, self.users[1:]):
+            ReferralService.create_referral_chain(user, referrer.referral_profile.referral_code)
+
+    def test_referral_path_tracks_chain(self):
+        """Test that each profile stores the user ids of its referrers."""
+        profile = UserReferralProfile.objects.get(user=self.users[3])
+
+        self.assertEqual(profile.referral_depth, 3)
+        self.assertEqual(
+            profile.get_ancestor_ids(),
+            [self.users[2].id, self.users[1].id, self.users[0].id]
+        )
+        self.assertEqual(
+            ReferralService.get_ancestors(self.users[3], max_levels=2),
+            [self.users[2], self.users[1]]
+        )
+
+    def test_chain_creates_referrals_for_each_level(self):
+        """Test that a signup creates one referral per level with counts updated."""
+        referrals = Referral.objects.filter(referred_user=self.users[3]).order_by('level')
+
+        self.assertEqual(
+            [(referral.user_id, referral.level) for referral in referrals],
+            [(self.users[2].id, 1), (self.users[1].id, 2), (self.users[0].id, 3)]
+        )
+        self.assertEqual(UserReferralProfile.objects.get(user=self.users[0]).total_referrals, 3)
+
+    def test_descendants_query(self):
+        """Test that the downline to a given depth is one prefix query."""
+        root = UserReferralProfile.objects.get(user=self.users[0])
+
+        with self.assertNumQueries(1):
+            descendants = list(root.get_descendants(max_depth=2))
+
+        self.assertEqual(
+            {profile.user_id for profile in descendants},
+            {self.users[1].id, self.users[2].id}
+        )
+        self.assertEqual(root.get_descendants().count(), 3)
+
+    @patch('app.referral.tasks.evaluate_referral_milestones.apply_async')
+    def test_deep_chain(self, mock_delay):
+        """Test that a chain far deeper than a btree row allows is stored and queried."""
+        rows = [
+            {'email': f'deep{depth}@example.com', 'referral_code': f'DEEP{depth}',
+             'referrer_code': f'DEEP{depth - 1}' if depth else self.users[3].referral_profile.referral_code}
+            for depth in range(150)
+        ]
+        self.assertEqual(ReferralService.bulk_onboard_users(rows)['created_count'], 150)
+        signup = UserFactory()
+        self.assertTrue(ReferralService.create_referral_chain(signup, 'DEEP149'))
+
+        profile = UserReferralProfile.objects.get(user=signup)
+        self.assertEqual(profile.referral_depth, 154)
+        self.assertEqual(profile.get_ancestor_ids()[-4:], [user.id for user in reversed(self.users)])
+        root = UserReferralProfile.objects.get(user=self.users[0])
+        self.assertEqual(root.get_descendants().count(), 154)
+        self.assertEqual(Referral.objects.filter(referred_user=signup).count(), 3)
+
+    def test_set_referrer_refuses_to_move_a_downline(self):
+        """Test that a user with a referrer or a downline is not moved below another referrer."""
+        new_root = UserFactory()
+        profile = UserReferralProfile.objects.get(user=self.users[2])
+
+        with self.assertRaises(ValueError):
+            profile.set_referrer(new_root.referral_profile)
+        self.assertFalse(ReferralService.create_referral_chain(self.users[2], new_root.referral_profile.referral_code))
+        with self.assertRaises(ValueError):
+            self.users[0].referral_profile.set_referrer(new_root.referral_profile)
+
+        self.assertEqual(
+            UserReferralProfile.objects.get(user=self.users[3]).get_ancestor_ids(),
+            [self.users[2].id, self.users[1].id, self.users[0].id]
+        )
+        self.assertFalse(Referral.objects.filter(user=new_root).exists())
+
+        # Attaching a user again below its own referrer changes nothing
+        profile.set_referrer(UserReferralProfile.objects.get(user=self.users[1]))
+        self.assertEqual(Referral.objects.filter(referred_user=self.users[3]).count(), 3)
+
+
+class ReferralBonusDistributionTestCase(TestCase):
+    """Test cases for batched referral bonus distribution."""
+
+    def setUp(self):
+        """Set up a four-user referral chain: user1 → user2 → user3 → user4."""
+        self.config = ReferralConfigFactory(max_levels=3, is_active=True)
+        self.users = [UserFactory() for _ in range(4)]
+        for referrer, user in zip(self.users, self.users[1:]):
+            ReferralService.create_referral_chain(user, referrer.referral_profile.referral_code)
+        self.plan = InvestmentPlan.objects.create(
+            name="Referral Bonus Plan",
+            fixed_amount=Decimal('1000.00'),
+            roi_rate=Decimal('2.00'),
+            frequency='daily',
+            duration_days=30,
+            breakdown_window_days=10
+        )
+
+    def _invest(self, user, amount):
+        """Create an INR investment, which triggers the bonus signal."""
+        return Investment.objects.create(
+            user=user, plan=self.plan, amount=amount, currency='INR', start_date=timezone.now()
+        )
+
+    @patch('app.referral.tasks.evaluate_referral_milestones.apply_async')
+    def test_investment_pays_all_levels(self, mock_delay):
+        """Test that one investment credits every level and queues a milestone evaluation."""
+        from app.wallet.models import INRWallet, WalletTransaction
+
+        cache.delete(MILESTONE_CHECK_PENDING_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            investment = self._invest(self.users[3], Decimal('1000.00'))
+            self._invest(self.users[2], Decimal('1000.00'))
+
+        earnings = ReferralEarning.objects.filter(investment=investment).order_by('level')
+        self.assertEqual(
+            [(earning.referral.user_id, earning.amount, earning.status) for earning in earnings],
+            [
+                (self.users[2].id, Decimal('50.00'), 'credited'),
+                (self.users[1].id, Decimal('30.00'), 'credited'),
+                (self.users[0].id, Decimal('10.00'), 'credited'),
+            ]
+        )
+        self.assertEqual(INRWallet.objects.get(user=self.users[2]).balance, Decimal('50.00'))
+        self.assertEqual(
+            WalletTransaction.objects.filter(
+                transaction_type='referral_bonus', reference_id=str(investment.id)
+            ).count(),
+            3
+        )
+        mock_delay.assert_called_once()
+
+    @patch('app.referral.tasks.evaluate_referral_milestones.apply_async')
+    def test_replaying_batch_pays_nothing_twice(self, mock_delay):
+        """Test that redistributing already paid investments is a no-op."""
+        from app.wallet.models import INRWallet
+
+        investments = [
+            self._invest(self.users[3], Decimal('1000.00')),
+            self._invest(self.users[2], Decimal('500.00')),
+        ]
+
+        self.assertEqual(ReferralService.distribute_referral_bonuses(investments, self.config), [])
+        self.assertEqual(ReferralEarning.objects.count(), 5)
+        self.assertEqual(INRWallet.objects.get(user=self.users[1]).balance, Decimal('55.00'))
+
+    @patch('app.referral.tasks.evaluate_referral_milestones.apply_async')
+    def test_concurrent_batch_pays_nothing_twice(self, mock_delay):
+        """Test that an earning another batch inserts after the check is not paid again."""
+        from app.wallet.models import INRWallet
+
+        investment = self._invest(self.users[3], Decimal('1000.00'))
+        earning = ReferralEarning.objects.get(investment=investment, level=1)
+        ReferralEarning.objects.filter(id=earning.id).delete()
+        bulk_create = ReferralEarning.objects.bulk_create
+
+        def concurrent_insert(earnings, **kwargs):
+            # The other batch commits its earning between the check and this insert
+            earning.save(force_insert=True)
+            return bulk_create(earnings, **kwargs)
+
+        with patch.object(ReferralEarning.objects, 'bulk_create', side_effect=concurrent_insert):
+            self.assertEqual(ReferralService.distribute_referral_bonuses([investment], self.config), [])
+
+        self.assertEqual(ReferralEarning.objects.filter(investment=investment).count(), 3)
+        self.assertEqual(INRWallet.objects.get(user=self.users[2]).balance, Decimal('50.00'))
+
+    def test_bonuses_increment_referrer_totals(self):
+        """Test that paying bonuses updates referrer totals without a recount."""
+        with patch('app.referral.tasks.evaluate_referral_milestones.apply_async'):
+            self._invest(self.users[3], Decimal('1000.00'))
+
+        profile = UserReferralProfile.objects.get(user=self.users[2])
+        self.assertEqual(profile.total_earnings_inr, Decimal('50.00'))
+        self.assertEqual(profile.total_earnings, Decimal('50.00'))
+        self.assertIsNotNone(profile.last_earning_date)
+
+
+class ReferralStatsTestCase(TestCase):
+    """Test cases for incrementally maintained referral stats."""
+
+    def setUp(self):
+        """Set up a referrer with one direct referral."""
+        self.config = ReferralConfigFactory(max_levels=3, is_active=True)
+        self.referrer = UserFactory()
+        self.user = UserFactory()
+        ReferralService.create_referral_chain(self.user, self.referrer.referral_profile.referral_code)
+        self.plan = InvestmentPlan.objects.create(
+            name="Referral Stats Plan",
+            fixed_amount=Decimal('1000.00'),
+            roi_rate=Decimal('2.00'),
+            frequency='daily',
+            duration_days=30,
+            breakdown_window_days=10
+        )
+
+    def _profile(self):
+        return UserReferralProfile.objects.get(user=self.referrer)
+
+    @patch('app.referral.tasks.evaluate_referral_milestones.apply_async')
+    def test_earning_status_transitions(self, mock_delay):
+        """Test that an earning is counted once and taken off when cancelled."""
+        Investment.objects.create(
+            user=self.user, plan=self.plan, amount=Decimal('500.00'),
+            currency='INR', start_date=timezone.now()
+        )
+        earning = ReferralEarning.objects.get(referral__user=self.referrer)
+        earning.save()
+        self.assertEqual(self._profile().total_referrals, 1)
+        self.assertEqual(self._profile().total_earnings_inr, Decimal('25.00'))
+
+        earning.status = 'cancelled'
+        earning.save(update_fields=['status'])
+        self.assertEqual(self._profile().total_earnings_inr, Decimal('0.00'))
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        """Test that reconciliation rebuilds drifted totals in bulk."""
+        UserReferralProfile.objects.filter(user=self.referrer).update(
+            total_referrals=7, total_earnings_inr=Decimal('99.00'), total_earnings=Decimal('99.00'),
+            downline_count=9
+        )
+
+        report = ReferralService.reconcile_referral_stats(batch_size=1, fix=False)
+        self.assertEqual(report['drift_count'], 1)
+        self.assertEqual(report['checked_count'], 2)
+        self.assertEqual(self._profile().total_referrals, 7)
+
+        ReferralService.reconcile_referral_stats(batch_size=1)
+        profile = self._profile()
+        self.assertEqual((profile.total_referrals, profile.downline_count), (1, 1))
+        self.assertEqual(profile.total_earnings_inr, Decimal('0.00'))
+        self.assertEqual(ReferralService.reconcile_referral_stats()['drift_count'], 0)
+
+
+class ReferralCatalogueCacheTestCase(TestCase):
+    """Test cases for the cached referral config and milestone list."""
+
+    def setUp(self):
+        """Start from empty caches."""
+        invalidate(ACTIVE_CONFIG_KEY, ACTIVE_MILESTONES_KEY)
+        self.config = ReferralConfigFactory(is_active=True)
+        self.milestone = ReferralMilestoneFactory(is_active=True)
+
+    def test_hot_path_reads_from_memory(self):
+        """Test that repeated reads of the catalogue hit the database once."""
+        self.assertEqual(ReferralConfig.get_active_config(), self.config)
+        self.assertEqual(ReferralMilestone.get_active_milestones(), [self.milestone])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(ReferralConfig.get_active_config(), self.config)
+            self.assertEqual(ReferralMilestone.get_active_milestones(), [self.milestone])
+
+    def test_signals_invalidate_cache(self):
+        """Test that saving or deleting catalogue rows drops the cached copies."""
+        ReferralConfig.get_active_config()
+        ReferralMilestone.get_active_milestones()
+
+        self.config.level_1_percentage = Decimal('7.00')
+        self.config.save()
+        self.milestone.delete()
+
+        self.assertEqual(ReferralConfig.get_active_config().level_1_percentage, Decimal('7.00'))
+        self.assertEqual(ReferralMilestone.get_active_milestones(), [])
+
+    def test_process_local_cache_keeps_entries_for_local_ttl(self):
+        """Test that without a shared cache entries expire as fast as the process-local copies."""
+        local_cache = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with self.settings(CACHES=local_cache, REFERRAL_LOCAL_CACHE_TTL=30, REFERRAL_CACHE_TIMEOUT=3600), \
+                patch('app.referral.cache.cache') as shared:
+            shared.get.side_effect = lambda key, default: default
+            ReferralConfig.get_active_config()
+
+        self.assertEqual(shared.set.call_args[0][2], 30)
+
+    def test_cache_outage_falls_back_to_database(self):
+        """Test that an unreachable cache backend leaves signups and the catalogue working."""
+        referrer = UserFactory()
+        with patch('app.referral.cache.cache') as shared:
+            shared.get.side_effect = ConnectionError('Connection refused')
+            shared.set.side_effect = ConnectionError('Connection refused')
+            self.assertEqual(ReferralConfig.get_active_config(), self.config)
+            self.assertEqual(ReferralMilestone.get_active_milestones(), [self.milestone])
+            self.assertTrue(
+                ReferralService.create_referral_chain(UserFactory(), referrer.referral_profile.referral_code)
+            )
+
+        self.assertEqual(Referral.objects.filter(user=referrer).count(), 1)
+
+
+class MilestoneEvaluationTestCase(TestCase):
+    """Test cases for set-based milestone evaluation."""
+
+    def setUp(self):
+        """Set up three users with different referral counts."""
+        invalidate(ACTIVE_MILESTONES_KEY)
+        self.users = [UserFactory() for _ in range(3)]
+        for user, count in zip(self.users, [10, 4, 12]):
+            UserReferralProfile.objects.filter(user=user).update(total_referrals=count)
+        self.milestone = ReferralMilestoneFactory(
+            name="10 Referrals",
+            condition_type='total_referrals',
+            condition_value=10,
+            bonus_amount=Decimal('50.00'),
+            currency='INR',
+            is_active=True
+        )
+
+    def test_pays_everyone_who_crossed_once(self):
+        """Test that all eligible users are paid in one pass and never twice."""
+        from app.wallet.models import INRWallet, WalletTransaction
+
+        paid = ReferralService.evaluate_milestones()
+
+        self.assertEqual(set(paid[self.milestone]), {self.users[0].id, self.users[2].id})
+        self.assertEqual(INRWallet.objects.get(user=self.users[0]).balance, Decimal('50.00'))
+        self.assertFalse(
+            WalletTransaction.objects.filter(user=self.users[1], transaction_type='milestone_bonus').exists()
+        )
+        self.assertEqual(ReferralService.evaluate_milestones()[self.milestone], [])
+        self.assertEqual(
+            WalletTransaction.objects.filter(
+                transaction_type='milestone_bonus', reference_id=str(self.milestone.id)
+            ).count(),
+            2
+        )
+
+    def test_check_milestones_for_one_user(self):
+        """Test that checking a single user only pays that user."""
+        self.assertEqual(ReferralService.check_milestones(self.users[2]), [self.milestone])
+        self.assertEqual(ReferralService.check_milestones(self.users[1]), [])
+        self.assertEqual(ReferralService.check_milestones(self.users[2]), [])
+
+
+class ReferralTreeLevelTestCase(TestCase):
+    """Test cases for the lazily expanded referral tree."""
+
+    def setUp(self):
+        """Set up a root with three direct referrals, the first with one of its own."""
+        self.config = ReferralConfigFactory(max_levels=2, is_active=True)
+        self.root = UserFactory()
+        self.directs = [UserFactory() for _ in range(3)]
+        for user in self.directs:
+            ReferralService.create_referral_chain(user, self.root.referral_profile.referral_code)
+        self.grandchild = UserFactory()
+        ReferralService.create_referral_chain(self.grandchild, self.directs[0].referral_profile.referral_code)
+
+    def test_pages_through_direct_referrals(self):
+        """Test that one level is returned page by page with node counters."""
+        first = ReferralService.get_referral_tree_level(self.root, page_size=2)
+        second = ReferralService.get_referral_tree_level(self.root, cursor=first['next_cursor'], page_size=2)
+
+        self.assertEqual(first['level'], 1)
+        self.assertEqual(
+            [node['user_id'] for node in first['results'] + second['results']],
+            [str(user.id) for user in self.directs]
+        )
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(first['parent']['total_referrals'], 4)
+        self.assertEqual(first['results'][0]['total_referrals'], 1)
+        self.assertTrue(first['results'][0]['expandable'])
+        self.assertFalse(first['results'][1]['has_children'])
+
+    def test_expands_node_within_depth(self):
+        """Test that a node below the root expands and depth limits are enforced."""
+        level = ReferralService.get_referral_tree_level(
+            self.root, parent_user_id=self.directs[0].id, max_depth=2
+        )
+
+        self.assertEqual(level['level'], 2)
+        self.assertEqual([node['user_id'] for node in level['results']], [str(self.grandchild.id)])
+        self.assertFalse(level['results'][0]['expandable'])
+        with self.assertRaises(ValueError):
+            ReferralService.get_referral_tree_level(self.root, parent_user_id=self.grandchild.id, max_depth=2)
+        with self.assertRaises(ValueError):
+            ReferralService.get_referral_tree_level(self.directs[1], parent_user_id=self.directs[0].id)
+        with self.assertRaises(ValueError):
+            ReferralService.get_referral_tree_level(self.root, cursor='not-a-cursor')
+
+    def test_invested_totals_are_recorded(self):
+        """Test that investments add to the investor's node totals."""
+        investment = MagicMock(user_id=self.directs[2].id, amount=Decimal('250.00'), currency='USDT')
+        UserReferralProfile.record_investments([investment, investment])
+
+        level = ReferralService.get_referral_tree_level(self.root)
+        self.assertEqual(level['results'][2]['total_invested_usdt'], '500.000000')
+        self.assertEqual(level['results'][2]['total_invested_inr'], '0.00')
+        self.assertEqual(level['parent']['downline_invested_usdt'], '500.000000')
+
+    def test_downline_totals_cover_every_depth(self):
+        """Test that node downline totals count users and investments below max_levels too."""
+        great_grandchild = UserFactory()
+        ReferralService.create_referral_chain(great_grandchild, self.grandchild.referral_profile.referral_code)
+        UserReferralProfile.record_investments([
+            MagicMock(user_id=great_grandchild.id, amount=Decimal('100.00'), currency='INR'),
+            MagicMock(user_id=self.grandchild.id, amount=Decimal('40.00'), currency='INR'),
+        ])
+
+        level = ReferralService.get_referral_tree_level(self.root)
+        self.assertEqual(
+            (level['parent']['total_referrals'], level['parent']['downline_count']), (4, 5)
+        )
+        self.assertEqual(level['parent']['downline_invested_inr'], '140.00')
+        self.assertEqual(
+            (level['results'][0]['downline_count'], level['results'][0]['downline_invested_inr']), (2, '140.00')
+        )
+        self.assertEqual(level['results'][1]['downline_count'], 0)
+        self.assertEqual(
+            UserReferralProfile.objects.get(user=self.grandchild).downline_invested_inr, Decimal('100.00')
+        )
+
+
+class ReferralEarningRollupTestCase(TestCase):
+    """Test cases for the daily referral earnings rollup."""
+
+    def setUp(self):
+        """Set up a two-level chain with one investment at the bottom."""
+        self.config = ReferralConfigFactory(max_levels=3, is_active=True)
+        self.users = [UserFactory() for _ in range(3)]
+        for referrer, user in zip(self.users, self.users[1:]):
+            ReferralService.create_referral_chain(user, referrer.referral_profile.referral_code)
+        plan = InvestmentPlan.objects.create(
+            name="Referral Rollup Plan",
+            fixed_amount=Decimal('1000.00'),
+            roi_rate=Decimal('2.00'),
+            frequency='daily',
+            duration_days=30,
+            breakdown_window_days=10
+        )
+        with patch('app.referral.tasks.evaluate_referral_milestones.apply_async'):
+            for amount in (Decimal('1000.00'), Decimal('500.00')):
+                Investment.objects.create(
+                    user=self.users[2], plan=plan, amount=amount, currency='INR', start_date=timezone.now()
+                )
+
+    def _rollup(self):
+        return sorted(
+            ReferralEarningDaily.objects.values_list('user_id', 'level', 'earning_count', 'amount')
+        )
+
+    def test_rollup_maintained_on_insert(self):
+        """Test that credited bonuses land in one row per user, level and day."""
+        self.assertEqual(
+            self._rollup(),
+            sorted([
+                (self.users[1].id, 1, 2, Decimal('75.000000')),
+                (self.users[0].id, 2, 2, Decimal('45.000000')),
+            ])
+        )
+
+        summary = ReferralService.get_referral_earnings_summary(self.users[1])
+        self.assertEqual(
+            summary['earnings_by_level'],
+            [{'level': 1, 'currency': 'INR', 'count': 2, 'amount': '75.000000'}]
+        )
+        self.assertEqual(summary['daily_earnings'][0]['day'], timezone.localdate())
+
+    def test_cancelled_earning_leaves_rollup(self):
+        """Test that cancelling a credited earning takes it off the rollup."""
+        earning = ReferralEarning.objects.filter(referral__user=self.users[0]).order_by('amount').first()
+        earning.status = 'cancelled'
+        earning.save(update_fields=['status'])
+
+        self.assertEqual(
+            ReferralEarningDaily.objects.get(user=self.users[0]).amount, Decimal('30.000000')
+        )
+
+    def test_backfill_command_rebuilds_rollup(self):
+        """Test that the backfill command reproduces the maintained rollup."""
+        expected = self._rollup()
+        ReferralEarningDaily.objects.all().delete()
+
+        call_command('backfill_referral_rollup', stdout=StringIO())
+        self.assertEqual(self._rollup(), expected)
+
+        call_command('backfill_referral_rollup', since=timezone.localdate().isoformat(), stdout=StringIO())
+        self.assertEqual(self._rollup(), expected)
+
+
+class BulkOnboardingTestCase(TestCase):
+    """Test cases for bulk user onboarding with referral chains."""
+
+    def setUp(self):
+        """Set up an existing referrer."""
+        self.config = ReferralConfigFactory(max_levels=3, is_active=True)
+        self.root = UserFactory()
+        self.root_code = self.root.referral_profile.referral_code
+
+    def test_bulk_onboard_builds_chains_in_topological_order(self):
+        """Test that in-batch referrers are placed before the users they referred."""
+        rows = [
+            # Listed before its referrer on purpose
+            {'email': 'grandchild@example.com', 'referrer_code': 'BATCHB'},
+            {'email': 'child@example.com', 'referral_code': 'BATCHB', 'referrer_code': 'BATCHA'},
+            {'email': 'parent@example.com', 'referral_code': 'BATCHA', 'referrer_code': self.root_code},
+            {'email': 'orphan@example.com', 'referrer_code': 'NOSUCHCODE', 'password': 'Secret123!'},
+            {'email': 'parent@example.com'},
+            {'email': self.root.email},
+        ]
+        with patch('app.referral.tasks.evaluate_referral_milestones.apply_async'):
+            result = ReferralService.bulk_onboard_users(rows)
+
+        self.assertEqual(result['created_count'], 4)
+        self.assertEqual(result['referral_count'], 6)
+        self.assertEqual(
+            [(row['line'], row['reason']) for row in result['skipped']],
+            [(5, 'duplicate user in batch'), (6, 'user already exists')]
+        )
+
+        grandchild = User.objects.get(email='grandchild@example.com')
+        self.assertEqual(
+            [ancestor.email for ancestor in ReferralService.get_ancestors(grandchild)],
+            ['child@example.com', 'parent@example.com', self.root.email]
+        )
+        self.assertEqual(
+            sorted(Referral.objects.filter(referred_user=grandchild).values_list('level', 'user__email')),
+            [(1, 'child@example.com'), (2, 'parent@example.com'), (3, self.root.email)]
+        )
+        self.assertEqual(grandchild.referral_profile.referral_depth, 3)
+        self.assertFalse(grandchild.has_usable_password())
+        self.assertTrue(grandchild.inr_wallet)
+        self.assertTrue(grandchild.usdt_wallet)
+        self.assertEqual(grandchild.wallet_addresses.count(), 1)
+
+        orphan = User.objects.get(email='orphan@example.com')
+        self.assertIsNone(orphan.referral_profile.referred_by)
+        self.assertTrue(orphan.check_password('Secret123!'))
+
+        self.root.referral_profile.refresh_from_db()
+        self.assertEqual(self.root.referral_profile.total_referrals, 3)
+        self.assertEqual(ReferralService.reconcile_referral_stats(fix=False)['drift_count'], 0)
+
+    def test_bulk_onboard_breaks_referral_cycles(self):
+        """Test that a referral cycle inside the batch is broken instead of looping."""
+        rows = [
+            {'email': 'a@example.com', 'referral_code': 'CYCLEA', 'referrer_code': 'CYCLEB'},
+            {'email': 'b@example.com', 'referral_code': 'CYCLEB', 'referrer_code': 'CYCLEA'},
+        ]
+        with patch('app.referral.tasks.evaluate_referral_milestones.apply_async'):
+            result = ReferralService.bulk_onboard_users(rows)
+
+        self.assertEqual(result['created_count'], 2)
+        self.assertEqual(result['referral_count'], 1)
+        self.assertEqual(Referral.objects.filter(level=1).count(), 1)
+
+
+class ReferralGraphExportTestCase(TestCase):
+    """Test cases for the binary referral graph export and loader."""
+
+    def setUp(self):
+        """Set up a small tree: root with two children, one of them with a child."""
+        self.config = ReferralConfigFactory(max_levels=3, is_active=True)
+        self.root, self.left, self.right, self.leaf, self.loner = [UserFactory() for _ in range(5)]
+        for user, referrer in ((self.left, self.root), (self.right, self.root), (self.leaf, self.left)):
+            ReferralService.create_referral_chain(user, referrer.referral_profile.referral_code)
+        UserReferralProfile.objects.filter(user=self.leaf).update(total_invested_inr=Decimal('1500.00'))
+
+    def test_export_and_load_graph(self):
+        """Test that the exported graph round-trips through the memory-mapped loader."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'referrals.graph')
+        call_command('export_referral_graph', path, chunk_size=2, stdout=StringIO())
+
+        with ReferralGraph(path) as graph:
+            self.assertEqual(len(graph), 5)
+            self.assertEqual(graph.edge_count, 3)
+
+            root, left, right, leaf, loner = (
+                graph.index_of(user.id) for user in (self.root, self.left, self.right, self.leaf, self.loner)
+            )
+            self.assertEqual(graph.user_id(leaf), self.leaf.id)
+            self.assertEqual(graph.parents[leaf], left)
+            self.assertEqual(graph.parents[root], -1)
+            self.assertEqual(sorted(graph.get_children(root)), sorted([left, right]))
+            self.assertEqual(graph.invested_inr[leaf], 1500.0)
+            self.assertEqual(graph.joined[leaf], int(self.leaf.date_joined.timestamp()))
 
+            sizes = graph.get_downline_sizes()
+            self.assertEqual((sizes[root], sizes[left], sizes[right], sizes[loner]), (3, 1, 0, 0))
+            self.assertEqual(graph.get_depth_distribution(), {0: 2, 1: 2, 2: 1})
@@ -8,6 +8,7 @@ app_name = 'referral'
 user_patterns = [
     path('profile/', views.ReferralProfileView.as_view({'get': 'list'}), name='profile'),
     path('tree/', views.ReferralTreeView.as_view({'get': 'tree'}), name='tree'),
+    path('tree/nodes/', views.ReferralTreeView.as_view({'get': 'nodes'}), name='tree-nodes'),
     path('earnings/', views.ReferralEarningsView.as_view({'get': 'list'}), name='earnings'),
     path('earnings-summary/', views.ReferralEarningsSummaryView.as_view({'get': 'summary'}), name='earnings-summary'),
     path('validate-code/', views.ValidateReferralCodeView.as_view({'post': 'validate'}), name='validate-code'),
@@ -86,6 +86,22 @@ class ReferralTreeView(viewsets.ReadOnlyModelViewSet):
         
         tree_data = ReferralService.get_user_referral_tree(user, max_levels)
         return Response(tree_data)
+    
+    @action(detail=False, methods=['get'])
+    def nodes(self, request):
+        """Get one page of a node's direct referrals, for lazy tree expansion."""
+        config = ReferralConfig.get_active_config()
+        try:
+            level = ReferralService.get_referral_tree_level(
+                request.user,
+                parent_user_id=request.query_params.get('parent_id'),
+                cursor=request.query_params.get('cursor'),
+                page_size=int(request.query_params.get('page_size', ReferralService.TREE_PAGE_SIZE)),
+                max_depth=config.max_levels if config else 3
+            )
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(level)
 
 
 class ReferralEarningsView(viewsets.ReadOnlyModelViewSet):
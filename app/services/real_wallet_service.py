@@ -1,37 +1,65 @@
-import os
-import json
 import base64
+import logging
 from decimal import Decimal
-from typing import Dict, Optional, Tuple
+from typing import Dict, List
 from cryptography.fernet import Fernet
 from eth_account import Account
 from web3 import Web3
-from web3.exceptions import TransactionNotFound
+from eth_utils import is_address
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from decouple import config
 
-from app.wallet.models import USDTWallet, USDTDepositRequest, SweepLog, WalletTransaction
+from app.wallet.models import (
+    USDTWallet, USDTDepositRequest, SweepLog, MoralisWebhookEvent
+)
+from app.wallet.services import WalletLedgerService
+from app.wallet import address_index
+from app.services import rpc
+
+logger = logging.getLogger(__name__)
 
 
 class RealWalletService:
     """Service for managing real EVM wallets and blockchain operations."""
     
+    # Moralis chain names mapped to our chain types
+    MORALIS_CHAINS = {
+        'eth': 'erc20',
+        'ethereum': 'erc20',
+        'mainnet': 'erc20',
+        'bsc': 'bep20',
+        'binance': 'bep20',
+        'bsc-mainnet': 'bep20',
+    }
+    
+    # Moralis stream chain ids mapped to the chain names above
+    MORALIS_CHAIN_IDS = {
+        '0x1': 'eth',
+        '0x38': 'bsc',
+    }
+    
+    # keccak256('Transfer(address,address,uint256)')
+    TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+    
+    # Decimals of each chain's USDT contract, for transfers whose payload does not say
+    USDT_DECIMALS = {
+        'erc20': 6,
+        'bep20': 18,
+    }
+    
     def __init__(self):
         self.encryption_key = config('WALLET_ENCRYPTION_KEY', default='your_secure_encryption_key_here_32_chars_long')
         self.fernet = Fernet(base64.urlsafe_b64encode(self.encryption_key.encode()[:32].ljust(32, b'0')))
         
-        # Web3 connections
-        self.eth_w3 = Web3(Web3.HTTPProvider(config('ETHEREUM_RPC_URL', default='https://eth-mainnet.alchemyapi.io/v2/YOUR_ALCHEMY_KEY')))
-        self.bsc_w3 = Web3(Web3.HTTPProvider(config('BSC_RPC_URL', default='https://bsc-dataseed.binance.org/')))
-        
         # Master wallet addresses
         self.master_wallet_eth = config('MASTER_WALLET_ETH', default='0x742d35Cc6634C0532925a3b8D404d1deBa4Cb61f')
         self.master_wallet_bsc = config('MASTER_WALLET_BSC', default='0x742d35Cc6634C0532925a3b8D404d1deBa4Cb61f')
         
         # USDT token addresses
-        self.usdt_eth_address = config('USDT_ETH_ADDRESS', default='0xdAC17F958D2ee523a2206206994597C13D831ec7')
-        self.usdt_bsc_address = config('USDT_BSC_ADDRESS', default='0x55d398326f99059fF775485246999027B3197955')
+        self.usdt_eth_address = rpc.get_usdt_address('erc20')
+        self.usdt_bsc_address = rpc.get_usdt_address('bep20')
         
         # Gas settings
         try:
@@ -81,141 +109,414 @@ class RealWalletService:
         except Exception as e:
             raise ValueError(f"Failed to decrypt private key: {str(e)}")
     
+    @property
+    def eth_w3(self) -> Web3:
+        return rpc.get_web3('erc20')
+    
+    @property
+    def bsc_w3(self) -> Web3:
+        return rpc.get_web3('bep20')
+    
     def get_web3_connection(self, chain_type: str) -> Web3:
-        """Get Web3 connection for the specified chain."""
-        if chain_type == 'erc20':
-            return self.eth_w3
-        elif chain_type == 'bep20':
-            return self.bsc_w3
-        else:
-            raise ValueError(f"Unsupported chain type: {chain_type}")
+        """Get the shared Web3 connection for the specified chain."""
+        return rpc.get_web3(chain_type)
     
     def get_usdt_contract(self, chain_type: str):
-        """Get USDT contract for the specified chain."""
-        w3 = self.get_web3_connection(chain_type)
-        
-        if chain_type == 'erc20':
-            contract_address = self.usdt_eth_address
-        elif chain_type == 'bep20':
-            contract_address = self.usdt_bsc_address
-        else:
-            raise ValueError(f"Unsupported chain type: {chain_type}")
-        
-        # USDT ERC20 ABI (minimal for transfer)
-        abi = [
-            {
-                "constant": False,
-                "inputs": [
-                    {"name": "_to", "type": "address"},
-                    {"name": "_value", "type": "uint256"}
-                ],
-                "name": "transfer",
-                "outputs": [{"name": "", "type": "bool"}],
-                "payable": False,
-                "stateMutability": "nonpayable",
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [{"name": "_owner", "type": "address"}],
-                "name": "balanceOf",
-                "outputs": [{"name": "balance", "type": "uint256"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "decimals",
-                "outputs": [{"name": "", "type": "uint8"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
+        """Get the shared USDT contract for the specified chain."""
+        return rpc.get_usdt_contract(chain_type)
+    
+    def parse_moralis_transfer(self, webhook_data: Dict) -> Dict:
+        """Validate a flat Moralis USDT transfer and map its chain to our chain types."""
+        to_address = (webhook_data.get('to') or '').lower()
+        from_address = (webhook_data.get('from') or '').lower()
+        transaction_hash = webhook_data.get('hash') or ''
+        chain = (webhook_data.get('chain') or '').lower()
+        
+        chain_type = self.MORALIS_CHAINS.get(chain)
+        if chain_type is None:
+            return {'success': False, 'error': f'Unsupported chain: {chain}'}
+        if not transaction_hash:
+            return {'success': False, 'error': 'Missing transaction hash'}
+        if not to_address:
+            return {'success': False, 'error': 'Missing recipient address'}
+        try:
+            value = int(webhook_data.get('value', '0'))
+            decimals = int(webhook_data.get('decimals') or self.USDT_DECIMALS[chain_type])
+        except (TypeError, ValueError):
+            return {'success': False, 'error': 'Invalid transfer value'}
+        if value <= 0:
+            return {'success': False, 'error': 'Invalid transfer value'}
+        log_index = webhook_data.get('log_index', webhook_data.get('logIndex'))
+        try:
+            log_index = -1 if log_index in (None, '') else int(log_index)
+        except (TypeError, ValueError):
+            return {'success': False, 'error': 'Invalid log index'}
+        
+        return {
+            'success': True,
+            'to_address': to_address,
+            'from_address': from_address,
+            'value': value,
+            'decimals': decimals,
+            'transaction_hash': transaction_hash,
+            'log_index': log_index,
+            'chain_type': chain_type,
+        }
+    
+    def parse_moralis_stream(self, webhook_data: Dict) -> Dict:
+        """
+        Extract the USDT transfers of a Moralis stream payload as flat transfers.
+        
+        Transfers come from the decoded erc20Transfers and from raw Transfer
+        logs that were not decoded; only transfers of the chain's USDT contract
+        are kept. Unconfirmed deliveries carry no transfers, since Moralis
+        sends every block again once it is confirmed.
+        
+        Returns:
+            Dict: success and a list of flat transfer dicts, or an error
+        """
+        chain = self.MORALIS_CHAIN_IDS.get(str(webhook_data.get('chainId', '')).lower())
+        if chain is None:
+            return {'success': False, 'error': f"Unsupported chain: {webhook_data.get('chainId')}"}
+        if not webhook_data.get('confirmed'):
+            return {'success': True, 'transfers': []}
+        
+        chain_type = self.MORALIS_CHAINS[chain]
+        usdt_address = (self.usdt_eth_address if chain_type == 'erc20' else self.usdt_bsc_address).lower()
+        block_number = (webhook_data.get('block') or {}).get('number')
+        transfers = {}
+        for item in webhook_data.get('erc20Transfers') or []:
+            if (item.get('contract') or '').lower() != usdt_address:
+                continue
+            key = (item.get('transactionHash'), str(item.get('logIndex')))
+            transfers[key] = {
+                'to': item.get('to'),
+                'from': item.get('from'),
+                'value': item.get('value'),
+                'decimals': item.get('tokenDecimals') or self.USDT_DECIMALS[chain_type],
+                'hash': item.get('transactionHash'),
+                'log_index': item.get('logIndex'),
+                'block_number': block_number,
+                'chain': chain,
+            }
+        for log in webhook_data.get('logs') or []:
+            key = (log.get('transactionHash'), str(log.get('logIndex')))
+            if (
+                key in transfers
+                or (log.get('address') or '').lower() != usdt_address
+                or (log.get('topic0') or '').lower() != self.TRANSFER_TOPIC
+                or not log.get('topic1') or not log.get('topic2')
+            ):
+                continue
+            try:
+                value = int(log.get('data') or '0x0', 16)
+            except ValueError:
+                continue
+            transfers[key] = {
+                # Indexed address topics are left-padded to 32 bytes
+                'to': '0x' + log['topic2'][-40:],
+                'from': '0x' + log['topic1'][-40:],
+                'value': str(value),
+                'decimals': self.USDT_DECIMALS[chain_type],
+                'hash': log.get('transactionHash'),
+                'log_index': log.get('logIndex'),
+                'block_number': block_number,
+                'chain': chain,
             }
-        ]
+        return {'success': True, 'transfers': list(transfers.values())}
+    
+    def parse_moralis_webhook(self, webhook_data: Dict) -> Dict:
+        """Split a webhook, flat or stream, into validated flat transfers."""
+        if not isinstance(webhook_data, dict):
+            return {'success': False, 'error': 'Invalid webhook payload'}
+        if 'chainId' not in webhook_data:
+            transfer = self.parse_moralis_transfer(webhook_data)
+            if not transfer['success']:
+                return transfer
+            return {'success': True, 'transfers': [webhook_data]}
+        return self.parse_moralis_stream(webhook_data)
+    
+    def enqueue_moralis_webhook(self, webhook_data: Dict) -> Dict:
+        """
+        Validate a Moralis webhook and store its transfers in the inbox for the consumer.
+        
+        Transfers the deposit address index rules out are dropped (when its
+        cache is process-local nothing is ruled out, so a stale filter never
+        loses a deposit); the rest are stored with one INSERT ... ON CONFLICT
+        DO NOTHING on the transaction hash and log index, so repeated
+        deliveries are harmless while every transfer of a transaction is kept.
+        """
+        parsed = self.parse_moralis_webhook(webhook_data)
+        if not parsed['success']:
+            return parsed
+        
+        transfers = []
+        for raw_transfer in parsed['transfers']:
+            transfer = self.parse_moralis_transfer(raw_transfer)
+            if transfer['success']:
+                transfers.append((transfer, raw_transfer))
         
-        return w3.eth.contract(address=contract_address, abi=abi)
+        # Drop the transfers to addresses that are certainly not ours before touching the database
+        candidates = {
+            chain_type: address_index.filter_candidates(
+                chain_type, [transfer['to_address'] for transfer, _ in transfers if transfer['chain_type'] == chain_type]
+            )
+            for chain_type in {transfer['chain_type'] for transfer, _ in transfers}
+        }
+        events = []
+        for transfer, raw_transfer in transfers:
+            if transfer['to_address'] in candidates[transfer['chain_type']]:
+                events.append(MoralisWebhookEvent(
+                    transaction_hash=transfer['transaction_hash'],
+                    log_index=transfer['log_index'],
+                    chain_type=transfer['chain_type'],
+                    payload=raw_transfer
+                ))
+        if events:
+            MoralisWebhookEvent.objects.bulk_create(events, ignore_conflicts=True)
+            transaction.on_commit(self._schedule_inbox_drain)
+        
+        return {'success': True, 'transfer_count': len(events)}
     
-    def process_moralis_webhook(self, webhook_data: Dict) -> Dict:
-        """Process Moralis webhook for USDT deposits."""
+    def _schedule_inbox_drain(self) -> None:
+        """Queue one inbox drain for a burst of webhooks; the periodic run catches anything missed."""
+        from django.core.cache import cache
+        from app.wallet.tasks import process_moralis_webhook_inbox, MORALIS_INBOX_PENDING_KEY
+        
+        if not cache.add(MORALIS_INBOX_PENDING_KEY, True, 60):
+            return
         try:
-            # Extract data from Moralis webhook
-            to_address = webhook_data.get('to', '').lower()
-            from_address = webhook_data.get('from', '').lower()
-            value = webhook_data.get('value', '0')
-            transaction_hash = webhook_data.get('hash', '')
-            chain_type = webhook_data.get('chain', '').lower()
-            
-            # Map chain to our format
-            if chain_type in ['eth', 'ethereum', 'mainnet']:
-                chain_type = 'erc20'
-            elif chain_type in ['bsc', 'binance', 'bsc-mainnet']:
-                chain_type = 'bep20'
-            else:
-                return {'success': False, 'error': f'Unsupported chain: {chain_type}'}
-            
-            # Find user by wallet address
+            process_moralis_webhook_inbox.apply_async()
+        except Exception as e:
+            cache.delete(MORALIS_INBOX_PENDING_KEY)
+            logger.error(f"Could not queue Moralis inbox drain, leaving it to the periodic run: {str(e)}")
+    
+    def process_webhook_inbox(self, batch_size: int = None) -> Dict:
+        """
+        Credit a batch of pending inbox events.
+        
+        Events are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several
+        consumers can drain the inbox side by side, and the whole batch is
+        credited set-based. If that raises, the events are credited one by one
+        so a bad event cannot hold the others back; an event that raises is
+        retried on a later run until it has used up MORALIS_INBOX_MAX_ATTEMPTS.
+        Sweeps are queued separately once the batch has committed.
+        
+        Returns:
+            Dict: Number of events claimed and per outcome
+        """
+        batch_size = batch_size or getattr(settings, 'MORALIS_INBOX_BATCH_SIZE', 200)
+        max_attempts = getattr(settings, 'MORALIS_INBOX_MAX_ATTEMPTS', 5)
+        counts = {'claimed': 0, 'processed': 0, 'ignored': 0, 'retrying': 0, 'failed': 0}
+        
+        with transaction.atomic():
+            events = list(
+                MoralisWebhookEvent.objects.select_for_update(skip_locked=True).filter(
+                    status='pending'
+                ).order_by('created_at')[:batch_size]
+            )
             try:
-                usdt_wallet = USDTWallet.objects.get(
-                    wallet_address__iexact=to_address,
-                    chain_type=chain_type,
-                    is_real_wallet=True
-                )
-                user = usdt_wallet.user
-            except USDTWallet.DoesNotExist:
-                return {'success': False, 'error': f'No wallet found for address: {to_address}'}
-            
-            # Convert value from Wei to USDT (6 decimals)
-            usdt_amount = Decimal(value) / Decimal('1000000')  # USDT has 6 decimals
-            
-            # Check if deposit already exists
-            if USDTDepositRequest.objects.filter(transaction_hash=transaction_hash).exists():
-                return {'success': False, 'error': 'Deposit already processed'}
+                with transaction.atomic():
+                    results = self._credit_raw_transfers([event.payload for event in events])
+            except Exception:
+                results = []
+                for event in events:
+                    try:
+                        with transaction.atomic():
+                            results.extend(self._credit_raw_transfers([event.payload]))
+                    except Exception as e:
+                        results.append(e)
+            
+            now = timezone.now()
+            for event, result in zip(events, results):
+                event.attempts += 1
+                event.updated_at = now
+                if isinstance(result, Exception):
+                    event.status = 'failed' if event.attempts >= max_attempts else 'pending'
+                    event.error_message = str(result)
+                    counts['failed' if event.status == 'failed' else 'retrying'] += 1
+                    logger.error(f"Moralis event {event.transaction_hash}:{event.log_index} failed (attempt {event.attempts}): {str(result)}")
+                    continue
+                
+                event.processed_at = now
+                if result['success']:
+                    event.status = 'processed'
+                    event.error_message = None
+                    self.schedule_deposit_sweep(result['deposit'])
+                else:
+                    # Not ours or already credited: nothing to retry
+                    event.status = 'ignored'
+                    event.error_message = result['error']
+                counts[event.status] += 1
+            
+            MoralisWebhookEvent.objects.bulk_update(
+                events, ['status', 'attempts', 'error_message', 'processed_at', 'updated_at']
+            )
+        
+        counts['claimed'] = len(events)
+        return counts
+    
+    def process_moralis_webhook(self, webhook_data: Dict) -> Dict:
+        """Process a Moralis webhook, flat or stream, for USDT deposits synchronously."""
+        try:
+            parsed = self.parse_moralis_webhook(webhook_data)
+            if not parsed['success']:
+                return parsed
+            
+            results = self._credit_raw_transfers(parsed['transfers'])
+            for result in results:
+                deposit = result.pop('deposit', None)
+                if deposit is not None:
+                    self.schedule_deposit_sweep(deposit)
+            
+            if len(results) == 1:
+                return results[0]
+            return {
+                'success': True,
+                'credited_count': sum(1 for result in results if result['success']),
+                'results': results
+            }
             
-            # Create deposit request
-            deposit = USDTDepositRequest.objects.create(
-                user=user,
-                chain_type=chain_type,
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def _credit_raw_transfers(self, raw_transfers: List[Dict]) -> List[Dict]:
+        """Parse flat transfers and credit the valid ones; returns one result per transfer."""
+        results = [self.parse_moralis_transfer(raw_transfer) for raw_transfer in raw_transfers]
+        valid = [position for position, result in enumerate(results) if result['success']]
+        for position, result in zip(valid, self.credit_moralis_transfers([results[position] for position in valid])):
+            results[position] = result
+        return results
+    
+    def credit_moralis_transfer(self, transfer: Dict) -> Dict:
+        """Create the deposit for one parsed transfer and credit the user's wallet."""
+        return self.credit_moralis_transfers([transfer])[0]
+    
+    def credit_moralis_transfers(self, transfers: List[Dict]) -> List[Dict]:
+        """
+        Create the deposits for many parsed transfers and credit the users' wallets.
+        
+        The recipients are matched with one IN query, known transfers are
+        skipped with one more, and the deposits and ledger entries are
+        bulk-inserted, so a block of transfers costs a few queries in total.
+        A transfer is known by its transaction hash and log index; one
+        without a log index (-1) stands for its whole transaction.
+        
+        Returns:
+            List[Dict]: Per transfer, success and the deposit, or the reason it was skipped
+        """
+        if not transfers:
+            return []
+        
+        wallets = {
+            (wallet.chain_type, wallet.normalized_address): wallet
+            for wallet in USDTWallet.objects.filter(
+                normalized_address__in={transfer['to_address'] for transfer in transfers},
+                chain_type__in={transfer['chain_type'] for transfer in transfers},
+                is_real_wallet=True
+            ).only('id', 'user_id', 'chain_type', 'normalized_address')
+        }
+        known = set(
+            USDTDepositRequest.objects.filter(
+                transaction_hash__in={transfer['transaction_hash'] for transfer in transfers}
+            ).values_list('transaction_hash', 'log_index')
+        )
+        known_hashes = {transaction_hash for transaction_hash, _ in known}
+        
+        now = timezone.now()
+        results = []
+        deposits = []
+        for transfer in transfers:
+            transaction_hash = transfer['transaction_hash']
+            wallet = wallets.get((transfer['chain_type'], transfer['to_address']))
+            if wallet is None:
+                results.append({'success': False, 'error': f"No wallet found for address: {transfer['to_address']}"})
+                continue
+            log_index = transfer['log_index']
+            if (
+                (transaction_hash, log_index) in known
+                or (transaction_hash, -1) in known
+                or (log_index == -1 and transaction_hash in known_hashes)
+            ):
+                results.append({'success': False, 'error': 'Deposit already processed'})
+                continue
+            known.add((transaction_hash, log_index))
+            known_hashes.add(transaction_hash)
+            
+            # Convert the raw token value to USDT
+            usdt_amount = (Decimal(transfer['value']) / (Decimal(10) ** transfer['decimals'])).quantize(Decimal('0.000001'))
+            deposit = USDTDepositRequest(
+                user_id=wallet.user_id,
+                chain_type=transfer['chain_type'],
                 amount=usdt_amount,
                 transaction_hash=transaction_hash,
-                from_address=from_address,
-                to_address=to_address,
+                log_index=log_index,
+                from_address=transfer['from_address'],
+                to_address=transfer['to_address'],
                 status='confirmed',  # Moralis webhook means it's confirmed
-                processed_at=timezone.now()
-            )
-            
-            # Credit user's wallet
-            usdt_wallet.add_balance(usdt_amount)
-            
-            # Create transaction log
-            WalletTransaction.objects.create(
-                user=user,
-                transaction_type='usdt_deposit',
-                wallet_type='usdt',
-                chain_type=chain_type,
-                amount=usdt_amount,
-                balance_before=usdt_wallet.balance - usdt_amount,
-                balance_after=usdt_wallet.balance,
-                status='completed',
-                reference_id=transaction_hash,
-                description=f"USDT deposit from Moralis webhook - {chain_type.upper()} - TX: {transaction_hash[:10]}...",
-                metadata={'chain_type': chain_type, 'from_address': from_address}
+                processed_at=now
             )
-            
-            # Check if auto-sweep is needed
-            if usdt_amount <= self.auto_sweep_threshold:
-                self.auto_sweep_deposit(deposit)
-            
-            return {
+            deposits.append(deposit)
+            results.append({
                 'success': True,
+                'deposit': deposit,
                 'deposit_id': str(deposit.id),
                 'amount': str(usdt_amount),
-                'user_id': str(user.id)
-            }
-            
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
+                'user_id': str(wallet.user_id)
+            })
+        if not deposits:
+            return results
+        
+        with transaction.atomic():
+            USDTDepositRequest.objects.bulk_create(deposits, ignore_conflicts=True)
+            # A concurrent delivery of the same transfer may have won the unique hash and log index
+            inserted = set(
+                USDTDepositRequest.objects.filter(
+                    id__in=[deposit.id for deposit in deposits]
+                ).values_list('id', flat=True)
+            )
+            WalletLedgerService.credit_many([
+                (
+                    deposit.user_id, 'usdt', deposit.amount, 'usdt_deposit', deposit.transaction_hash,
+                    f"USDT deposit from Moralis webhook - {deposit.chain_type.upper()} - TX: {deposit.transaction_hash[:10]}...",
+                    {'chain_type': deposit.chain_type, 'from_address': deposit.from_address, 'log_index': deposit.log_index}
+                )
+                for deposit in deposits if deposit.id in inserted
+            ])
+        
+        for result in results:
+            if result['success'] and result['deposit'].id not in inserted:
+                result.clear()
+                result.update({'success': False, 'error': 'Deposit already processed'})
+        return results
+    
+    def schedule_deposit_sweep(self, deposit: USDTDepositRequest) -> None:
+        """
+        Queue a batched sweep of the deposit's chain once the credit has committed.
+        
+        At most one sweep per chain is queued per SWEEP_BATCH_DELAY window, so
+        the deposits of a burst are swept together (see app.services.sweeper).
+        """
+        if deposit.amount > self.auto_sweep_threshold:
+            return
+        
+        chain_type = deposit.chain_type
+        
+        def _queue():
+            from django.core.cache import cache
+            from app.wallet.tasks import sweep_confirmed_deposits, SWEEP_PENDING_KEY
+            
+            delay = getattr(settings, 'SWEEP_BATCH_DELAY', 30)
+            key = SWEEP_PENDING_KEY.format(chain_type=chain_type)
+            if not cache.add(key, True, delay * 2):
+                return
+            try:
+                sweep_confirmed_deposits.apply_async(args=[chain_type], countdown=delay)
+            except Exception as e:
+                cache.delete(key)
+                logger.error(f"Could not queue {chain_type} sweep, leaving it to the periodic run: {str(e)}")
+        
+        transaction.on_commit(_queue)
     
     def auto_sweep_deposit(self, deposit: USDTDepositRequest) -> Dict:
         """Automatically sweep deposit to master wallet."""
@@ -240,9 +541,9 @@ class RealWalletService:
                 deposit.sweep_type = 'auto'
                 deposit.save()
                 
-                # Update wallet
+                # Update wallet; a full save would write back a stale balance
                 usdt_wallet.last_sweep_at = timezone.now()
-                usdt_wallet.save()
+                usdt_wallet.save(update_fields=['last_sweep_at', 'updated_at'])
             
             return sweep_result
             
@@ -251,7 +552,15 @@ class RealWalletService:
     
     def sweep_to_master_wallet(self, user, amount: Decimal, chain_type: str, 
                               private_key: str, sweep_type: str = 'manual') -> Dict:
-        """Sweep USDT from user wallet to master wallet."""
+        """
+        Sweep USDT from user wallet to master wallet.
+        
+        A sweep only moves on-chain custody, as in the batched sweeper: the
+        user's internal balance was credited when the deposit was confirmed
+        and is left alone. A pending sweep log with the transaction hash is
+        committed before anything is broadcast, then marked completed or
+        failed.
+        """
         try:
             w3 = self.get_web3_connection(chain_type)
             usdt_contract = self.get_usdt_contract(chain_type)
@@ -262,8 +571,8 @@ class RealWalletService:
             # Get master wallet address
             master_wallet = self.master_wallet_eth if chain_type == 'erc20' else self.master_wallet_bsc
             
-            # Convert amount to Wei (6 decimals for USDT)
-            amount_wei = int(amount * 1000000)
+            # Convert amount to the token's smallest unit
+            amount_wei = int(amount * Decimal(10) ** rpc.get_token_decimals(chain_type))
             
             # Get nonce
             nonce = w3.eth.get_transaction_count(account.address)
@@ -275,7 +584,7 @@ class RealWalletService:
             gas_limit = self.gas_limit_erc20 if chain_type == 'erc20' else self.gas_limit_bep20
             
             # Build transaction
-            transaction = usdt_contract.functions.transfer(
+            transfer = usdt_contract.functions.transfer(
                 master_wallet,
                 amount_wei
             ).build_transaction({
@@ -285,17 +594,18 @@ class RealWalletService:
                 'nonce': nonce,
             })
             
-            # Sign transaction
-            signed_txn = w3.eth.account.sign_transaction(transaction, private_key)
-            
-            # Send transaction
-            tx_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-            tx_hash_hex = tx_hash.hex()
+            # Sign transaction; its hash is known before it is sent
+            signed_txn = w3.eth.account.sign_transaction(transfer, private_key)
+            tx_hash_hex = Web3.to_hex(signed_txn.hash)
             
             # Calculate gas fee
             gas_fee = Decimal(gas_price * gas_limit) / Decimal('1000000000000000000')  # Convert from Wei to ETH/BNB
-            
-            # Create sweep log
+        except Exception as e:
+            self._log_failed_sweep(user, chain_type, locals().get('account'), locals().get('master_wallet'),
+                                   amount, sweep_type, e)
+            return {'success': False, 'error': str(e)}
+        
+        try:
             sweep_log = SweepLog.objects.create(
                 user=user,
                 chain_type=chain_type,
@@ -305,100 +615,122 @@ class RealWalletService:
                 gas_fee=gas_fee,
                 transaction_hash=tx_hash_hex,
                 sweep_type=sweep_type,
-                status='completed',
+                status='pending',
                 initiated_by=user if sweep_type == 'auto' else None
             )
-            
-            # Create transaction log
-            WalletTransaction.objects.create(
-                user=user,
-                transaction_type='sweep',
-                wallet_type='usdt',
-                chain_type=chain_type,
-                amount=amount,
-                balance_before=user.usdt_wallet.balance,
-                balance_after=user.usdt_wallet.balance - amount,
-                status='completed',
-                reference_id=tx_hash_hex,
-                description=f"USDT sweep to master wallet - {chain_type.upper()} - TX: {tx_hash_hex[:10]}...",
-                metadata={'sweep_type': sweep_type, 'gas_fee': str(gas_fee)}
-            )
-            
-            # Deduct from user's wallet
-            user.usdt_wallet.deduct_balance(amount)
-            
-            return {
-                'success': True,
-                'tx_hash': tx_hash_hex,
-                'gas_fee': str(gas_fee),
-                'sweep_log_id': str(sweep_log.id)
-            }
-            
         except Exception as e:
-            # Log failed sweep
-            SweepLog.objects.create(
-                user=user,
-                chain_type=chain_type,
-                from_address=account.address if 'account' in locals() else '',
-                to_address=master_wallet if 'master_wallet' in locals() else '',
-                amount=amount,
-                sweep_type=sweep_type,
-                status='failed',
-                error_message=str(e),
-                initiated_by=user if sweep_type == 'auto' else None
+            return {'success': False, 'error': str(e)}
+        
+        try:
+            w3.eth.send_raw_transaction(signed_txn.rawTransaction)
+        except Exception as e:
+            SweepLog.objects.filter(id=sweep_log.id).update(
+                status='failed', gas_fee=Decimal('0'), error_message=str(e), updated_at=timezone.now()
             )
-            
             return {'success': False, 'error': str(e)}
+        
+        SweepLog.objects.filter(id=sweep_log.id).update(status='completed', updated_at=timezone.now())
+        
+        return {
+            'success': True,
+            'tx_hash': tx_hash_hex,
+            'gas_fee': str(gas_fee),
+            'sweep_log_id': str(sweep_log.id)
+        }
+    
+    def _log_failed_sweep(self, user, chain_type, account, master_wallet, amount, sweep_type, error) -> None:
+        """Log a sweep that failed before anything was broadcast."""
+        SweepLog.objects.create(
+            user=user,
+            chain_type=chain_type,
+            from_address=account.address if account else '',
+            to_address=master_wallet or '',
+            amount=amount,
+            sweep_type=sweep_type,
+            status='failed',
+            error_message=str(error),
+            initiated_by=user if sweep_type == 'auto' else None
+        )
     
     def get_wallet_balance(self, address: str, chain_type: str) -> Dict:
         """Get USDT balance for a wallet address."""
+        result = self.get_wallet_balances([address], chain_type)
+        if not result['success']:
+            return result
+        if address in result['errors']:
+            return {'success': False, 'error': result['errors'][address]}
+        
+        return {
+            'success': True,
+            'balance': result['balances'][address],
+            'address': address,
+            'chain_type': chain_type
+        }
+    
+    def get_wallet_balances(self, addresses: List[str], chain_type: str) -> Dict:
+        """
+        Get the USDT balances of many wallet addresses in batched RPC round trips.
+        
+        Args:
+            addresses: Wallet addresses
+            chain_type: 'erc20' or 'bep20'
+            
+        Returns:
+            Dict: Balances by address, and the error of each address that could not be read
+        """
+        valid = [address for address in addresses if is_address(address)]
+        errors = {address: 'Invalid address' for address in addresses if not is_address(address)}
         try:
-            w3 = self.get_web3_connection(chain_type)
-            usdt_contract = self.get_usdt_contract(chain_type)
-            
-            balance_wei = usdt_contract.functions.balanceOf(address).call()
-            balance_usdt = Decimal(balance_wei) / Decimal('1000000')  # Convert from Wei
-            
-            return {
-                'success': True,
-                'balance': str(balance_usdt),
-                'address': address,
-                'chain_type': chain_type
-            }
-            
+            unit = Decimal(10) ** rpc.get_token_decimals(chain_type)
+            raw_balances = rpc.RPCClient(chain_type).get_token_balances(valid)
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        
+        balances = {}
+        for address, raw_balance in zip(valid, raw_balances):
+            if isinstance(raw_balance, rpc.RPCError):
+                errors[address] = str(raw_balance)
+            else:
+                balances[address] = str(Decimal(raw_balance) / unit)
+        
+        return {'success': True, 'chain_type': chain_type, 'balances': balances, 'errors': errors}
     
     def get_transaction_status(self, tx_hash: str, chain_type: str) -> Dict:
         """Get transaction status and confirmations."""
+        result = self.get_transaction_statuses([tx_hash], chain_type)
+        if not result['success']:
+            return result
+        return result['statuses'][tx_hash]
+    
+    def get_transaction_statuses(self, tx_hashes: List[str], chain_type: str) -> Dict:
+        """
+        Get the status and confirmations of many transactions in batched RPC round trips.
+        
+        Returns:
+            Dict: Per transaction hash, the dict get_transaction_status returns
+        """
         try:
-            w3 = self.get_web3_connection(chain_type)
-            
-            # Get transaction receipt
-            receipt = w3.eth.get_transaction_receipt(tx_hash)
-            
-            if receipt is None:
-                return {'success': False, 'error': 'Transaction not found'}
-            
-            # Get current block number
-            current_block = w3.eth.block_number
-            
-            # Calculate confirmations
-            confirmations = current_block - receipt.blockNumber
-            
-            return {
-                'success': True,
-                'status': 'success' if receipt.status == 1 else 'failed',
-                'confirmations': confirmations,
-                'block_number': receipt.blockNumber,
-                'gas_used': receipt.gasUsed,
-                'effective_gas_price': receipt.effectiveGasPrice
-            }
-            
-        except TransactionNotFound:
-            return {'success': False, 'error': 'Transaction not found'}
+            current_block, receipts = rpc.RPCClient(chain_type).get_transaction_receipts(tx_hashes)
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        
+        statuses = {}
+        for tx_hash, receipt in zip(tx_hashes, receipts):
+            if isinstance(receipt, rpc.RPCError):
+                statuses[tx_hash] = {'success': False, 'error': str(receipt)}
+            elif receipt is None:
+                statuses[tx_hash] = {'success': False, 'error': 'Transaction not found'}
+            else:
+                statuses[tx_hash] = {
+                    'success': True,
+                    'status': 'success' if receipt['status'] == 1 else 'failed',
+                    'confirmations': current_block - receipt['blockNumber'],
+                    'block_number': receipt['blockNumber'],
+                    'gas_used': receipt['gasUsed'],
+                    'effective_gas_price': receipt.get('effectiveGasPrice')
+                }
+        
+        return {'success': True, 'chain_type': chain_type, 'statuses': statuses}
 
 
 # Global instance
@@ -0,0 +1,348 @@
+"""
+Shared JSON-RPC layer for the chains we hold USDT on.
+
+Every process keeps one requests session whose connection pool keeps the
+HTTP connections to the nodes alive, and caches one Web3 object and one USDT
+contract object per node, so no call pays for a new TCP/TLS handshake or for
+rebuilding the contract. Token decimals never change and are read from the
+node once, then kept in process memory and the shared cache.
+
+RPCClient and AsyncRPCClient send many calls as JSON-RPC batch requests of
+RPC_BATCH_SIZE calls each: reading 1,000 balances or receipts costs ten HTTP
+round trips instead of a thousand. AsyncRPCClient sends the batches of one
+request concurrently, RPC_ASYNC_CONCURRENCY at a time, for asyncio callers.
+"""
+import asyncio
+import itertools
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+import requests
+from decouple import config
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+
+# Settings holding each chain's node URL, with their defaults
+RPC_URLS = {
+    'erc20': ('ETHEREUM_RPC_URL', 'https://eth-mainnet.alchemyapi.io/v2/YOUR_ALCHEMY_KEY'),
+    'bep20': ('BSC_RPC_URL', 'https://bsc-dataseed.binance.org/'),
+}
+
+USDT_ADDRESSES = {
+    'erc20': ('USDT_ETH_ADDRESS', '0xdAC17F958D2ee523a2206206994597C13D831ec7'),
+    'bep20': ('USDT_BSC_ADDRESS', '0x55d398326f99059fF775485246999027B3197955'),
+}
+
+# USDT ABI (minimal for transfers and balances)
+USDT_ABI = [
+    {
+        "constant": False,
+        "inputs": [
+            {"name": "_to", "type": "address"},
+            {"name": "_value", "type": "uint256"}
+        ],
+        "name": "transfer",
+        "outputs": [{"name": "", "type": "bool"}],
+        "payable": False,
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [{"name": "_owner", "type": "address"}],
+        "name": "balanceOf",
+        "outputs": [{"name": "balance", "type": "uint256"}],
+        "payable": False,
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "decimals",
+        "outputs": [{"name": "", "type": "uint8"}],
+        "payable": False,
+        "stateMutability": "view",
+        "type": "function"
+    }
+]
+
+# ERC20 balanceOf(address)
+BALANCE_OF_SELECTOR = '70a08231'
+
+_lock = threading.Lock()
+_session = None
+_web3 = {}
+_contracts = {}
+_decimals = {}
+
+
+def _reset_after_fork():
+    """Drop the pooled connections inherited from the parent, e.g. in Celery prefork workers."""
+    global _session, _lock
+    _lock = threading.Lock()
+    _session = None
+    _web3.clear()
+    _contracts.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class RPCError(Exception):
+    """Error object returned by a node for one JSON-RPC call."""
+
+    def __init__(self, message: str, code: int = None):
+        super().__init__(message)
+        self.code = code
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def get_rpc_url(chain_type: str) -> str:
+    """Get the node URL of a chain."""
+    if chain_type not in RPC_URLS:
+        raise ValueError(f"Unsupported chain type: {chain_type}")
+    name, default = RPC_URLS[chain_type]
+    return getattr(settings, name, None) or config(name, default=default)
+
+
+def get_usdt_address(chain_type: str) -> str:
+    """Get the USDT contract address of a chain."""
+    if chain_type not in USDT_ADDRESSES:
+        raise ValueError(f"Unsupported chain type: {chain_type}")
+    name, default = USDT_ADDRESSES[chain_type]
+    return config(name, default=default)
+
+
+def get_session() -> requests.Session:
+    """Get the process-wide HTTP session, whose pool keeps node connections alive."""
+    global _session
+    with _lock:
+        if _session is None:
+            pool_size = _setting('RPC_POOL_SIZE', 20)
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=len(RPC_URLS), pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def get_web3(chain_type: str) -> Web3:
+    """Get the shared Web3 connection of a chain, built on the pooled session."""
+    url = get_rpc_url(chain_type)
+    with _lock:
+        w3 = _web3.get(url)
+    if w3 is None:
+        provider = Web3.HTTPProvider(
+            url, request_kwargs={'timeout': _setting('RPC_TIMEOUT', 10)}, session=get_session()
+        )
+        with _lock:
+            w3 = _web3.setdefault(url, Web3(provider))
+    return w3
+
+
+def get_usdt_contract(chain_type: str):
+    """Get the shared USDT contract object of a chain."""
+    key = (get_rpc_url(chain_type), get_usdt_address(chain_type))
+    with _lock:
+        contract = _contracts.get(key)
+    if contract is None:
+        contract = get_web3(chain_type).eth.contract(address=key[1], abi=USDT_ABI)
+        with _lock:
+            contract = _contracts.setdefault(key, contract)
+    return contract
+
+
+def get_token_decimals(chain_type: str) -> int:
+    """Get the decimals of a chain's USDT contract, reading the node only once."""
+    address = get_usdt_address(chain_type).lower()
+    decimals = _decimals.get(address)
+    if decimals is None:
+        cache_key = f'wallet:rpc:{chain_type}:{address}:decimals'
+        decimals = cache.get(cache_key)
+        if decimals is None:
+            decimals = get_usdt_contract(chain_type).functions.decimals().call()
+            cache.set(cache_key, decimals, None)
+        _decimals[address] = decimals
+    return decimals
+
+
+def encode_balance_of(token_address: str, address: str) -> List:
+    """Build the eth_call params of an ERC20 balanceOf."""
+    return [
+        {'to': token_address, 'data': '0x' + BALANCE_OF_SELECTOR + address.lower()[2:].rjust(64, '0')},
+        'latest'
+    ]
+
+
+def decode_receipt(receipt: Optional[Dict]) -> Optional[Dict]:
+    """Turn the hex quantities of a raw receipt we use into ints."""
+    if receipt is None:
+        return None
+    decoded = dict(receipt)
+    for field in ('status', 'blockNumber', 'gasUsed', 'effectiveGasPrice'):
+        if decoded.get(field) is not None:
+            decoded[field] = int(decoded[field], 16)
+    return decoded
+
+
+class BaseRPCClient:
+    """Request building and response matching shared by the sync and async clients."""
+
+    def __init__(self, chain_type: str, url: str = None, batch_size: int = None):
+        self.chain_type = chain_type
+        self.url = url or get_rpc_url(chain_type)
+        self.batch_size = batch_size or _setting('RPC_BATCH_SIZE', 100)
+        self._ids = itertools.count(1)
+
+    def _chunks(self, calls: Sequence[Tuple[str, list]]) -> List[List[Dict]]:
+        batch = [
+            {'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': params}
+            for method, params in calls
+        ]
+        return [batch[start:start + self.batch_size] for start in range(0, len(batch), self.batch_size)]
+
+    @staticmethod
+    def _match(chunk: List[Dict], payload) -> List:
+        """Put the responses of one batch in request order; a failed call gets its RPCError."""
+        if isinstance(payload, dict):
+            # A node that rejects the whole batch answers with a single error object
+            error = payload.get('error') or {}
+            raise RPCError(error.get('message', 'Invalid batch response'), error.get('code'))
+        by_id = {response.get('id'): response for response in payload}
+        results = []
+        for request in chunk:
+            response = by_id.get(request['id'])
+            if response is None:
+                results.append(RPCError('No response for call'))
+            elif 'error' in response:
+                results.append(RPCError(response['error'].get('message', ''), response['error'].get('code')))
+            else:
+                results.append(response.get('result'))
+        return results
+
+    def _balance_calls(self, addresses: Sequence[str]) -> List[Tuple[str, list]]:
+        token_address = get_usdt_address(self.chain_type)
+        return [('eth_call', encode_balance_of(token_address, address)) for address in addresses]
+
+    @staticmethod
+    def _balances(results: List) -> List:
+        return [
+            result if isinstance(result, RPCError) else int(result or '0x0', 16)
+            for result in results
+        ]
+
+
+class RPCClient(BaseRPCClient):
+    """Blocking JSON-RPC client that sends calls in batches over the pooled session."""
+
+    def __init__(self, chain_type: str, url: str = None, batch_size: int = None, session=None):
+        super().__init__(chain_type, url, batch_size)
+        self.session = session or get_session()
+        self.timeout = _setting('RPC_TIMEOUT', 10)
+
+    def batch(self, calls: Sequence[Tuple[str, list]]) -> List:
+        """
+        Send (method, params) calls in as few HTTP requests as the batch size allows.
+
+        Returns:
+            List: One result per call, in order; a call the node failed is an RPCError
+        """
+        results = []
+        for chunk in self._chunks(calls):
+            response = self.session.post(self.url, json=chunk, timeout=self.timeout)
+            response.raise_for_status()
+            results.extend(self._match(chunk, response.json()))
+        return results
+
+    def call(self, method: str, params: list = None):
+        """Send a single call and return its result."""
+        result = self.batch([(method, params or [])])[0]
+        if isinstance(result, RPCError):
+            raise result
+        return result
+
+    def get_token_balances(self, addresses: Sequence[str]) -> List:
+        """Get the raw USDT balance of each address, or an RPCError."""
+        return self._balances(self.batch(self._balance_calls(addresses)))
+
+    def get_transaction_receipts(self, tx_hashes: Sequence[str]) -> Tuple[int, List]:
+        """Get the current block number and the receipt (None while pending) of each transaction."""
+        results = self.batch(
+            [('eth_blockNumber', [])] + [('eth_getTransactionReceipt', [tx_hash]) for tx_hash in tx_hashes]
+        )
+        if isinstance(results[0], RPCError):
+            raise results[0]
+        return int(results[0], 16), [
+            result if isinstance(result, RPCError) else decode_receipt(result) for result in results[1:]
+        ]
+
+
+class AsyncRPCClient(BaseRPCClient):
+    """
+    asyncio JSON-RPC client; its batches are sent concurrently.
+
+    Use it as an async context manager, which opens and closes its
+    keep-alive connection pool:
+
+        async with AsyncRPCClient('erc20') as client:
+            balances = await client.get_token_balances(addresses)
+    """
+
+    def __init__(self, chain_type: str, url: str = None, batch_size: int = None, concurrency: int = None):
+        super().__init__(chain_type, url, batch_size)
+        self.concurrency = concurrency or _setting('RPC_ASYNC_CONCURRENCY', 4)
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=_setting('RPC_TIMEOUT', 10))
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    async def _send(self, semaphore: asyncio.Semaphore, chunk: List[Dict]) -> List:
+        async with semaphore:
+            async with self.session.post(self.url, json=chunk) as response:
+                response.raise_for_status()
+                return self._match(chunk, await response.json(content_type=None))
+
+    async def batch(self, calls: Sequence[Tuple[str, list]]) -> List:
+        """Send (method, params) calls in concurrent batches; results as in RPCClient.batch."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        responses = await asyncio.gather(*(self._send(semaphore, chunk) for chunk in self._chunks(calls)))
+        return [result for results in responses for result in results]
+
+    async def call(self, method: str, params: list = None):
+        """Send a single call and return its result."""
+        result = (await self.batch([(method, params or [])]))[0]
+        if isinstance(result, RPCError):
+            raise result
+        return result
+
+    async def get_token_balances(self, addresses: Sequence[str]) -> List:
+        """Get the raw USDT balance of each address, or an RPCError."""
+        return self._balances(await self.batch(self._balance_calls(addresses)))
+
+    async def get_transaction_receipts(self, tx_hashes: Sequence[str]) -> Tuple[int, List]:
+        """Get the current block number and the receipt (None while pending) of each transaction."""
+        results = await self.batch(
+            [('eth_blockNumber', [])] + [('eth_getTransactionReceipt', [tx_hash]) for tx_hash in tx_hashes]
+        )
+        if isinstance(results[0], RPCError):
+            raise results[0]
+        return int(results[0], 16), [
+            result if isinstance(result, RPCError) else decode_receipt(result) for result in results[1:]
+        ]
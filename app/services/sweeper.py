@@ -0,0 +1,519 @@
+"""
+Batched sweeping of confirmed USDT deposits to the master wallets.
+
+One sweep run per chain collects the confirmed deposits waiting for an
+auto-sweep, merges the deposits of each deposit wallet into one transfer,
+reads the gas price once for the whole batch and hands out nonces locally per
+sending key, so the node is asked for a key's nonce only once. The deposits
+are claimed and the signed transfers logged as pending before anything is
+broadcast; the transfers are then broadcast concurrently with bounded
+parallelism. Only a transfer the node definitely rejects is failed at once,
+with its deposits back to confirmed; every other transfer stays pending.
+
+Before claiming, each run reconciles the pending transfers of earlier runs
+against their receipts, read in JSON-RPC batches: a transfer mined with
+status 1 and SWEEP_CONFIRMATIONS blocks deep is completed and its deposits
+swept; one that reverted, or is still unmined after SWEEP_PENDING_TIMEOUT, is
+failed and its deposits marked failed for a manual look, since sweeping them
+again could move or burn gas twice.
+
+Only one run per chain sweeps at a time (a PostgreSQL advisory lock), so a
+sending key is never used by two runs at once.
+"""
+import logging
+import threading
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from datetime import timedelta
+from typing import Dict, List
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from eth_account import Account
+from eth_utils import keccak
+from web3 import Web3
+
+from app.services.rpc import RPCClient, RPCError, get_token_decimals, get_web3
+from app.wallet.models import SweepLog, USDTDepositRequest, USDTWallet
+
+logger = logging.getLogger(__name__)
+
+# ERC20 transfer(address,uint256)
+TRANSFER_SELECTOR = 'a9059cbb'
+
+CHAIN_IDS = {
+    'erc20': 1,   # Ethereum mainnet
+    'bep20': 56,  # BSC mainnet
+}
+
+WEI_PER_NATIVE_TOKEN = Decimal('1000000000000000000')
+
+# Error messages of a node that already holds the transaction it was sent
+ALREADY_KNOWN_ERRORS = ('already known', 'known transaction')
+
+
+def encode_transfer(to_address: str, amount: int) -> str:
+    """Encode the calldata of an ERC20 transfer."""
+    return '0x' + TRANSFER_SELECTOR + to_address.lower()[2:].rjust(64, '0') + format(amount, '064x')
+
+
+class Web3SweepRPC:
+    """The node calls a sweep needs, over the chain's shared Web3 connection."""
+
+    def __init__(self, chain_type: str):
+        self.chain_type = chain_type
+        self.w3 = get_web3(chain_type)
+        self.client = RPCClient(chain_type)
+
+    def get_token_decimals(self) -> int:
+        return get_token_decimals(self.chain_type)
+
+    def get_gas_price(self) -> int:
+        return self.w3.eth.gas_price
+
+    def get_transaction_count(self, address: str) -> int:
+        return self.w3.eth.get_transaction_count(address, 'pending')
+
+    def send_raw_transaction(self, raw_transaction: bytes) -> str:
+        # A JSON-RPC error object raises RPCError; a transport error leaves the outcome unknown
+        return self.client.call('eth_sendRawTransaction', [Web3.to_hex(raw_transaction)])
+
+    def get_transaction_receipts(self, tx_hashes: List[str]):
+        return self.client.get_transaction_receipts(tx_hashes)
+
+
+class LocalSweepRPC:
+    """
+    In-memory stand-in for a node, for tests and local development.
+
+    Like a node, it recovers the sender of every raw transaction and rejects
+    one whose nonce is not the sender's next nonce. Every accepted transfer is
+    mined into its own block, reverted for reverting_senders; for
+    lost_response_senders the transfer is accepted but the response is lost.
+    """
+
+    def __init__(self, gas_price: int = 5_000_000_000, failing_senders=(), decimals: int = 6,
+                 reverting_senders=(), lost_response_senders=()):
+        self.gas_price = gas_price
+        self.decimals = decimals
+        self.failing_senders = {address.lower() for address in failing_senders}
+        self.reverting_senders = {address.lower() for address in reverting_senders}
+        self.lost_response_senders = {address.lower() for address in lost_response_senders}
+        self.nonces = defaultdict(int)
+        self.sent = []
+        self.receipts = {}
+        self.block_number = 0
+        self.calls = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get_token_decimals(self) -> int:
+        return self.decimals
+
+    def get_gas_price(self) -> int:
+        with self._lock:
+            self.calls['gas_price'] += 1
+        return self.gas_price
+
+    def get_transaction_count(self, address: str) -> int:
+        with self._lock:
+            self.calls['transaction_count'] += 1
+            return self.nonces[address.lower()]
+
+    def send_raw_transaction(self, raw_transaction: bytes) -> str:
+        import rlp
+
+        sender = Account.recover_transaction(raw_transaction).lower()
+        nonce = int.from_bytes(rlp.decode(raw_transaction)[0], 'big')
+        with self._lock:
+            self.calls['send_raw_transaction'] += 1
+            if sender in self.failing_senders:
+                raise RPCError('insufficient funds for gas * price + value', -32000)
+            if nonce != self.nonces[sender]:
+                raise RPCError(f'invalid nonce {nonce}, expected {self.nonces[sender]}', -32000)
+            self.nonces[sender] += 1
+            self.sent.append((sender, nonce, raw_transaction))
+            tx_hash = '0x' + keccak(raw_transaction).hex()
+            self.block_number += 1
+            self.receipts[tx_hash] = {
+                'status': 0 if sender in self.reverting_senders else 1,
+                'blockNumber': self.block_number,
+                'gasUsed': 50_000,
+                'effectiveGasPrice': self.gas_price,
+            }
+            if sender in self.lost_response_senders:
+                raise ConnectionError('Connection reset by peer')
+        return tx_hash
+
+    def get_transaction_receipts(self, tx_hashes: List[str]):
+        with self._lock:
+            self.calls['transaction_receipts'] += 1
+            return self.block_number, [self.receipts.get(tx_hash) for tx_hash in tx_hashes]
+
+    def mine(self, blocks: int = 1) -> None:
+        """Add empty blocks on top of the chain."""
+        with self._lock:
+            self.block_number += blocks
+
+
+class NonceManager:
+    """Hands out nonces per sending key, reading the node once per key."""
+
+    def __init__(self, rpc):
+        self.rpc = rpc
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, address: str) -> int:
+        """Take the next nonce of a sending address."""
+        with self._lock:
+            if address not in self._next:
+                self._next[address] = self.rpc.get_transaction_count(address)
+            nonce = self._next[address]
+            self._next[address] += 1
+            return nonce
+
+    def reset(self, address: str) -> None:
+        """Forget an address after a failed send, so its nonce is read from the node again."""
+        with self._lock:
+            self._next.pop(address, None)
+
+
+class DepositSweeper:
+    """Sweeps the confirmed deposits of one chain to its master wallet in batches."""
+
+    def __init__(self, chain_type: str, rpc=None, batch_size: int = None, max_workers: int = None):
+        from app.services.real_wallet_service import real_wallet_service
+
+        if chain_type not in CHAIN_IDS:
+            raise ValueError(f"Unsupported chain type: {chain_type}")
+        self.chain_type = chain_type
+        self.wallet_service = real_wallet_service
+        self.rpc = rpc or Web3SweepRPC(chain_type)
+        self.nonces = NonceManager(self.rpc)
+        self.batch_size = batch_size or getattr(settings, 'SWEEP_BATCH_SIZE', 200)
+        self.max_workers = max_workers or getattr(settings, 'SWEEP_MAX_PARALLEL', 8)
+        self.confirmations = getattr(settings, 'SWEEP_CONFIRMATIONS', 12)
+        self.pending_timeout = getattr(settings, 'SWEEP_PENDING_TIMEOUT', 3600)
+
+        if chain_type == 'erc20':
+            self.master_wallet = real_wallet_service.master_wallet_eth
+            self.token_address = real_wallet_service.usdt_eth_address
+            self.gas_limit = real_wallet_service.gas_limit_erc20
+        else:
+            self.master_wallet = real_wallet_service.master_wallet_bsc
+            self.token_address = real_wallet_service.usdt_bsc_address
+            self.gas_limit = real_wallet_service.gas_limit_bep20
+
+    def get_pending_deposits(self, deposit_ids: List = None):
+        """Get the confirmed deposits of this chain waiting for an auto-sweep, oldest first."""
+        deposits = USDTDepositRequest.objects.filter(
+            chain_type=self.chain_type,
+            status='confirmed',
+            amount__lte=self.wallet_service.auto_sweep_threshold,
+            user__usdt_wallet__is_real_wallet=True
+        )
+        if deposit_ids is not None:
+            deposits = deposits.filter(id__in=deposit_ids)
+        return deposits.select_related('user__usdt_wallet').order_by('created_at')
+
+    def _lock_key(self) -> int:
+        return zlib.crc32(f'usdt_sweep:{self.chain_type}'.encode())
+
+    def _try_lock(self) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [self._lock_key()])
+            return cursor.fetchone()[0]
+
+    def _unlock(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [self._lock_key()])
+
+    def sweep(self, deposit_ids: List = None, sweep_type: str = 'auto') -> Dict:
+        """
+        Sweep one batch of confirmed deposits.
+
+        The pending transfers of earlier runs are reconciled first. The
+        deposits are then claimed as 'sweeping' and the signed transfers are
+        written as pending sweep logs, with their transaction hashes, in a
+        transaction that commits before anything is broadcast. A transfer the
+        node rejects is failed and its deposits queued again; the others stay
+        pending, whether or not the node's answer arrived, until a later run
+        finds their receipts.
+
+        Args:
+            deposit_ids: Only sweep these deposits (default: the oldest batch_size waiting)
+            sweep_type: 'auto' or 'manual', recorded on the deposits and sweep logs
+
+        Returns:
+            Dict: Deposits and transfers broadcast, transfers failed, transfers
+            whose broadcast outcome is unknown, the reconciled transfers and
+            the gas price used
+        """
+        summary = {
+            'chain_type': self.chain_type, 'deposit_count': 0, 'sweep_count': 0, 'failed_count': 0,
+            'unknown_count': 0, 'reconciled': {'completed': 0, 'failed': 0, 'pending': 0},
+        }
+        # A session lock, held across the commits, so a sending key is never used by two runs
+        if not self._try_lock():
+            summary['skipped'] = 'Another sweep of this chain is running'
+            return summary
+        try:
+            summary['reconciled'] = self._reconcile()
+            claimed = self._claim(deposit_ids, sweep_type)
+            if claimed is None:
+                return summary
+            jobs, gas_price, gas_fee = claimed
+
+            signed_jobs = [job for job in jobs if 'error' not in job]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                for job, result in zip(signed_jobs, pool.map(self._broadcast, signed_jobs)):
+                    job.update(result)
+
+            self._record(signed_jobs)
+        finally:
+            self._unlock()
+
+        summary.update({
+            'deposit_count': sum(len(job['deposits']) for job in jobs if job.get('success')),
+            'sweep_count': sum(1 for job in jobs if job.get('success')),
+            'failed_count': sum(1 for job in jobs if 'error' in job or job.get('rejected')),
+            'unknown_count': sum(1 for job in jobs if job.get('success') is False and not job.get('rejected')),
+            'gas_price': gas_price,
+        })
+        return summary
+
+    def _reconcile(self) -> Dict:
+        """
+        Settle the pending sweep transfers of earlier runs from their receipts.
+
+        Returns:
+            Dict: Transfers completed, failed and still pending
+        """
+        counts = {'completed': 0, 'failed': 0, 'pending': 0}
+        logs = list(
+            SweepLog.objects.filter(chain_type=self.chain_type, status='pending', transaction_hash__isnull=False)
+            .select_related('user__usdt_wallet').order_by('created_at')[:self.batch_size]
+        )
+        if not logs:
+            return counts
+
+        try:
+            block_number, receipts = self.rpc.get_transaction_receipts([log.transaction_hash for log in logs])
+        except Exception as e:
+            # The transfers stay pending for the next run
+            logger.error(f"Could not read {self.chain_type} sweep receipts: {str(e)}")
+            counts['pending'] = len(logs)
+            return counts
+        now = timezone.now()
+        stale_before = now - timedelta(seconds=self.pending_timeout)
+        settled_logs = []
+        for log, receipt in zip(logs, receipts):
+            if isinstance(receipt, RPCError):
+                counts['pending'] += 1
+                continue
+            if receipt is None:
+                if log.created_at >= stale_before:
+                    counts['pending'] += 1
+                    continue
+                log.status = 'failed'
+                log.error_message = f"Not mined within {self.pending_timeout} seconds"
+            elif receipt['status'] != 1:
+                log.status = 'failed'
+                log.error_message = f"Transfer reverted in block {receipt['blockNumber']}"
+            elif block_number - receipt['blockNumber'] + 1 < self.confirmations:
+                counts['pending'] += 1
+                continue
+            else:
+                log.status = 'completed'
+                if receipt.get('gasUsed') is not None and receipt.get('effectiveGasPrice') is not None:
+                    log.gas_fee = (
+                        Decimal(receipt['gasUsed'] * receipt['effectiveGasPrice']) / WEI_PER_NATIVE_TOKEN
+                    ).quantize(Decimal('0.000001'))
+            log.updated_at = now
+            settled_logs.append(log)
+            counts[log.status] += 1
+
+        deposits_by_hash = defaultdict(list)
+        for deposit in USDTDepositRequest.objects.filter(
+            chain_type=self.chain_type, status='sweeping',
+            sweep_tx_hash__in=[log.transaction_hash for log in settled_logs]
+        ):
+            deposits_by_hash[deposit.sweep_tx_hash].append(deposit)
+
+        deposits = []
+        swept_wallets = []
+        for log in settled_logs:
+            log_deposits = deposits_by_hash.get(log.transaction_hash, [])
+            for deposit in log_deposits:
+                if log.status == 'completed':
+                    deposit.status = 'swept'
+                    # The transfer's gas is shared by the wallet's deposits
+                    deposit.gas_fee = (log.gas_fee / len(log_deposits)).quantize(Decimal('0.000001'))
+                else:
+                    # Left with its hash for a manual look; sweeping it again could move it twice
+                    deposit.status = 'failed'
+                deposit.updated_at = now
+                deposits.append(deposit)
+            if log.status == 'completed' and log_deposits:
+                wallet = log.user.usdt_wallet
+                wallet.last_sweep_at = now
+                wallet.updated_at = now
+                swept_wallets.append(wallet)
+
+        with transaction.atomic():
+            SweepLog.objects.bulk_update(settled_logs, ['status', 'gas_fee', 'error_message', 'updated_at'])
+            USDTDepositRequest.objects.bulk_update(deposits, ['status', 'gas_fee', 'updated_at'])
+            USDTWallet.objects.bulk_update(swept_wallets, ['last_sweep_at', 'updated_at'])
+        return counts
+
+    def _claim(self, deposit_ids: List, sweep_type: str):
+        """
+        Claim a batch of deposits and sign one transfer per deposit wallet.
+
+        Returns:
+            The jobs, the gas price and the gas fee of one transfer, or None
+            when nothing is waiting
+        """
+        with transaction.atomic():
+            deposits = list(
+                self.get_pending_deposits(deposit_ids).select_for_update(skip_locked=True, of=('self',))[:self.batch_size]
+            )
+            if not deposits:
+                return None
+
+            # One transfer per deposit wallet
+            by_wallet = defaultdict(list)
+            for deposit in deposits:
+                by_wallet[deposit.user.usdt_wallet].append(deposit)
+
+            token_unit = Decimal(10) ** self.rpc.get_token_decimals()
+            gas_price = self.rpc.get_gas_price()
+            gas_fee = Decimal(gas_price * self.gas_limit) / WEI_PER_NATIVE_TOKEN
+            jobs = []
+            for wallet, wallet_deposits in by_wallet.items():
+                job = {
+                    'wallet': wallet,
+                    'deposits': wallet_deposits,
+                    'amount': sum((deposit.amount for deposit in wallet_deposits), Decimal('0')),
+                }
+                job['units'] = int(job['amount'] * token_unit)
+                try:
+                    job['private_key'] = self.wallet_service.decrypt_private_key(wallet.private_key_encrypted or '')
+                except ValueError as e:
+                    job['error'] = str(e)
+                jobs.append(job)
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                list(pool.map(lambda job: self._sign(job, gas_price), jobs))
+
+            now = timezone.now()
+            claimed = []
+            for job in jobs:
+                user = job['wallet'].user
+                job['log'] = SweepLog(
+                    user=user,
+                    chain_type=self.chain_type,
+                    from_address=job.get('from_address') or job['wallet'].wallet_address or '',
+                    to_address=self.master_wallet,
+                    amount=job['amount'],
+                    gas_fee=Decimal('0') if 'error' in job else gas_fee,
+                    transaction_hash=job.get('tx_hash'),
+                    sweep_type=sweep_type,
+                    status='failed' if 'error' in job else 'pending',
+                    error_message=job.get('error'),
+                    initiated_by=user if sweep_type == 'auto' else None
+                )
+                if 'error' in job:
+                    # Never signed: the deposits stay confirmed for the next run
+                    continue
+                for deposit in job['deposits']:
+                    deposit.status = 'sweeping'
+                    deposit.sweep_type = sweep_type
+                    deposit.sweep_tx_hash = job['tx_hash']
+                    deposit.updated_at = now
+                    claimed.append(deposit)
+
+            SweepLog.objects.bulk_create([job['log'] for job in jobs])
+            USDTDepositRequest.objects.bulk_update(claimed, ['status', 'sweep_type', 'sweep_tx_hash', 'updated_at'])
+        return jobs, gas_price, gas_fee
+
+    def _sign(self, job: Dict, gas_price: int) -> None:
+        """Sign the transfer of one deposit wallet; runs on a pool thread."""
+        if 'error' in job:
+            return
+
+        account = Account.from_key(job['private_key'])
+        job['from_address'] = account.address
+        try:
+            nonce = self.nonces.reserve(account.address)
+            signed = Account.sign_transaction({
+                'chainId': CHAIN_IDS[self.chain_type],
+                'nonce': nonce,
+                'gasPrice': gas_price,
+                'gas': self.gas_limit,
+                'to': self.token_address,
+                'value': 0,
+                'data': encode_transfer(self.master_wallet, job['units']),
+            }, job['private_key'])
+        except Exception as e:
+            self.nonces.reset(account.address)
+            job['error'] = str(e)
+            return
+        job['raw_transaction'] = signed.rawTransaction
+        job['tx_hash'] = Web3.to_hex(signed.hash)
+
+    def _broadcast(self, job: Dict) -> Dict:
+        """
+        Broadcast the signed transfer of one deposit wallet; runs on a pool thread.
+
+        Only a JSON-RPC error object is a definite rejection. A timeout or a
+        dropped connection may come after the node accepted the transfer, so
+        its outcome is left to the receipt.
+        """
+        try:
+            self.rpc.send_raw_transaction(job['raw_transaction'])
+        except RPCError as e:
+            if any(known in str(e).lower() for known in ALREADY_KNOWN_ERRORS):
+                return {'success': True}
+            self.nonces.reset(job['from_address'])
+            return {'success': False, 'rejected': True, 'error': str(e)}
+        except Exception as e:
+            self.nonces.reset(job['from_address'])
+            return {'success': False, 'error': str(e)}
+        return {'success': True}
+
+    def _record(self, jobs: List[Dict]) -> None:
+        """
+        Fail the rejected transfers and queue their deposits again, in bulk.
+
+        Accepted transfers, and those whose broadcast outcome is unknown, stay
+        pending with their deposits sweeping until _reconcile reads their
+        receipts.
+        """
+        now = timezone.now()
+        logs = []
+        deposits = []
+        for job in jobs:
+            if job['success']:
+                continue
+            log = job['log']
+            log.error_message = job.get('error')
+            log.updated_at = now
+            logs.append(log)
+            if not job.get('rejected'):
+                continue
+            log.status = 'failed'
+            log.gas_fee = Decimal('0')
+            for deposit in job['deposits']:
+                # Never accepted by the node: back in the queue for the next run
+                deposit.status = 'confirmed'
+                deposit.sweep_tx_hash = None
+                deposit.updated_at = now
+                deposits.append(deposit)
+
+        with transaction.atomic():
+            SweepLog.objects.bulk_update(logs, ['status', 'gas_fee', 'error_message', 'updated_at'])
+            USDTDepositRequest.objects.bulk_update(deposits, ['status', 'sweep_tx_hash', 'updated_at'])
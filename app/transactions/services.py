@@ -9,6 +9,7 @@ from typing import Optional, Dict, Any, List
 
 from .models import Transaction
 from app.wallet.models import INRWallet, USDTWallet
+from app.wallet.services import WalletLedgerService
 
 User = get_user_model()
 
@@ -77,7 +78,7 @@ class TransactionService:
                 # Update wallet balance if transaction is successful
                 if status == 'SUCCESS':
                     TransactionService._update_wallet_balance(
-                        user, currency, amount, type
+                        user, currency, amount, type, reference_id
                     )
                 
                 return transaction
@@ -85,32 +86,50 @@ class TransactionService:
         except Exception as e:
             raise Exception(f"Failed to create transaction: {str(e)}")
     
+    # Transaction types and the wallet transaction type the ledger logs them as
+    CREDIT_TYPES = {
+        'DEPOSIT': 'deposit',
+        'ROI': 'roi_credit',
+        'REFERRAL_BONUS': 'referral_bonus',
+        'MILESTONE_BONUS': 'referral_bonus',
+        'ADMIN_ADJUSTMENT': 'admin_adjustment',
+        'BREAKDOWN_REFUND': 'refund',
+    }
+    DEBIT_TYPES = {
+        'WITHDRAWAL': 'withdrawal',
+        'PLAN_PURCHASE': 'investment',
+    }
+    
     @staticmethod
-    def _update_wallet_balance(user: User, currency: str, amount: Decimal, type: str) -> None:
-        """Update wallet balance based on transaction type and amount."""
+    def _update_wallet_balance(user: User, currency: str, amount: Decimal, type: str,
+                               reference_id: Optional[str] = None) -> None:
+        """Update wallet balance through the ledger based on transaction type and amount."""
         if currency == 'INR':
-            wallet, created = INRWallet.objects.get_or_create(
+            INRWallet.objects.get_or_create(
                 user=user,
                 defaults={'balance': Decimal('0.00'), 'status': 'active', 'is_active': True}
             )
-            
-            if type in ['DEPOSIT', 'ROI', 'REFERRAL_BONUS', 'MILESTONE_BONUS', 'ADMIN_ADJUSTMENT', 'BREAKDOWN_REFUND']:
-                wallet.add_balance(amount)
-            elif type in ['WITHDRAWAL', 'PLAN_PURCHASE']:
-                if not wallet.deduct_balance(amount):
-                    raise ValueError(f"Insufficient INR balance for {type}")
-                    
         elif currency == 'USDT':
-            wallet, created = USDTWallet.objects.get_or_create(
+            USDTWallet.objects.get_or_create(
                 user=user,
                 defaults={'balance': Decimal('0.000000'), 'status': 'active', 'is_active': True}
             )
-            
-            if type in ['DEPOSIT', 'ROI', 'REFERRAL_BONUS', 'MILESTONE_BONUS', 'ADMIN_ADJUSTMENT', 'BREAKDOWN_REFUND']:
-                wallet.add_balance(amount)
-            elif type in ['WITHDRAWAL', 'PLAN_PURCHASE']:
-                if not wallet.deduct_balance(amount):
-                    raise ValueError(f"Insufficient USDT balance for {type}")
+        else:
+            return
+        
+        if type in TransactionService.CREDIT_TYPES:
+            WalletLedgerService.credit(
+                user, currency.lower(), amount, TransactionService.CREDIT_TYPES[type],
+                reference_id=reference_id, description=f"{type} transaction"
+            )
+        elif type in TransactionService.DEBIT_TYPES:
+            try:
+                WalletLedgerService.debit(
+                    user, currency.lower(), amount, TransactionService.DEBIT_TYPES[type],
+                    reference_id=reference_id, description=f"{type} transaction"
+                )
+            except ValueError:
+                raise ValueError(f"Insufficient {currency} balance for {type}")
     
     @staticmethod
     def get_user_transactions(
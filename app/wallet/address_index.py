@@ -0,0 +1,169 @@
+"""
+Shared index of our deposit addresses for matching incoming transfers.
+
+Per chain, the lowercased addresses of all real USDT wallets are kept in a
+Bloom filter stored in the Django cache and copied into process memory.
+Webhook and block-scanner code asks it which transfers may be ours and only
+looks those up in Postgres: a Bloom filter has no false negatives, and with
+FALSE_POSITIVE_RATE only about 1% of foreign transfers get through.
+
+Each chain's filter is stored under a version token. Saving a wallet with a
+new deposit address replaces the token (see app.wallet.signals), so every
+process rebuilds or re-reads the filter on its next lookup; checking the token
+costs one cache read per lookup batch.
+
+That only holds when every process shares the cache (Redis, see CACHES). With
+a process-local backend another process's filter can miss a new address, so
+the filter is not trusted and every address is treated as a candidate.
+"""
+import hashlib
+import math
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+FALSE_POSITIVE_RATE = 0.01
+
+# Smallest number of addresses a filter is sized for
+MIN_CAPACITY = 1024
+
+# Cache backends whose entries other processes cannot see
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+_local = {}
+
+
+def normalize_address(address):
+    """Get the lowercase form of an address, or None for a blank one."""
+    address = (address or '').strip().lower()
+    return address or None
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, serializable to bytes."""
+
+    __slots__ = ('size', 'hash_count', 'bits')
+
+    def __init__(self, size, hash_count, bits=None):
+        self.size = size
+        self.hash_count = hash_count
+        self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate=FALSE_POSITIVE_RATE):
+        """Create an empty filter sized for capacity items at the given false positive rate."""
+        capacity = max(capacity, 1)
+        size = max(8, int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)))
+        hash_count = max(1, int(round(size / capacity * math.log(2))))
+        return cls(size, hash_count)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + index * second) % self.size for index in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def to_bytes(self):
+        return self.size.to_bytes(8, 'little') + self.hash_count.to_bytes(2, 'little') + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(int.from_bytes(data[:8], 'little'), int.from_bytes(data[8:10], 'little'), bytearray(data[10:]))
+
+
+def is_shared():
+    """Whether the cache is shared by all processes, so an invalidation reaches every filter copy."""
+    return not isinstance(caches['default'], PROCESS_LOCAL_BACKENDS)
+
+
+def _version_key(chain_type):
+    return f'wallet:deposit_addresses:{chain_type}:version'
+
+
+def _filter_key(chain_type, version):
+    return f'wallet:deposit_addresses:{chain_type}:{version}'
+
+
+def build_filter(chain_type):
+    """Build the Bloom filter of a chain's deposit addresses from the database."""
+    from .models import USDTWallet
+
+    addresses = list(
+        USDTWallet.objects.filter(
+            chain_type=chain_type, is_real_wallet=True, normalized_address__isnull=False
+        ).values_list('normalized_address', flat=True)
+    )
+    bloom = BloomFilter.for_capacity(max(len(addresses) * 2, MIN_CAPACITY))
+    for address in addresses:
+        bloom.add(address)
+    return bloom
+
+
+def get_filter(chain_type):
+    """Get the current Bloom filter of a chain from process memory, the shared cache or the database."""
+    version = cache.get(_version_key(chain_type))
+    if version is None:
+        cache.add(_version_key(chain_type), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(chain_type))
+
+    entry = _local.get(chain_type)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    data = cache.get(_filter_key(chain_type, version))
+    if data is None:
+        bloom = build_filter(chain_type)
+        cache.set(
+            _filter_key(chain_type, version), bloom.to_bytes(),
+            getattr(settings, 'DEPOSIT_ADDRESS_INDEX_TIMEOUT', 86400)
+        )
+    else:
+        bloom = BloomFilter.from_bytes(data)
+
+    _local[chain_type] = (version, bloom)
+    return bloom
+
+
+def filter_candidates(chain_type, addresses):
+    """
+    Drop the addresses that are certainly not deposit addresses of a chain.
+
+    Args:
+        chain_type: 'erc20' or 'bep20'
+        addresses: Addresses in any case
+
+    Returns:
+        set: The normalized addresses that may belong to one of our wallets
+    """
+    normalized = {normalize_address(address) for address in addresses}
+    if not is_shared():
+        # Another process may have added an address this filter has not seen
+        return {address for address in normalized if address}
+    bloom = get_filter(chain_type)
+    return {address for address in normalized if address and address in bloom}
+
+
+def invalidate(*chain_types):
+    """
+    Make every process rebuild the filters of some chains.
+
+    The version is replaced right away and again once the surrounding
+    transaction commits, so a rebuild in between cannot miss the new address.
+    """
+    def _replace():
+        cache.set_many({_version_key(chain_type): uuid.uuid4().hex for chain_type in chain_types}, None)
+        for chain_type in chain_types:
+            _local.pop(chain_type, None)
+
+    _replace()
+    transaction.on_commit(_replace)
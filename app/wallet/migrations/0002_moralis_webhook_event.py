@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-16 20:04
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoralisWebhookEvent',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('transaction_hash', models.CharField(max_length=255, unique=True)),
+                ('chain_type', models.CharField(max_length=10)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('ignored', 'Ignored'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Moralis Webhook Event',
+                'verbose_name_plural': 'Moralis Webhook Events',
+                'db_table': 'moralis_webhook_event',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='moralis_web_status_93f4bc_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-16 20:08
+
+from django.db import migrations, models
+
+# Normalize the existing addresses. Should two wallets share an address on a
+# chain, only the oldest is indexed; the other keeps a NULL normalized address
+# until it is saved again, where the unique constraint reports it
+BACKFILL_NORMALIZED_ADDRESSES = """
+    UPDATE usdt_wallet AS w
+    SET normalized_address = v.address
+    FROM (
+        SELECT DISTINCT ON (chain_type, LOWER(BTRIM(wallet_address)))
+               id, LOWER(BTRIM(wallet_address)) AS address
+        FROM usdt_wallet
+        WHERE BTRIM(COALESCE(wallet_address, '')) <> ''
+        ORDER BY chain_type, LOWER(BTRIM(wallet_address)), created_at
+    ) AS v
+    WHERE w.id = v.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0002_moralis_webhook_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usdtwallet',
+            name='normalized_address',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.RunSQL(BACKFILL_NORMALIZED_ADDRESSES, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='usdtwallet',
+            constraint=models.UniqueConstraint(fields=('chain_type', 'normalized_address'), name='usdt_wallet_chain_address_uniq'),
+        ),
+    ]
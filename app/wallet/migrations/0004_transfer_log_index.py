@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-16 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0003_usdt_wallet_normalized_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moraliswebhookevent',
+            name='log_index',
+            field=models.IntegerField(default=-1),
+        ),
+        migrations.AddField(
+            model_name='usdtdepositrequest',
+            name='log_index',
+            field=models.IntegerField(default=-1),
+        ),
+        migrations.AlterField(
+            model_name='moraliswebhookevent',
+            name='transaction_hash',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='usdtdepositrequest',
+            name='transaction_hash',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='moraliswebhookevent',
+            constraint=models.UniqueConstraint(fields=('transaction_hash', 'log_index'), name='moralis_event_tx_log_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='usdtdepositrequest',
+            constraint=models.UniqueConstraint(fields=('transaction_hash', 'log_index'), name='usdt_deposit_tx_log_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0004_transfer_log_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usdtdepositrequest',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('sweeping', 'Sweeping'), ('swept', 'Swept'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=20),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.utils import timezone
@@ -94,22 +94,6 @@ class INRWallet(TimeStampedModel):
     def can_transact(self):
         """Check if wallet can perform transactions."""
         return self.is_active and self.status == 'active'
-    
-    def add_balance(self, amount):
-        """Add balance to wallet."""
-        if amount > 0:
-            self.balance = self.balance + amount
-            # Don't save here - let the calling code handle it
-            return True
-        return False
-    
-    def deduct_balance(self, amount):
-        """Deduct balance from wallet."""
-        if amount > 0 and self.balance >= amount and self.can_transact():
-            self.balance = self.balance - amount
-            # Don't save here - let the calling code handle it
-            return True
-        return False
 
 
 class USDTWallet(TimeStampedModel):
@@ -150,34 +134,49 @@ class USDTWallet(TimeStampedModel):
     )
     is_real_wallet = models.BooleanField(default=False, help_text="Whether this is a real blockchain wallet or dummy")
     last_sweep_at = models.DateTimeField(null=True, blank=True, help_text="Last time funds were swept to master wallet")
+    # Lowercased wallet_address, kept in step by save(); incoming transfers are matched on it
+    normalized_address = models.CharField(max_length=255, blank=True, null=True, editable=False)
     
     class Meta:
         db_table = 'usdt_wallet'
         verbose_name = 'USDT Wallet'
         verbose_name_plural = 'USDT Wallets'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['chain_type', 'normalized_address'],
+                name='usdt_wallet_chain_address_uniq'
+            ),
+        ]
     
     def __str__(self):
         return f"USDT Wallet - {self.user.username} (${self.balance})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._indexed_address = instance.get_indexed_address()
+        return instance
+    
+    def get_indexed_address(self):
+        """Get the (chain, address) this wallet contributes to the deposit address index, if any."""
+        fields = self.__dict__
+        if not fields.get('is_real_wallet') or not fields.get('normalized_address'):
+            return None
+        return (fields.get('chain_type'), fields['normalized_address'])
+    
+    def save(self, *args, **kwargs):
+        """Keep the normalized address in step with the wallet address."""
+        from .address_index import normalize_address
+        
+        self.normalized_address = normalize_address(self.wallet_address)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'wallet_address' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'normalized_address'}
+        super().save(*args, **kwargs)
+    
     def can_transact(self):
         """Check if wallet can perform transactions."""
         return self.is_active and self.status == 'active'
-    
-    def add_balance(self, amount):
-        """Add balance to wallet."""
-        if amount > 0:
-            self.balance = self.balance + amount
-            # Don't save here - let the calling code handle it
-            return True
-        return False
-    
-    def deduct_balance(self, amount):
-        """Deduct balance from wallet."""
-        if amount > 0 and self.balance >= amount and self.can_transact():
-            self.balance = self.balance - amount
-            # Don't save here - let the calling code handle it
-            return True
-        return False
 
 
 class USDTDepositRequest(TimeStampedModel):
@@ -191,6 +190,7 @@ class USDTDepositRequest(TimeStampedModel):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('confirmed', 'Confirmed'),
+        ('sweeping', 'Sweeping'),
         ('swept', 'Swept'),
         ('failed', 'Failed'),
         ('cancelled', 'Cancelled'),
@@ -206,7 +206,9 @@ class USDTDepositRequest(TimeStampedModel):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='usdt_deposits')
     chain_type = models.CharField(max_length=10, choices=CHAIN_TYPE_CHOICES, default='trc20')
     amount = models.DecimalField(max_digits=20, decimal_places=6, validators=[MinValueValidator(0.000001)])
-    transaction_hash = models.CharField(max_length=255, unique=True)
+    transaction_hash = models.CharField(max_length=255)
+    # Position of the Transfer log in its transaction; -1 when the source gives none
+    log_index = models.IntegerField(default=-1)
     from_address = models.CharField(max_length=255)
     to_address = models.CharField(max_length=255)  # User's wallet address
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -238,6 +240,10 @@ class USDTDepositRequest(TimeStampedModel):
             models.Index(fields=['to_address', 'chain_type']),
             models.Index(fields=['chain_type', 'created_at']),
         ]
+        constraints = [
+            # One transaction can carry several transfers, each to another deposit address
+            models.UniqueConstraint(fields=['transaction_hash', 'log_index'], name='usdt_deposit_tx_log_uniq'),
+        ]
     
     def __str__(self):
         return f"USDT Deposit - {self.user.username} (${self.amount}) - {self.chain_type.upper()} - {self.status}"
@@ -253,30 +259,42 @@ class USDTDepositRequest(TimeStampedModel):
     
     def confirm_deposit(self, admin_user=None):
         """Confirm the USDT deposit and credit user wallet."""
-        if self.status == 'pending' and self.confirmation_count >= self.get_required_confirmations():
+        from .services import WalletLedgerService
+        
+        if self.status != 'pending' or self.confirmation_count < self.get_required_confirmations():
+            return False
+        
+        with transaction.atomic():
+            # Flip the status only if it is still pending, so concurrent
+            # confirmations cannot credit the same deposit twice
+            now = timezone.now()
+            confirmed = USDTDepositRequest.objects.filter(id=self.id, status='pending').update(
+                status='confirmed',
+                processed_by=admin_user,
+                processed_at=now,
+                updated_at=now
+            )
+            if not confirmed:
+                return False
             self.status = 'confirmed'
             self.processed_by = admin_user
-            self.processed_at = timezone.now()
-            self.save()
+            self.processed_at = now
             
             # Add balance to user's USDT wallet
-            usdt_wallet, created = USDTWallet.objects.get_or_create(user=self.user)
-            if usdt_wallet.add_balance(self.amount):
-                # Create transaction log
-                WalletTransaction.objects.create(
-                    user=self.user,
-                    transaction_type='usdt_deposit',
-                    wallet_type='usdt',
-                    amount=self.amount,
-                    balance_before=usdt_wallet.balance - self.amount,
-                    balance_after=usdt_wallet.balance,
-                    status='completed',
-                    reference_id=self.transaction_hash,
-                    description=f"USDT deposit confirmed - {self.chain_type.upper()} - TX: {self.transaction_hash[:10]}...",
-                    metadata={'chain_type': self.chain_type}
-                )
-                return True
-        return False
+            USDTWallet.objects.get_or_create(user=self.user)
+            
+            # Credit the wallet atomically with the true before/after balances
+            WalletLedgerService.credit(
+                self.user,
+                'usdt',
+                Decimal(str(self.amount)),
+                'usdt_deposit',
+                reference_id=self.transaction_hash,
+                description=f"USDT deposit confirmed - {self.chain_type.upper()} - TX: {self.transaction_hash[:10]}...",
+                metadata={'chain_type': self.chain_type},
+                chain_type=self.chain_type
+            )
+        return True
     
     def mark_as_swept(self, sweep_tx_hash, gas_fee=0):
         """Mark deposit as swept to master wallet."""
@@ -289,6 +307,41 @@ class USDTDepositRequest(TimeStampedModel):
         return False
 
 
+class MoralisWebhookEvent(TimeStampedModel):
+    """Inbox of raw Moralis webhook deliveries, drained by a Celery consumer."""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    transaction_hash = models.CharField(max_length=255)
+    log_index = models.IntegerField(default=-1)
+    chain_type = models.CharField(max_length=10)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True, null=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'moralis_webhook_event'
+        verbose_name = 'Moralis Webhook Event'
+        verbose_name_plural = 'Moralis Webhook Events'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['transaction_hash', 'log_index'], name='moralis_event_tx_log_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"Moralis Event - {self.chain_type.upper()} - {self.transaction_hash[:10]}... - {self.status}"
+
+
 class SweepLog(TimeStampedModel):
     """Model for logging sweep operations from user wallets to master wallet."""
     
@@ -467,14 +520,29 @@ class DepositRequest(TimeStampedModel):
     
     def approve(self, admin_user):
         """Approve the deposit request."""
-        if self.status == 'pending':
+        from .services import WalletLedgerService
+        
+        if self.status != 'pending':
+            return False
+        
+        with transaction.atomic():
+            # Flip the status only if it is still pending, so concurrent
+            # approvals cannot credit the same deposit twice
+            now = timezone.now()
+            approved = DepositRequest.objects.filter(id=self.id, status='pending').update(
+                status='approved',
+                processed_by=admin_user,
+                processed_at=now,
+                updated_at=now
+            )
+            if not approved:
+                return False
             self.status = 'approved'
             self.processed_by = admin_user
-            self.processed_at = timezone.now()
-            self.save()
+            self.processed_at = now
             
             # Add balance to user's INR wallet
-            inr_wallet, created = INRWallet.objects.get_or_create(
+            INRWallet.objects.get_or_create(
                 user=self.user,
                 defaults={
                     'balance': Decimal('0.00'),
@@ -483,27 +551,16 @@ class DepositRequest(TimeStampedModel):
                 }
             )
             
-            # Ensure amount is Decimal
-            amount = Decimal(str(self.amount))
-            
-            if inr_wallet.add_balance(amount):
-                # Save the wallet with updated balance
-                inr_wallet.save()
-                
-                # Create transaction log
-                WalletTransaction.objects.create(
-                    user=self.user,
-                    transaction_type='deposit',
-                    wallet_type='inr',
-                    amount=amount,
-                    balance_before=inr_wallet.balance - amount,
-                    balance_after=inr_wallet.balance,
-                    status='completed',
-                    reference_id=self.transaction_id or str(self.id),
-                    description=f"Deposit via {self.get_payment_method_display()}"
-                )
-                return True
-        return False
+            # Credit the wallet atomically with the true before/after balances
+            WalletLedgerService.credit(
+                self.user,
+                'inr',
+                Decimal(str(self.amount)),
+                'deposit',
+                reference_id=self.transaction_id or str(self.id),
+                description=f"Deposit via {self.get_payment_method_display()}"
+            )
+        return True
     
     def reject(self, admin_user, reason=""):
         """Reject the deposit request."""
@@ -1,10 +1,280 @@
-from decimal import Decimal
-from django.db import transaction
-from django.contrib.auth.models import User
+from decimal import Decimal, ROUND_HALF_UP
+from collections import defaultdict
+import uuid
+from django.db import connection, transaction
 from django.utils import timezone
 from .models import INRWallet, USDTWallet, WalletTransaction, DepositRequest
 
 
+class WalletLedgerService:
+    """
+    Single entry point for wallet balance changes.
+
+    Every change is applied by the database as one
+    UPDATE ... SET balance = balance + delta ... RETURNING balance, which takes
+    the wallet row lock for the rest of the transaction, so concurrent
+    changes queue on the row instead of overwriting each other. The matching
+    WalletTransaction is written in the same transaction with the balances
+    returned by the UPDATE.
+    """
+    
+    WALLET_MODELS = {
+        'inr': INRWallet,
+        'usdt': USDTWallet,
+    }
+    BULK_BATCH_SIZE = 5000
+    
+    @staticmethod
+    def get_wallet_model(wallet_type):
+        """Get the wallet model for a wallet type ('inr' or 'usdt')."""
+        try:
+            return WalletLedgerService.WALLET_MODELS[wallet_type.lower()]
+        except KeyError:
+            raise ValueError(f"Unsupported wallet type: {wallet_type}")
+    
+    @staticmethod
+    def credit(user, wallet_type, amount, transaction_type, reference_id=None,
+               description='', metadata=None, chain_type=None, require_active=False,
+               status='completed'):
+        """
+        Atomically add an amount to a user's wallet and log the transaction.
+        
+        Args:
+            user: User instance or user id
+            wallet_type: 'inr' or 'usdt'
+            amount: Positive amount to add
+            transaction_type: WalletTransaction type
+            reference_id: Reference stored on the transaction
+            description: Transaction description
+            metadata: Transaction metadata
+            chain_type: Chain recorded on the transaction (defaults to the USDT wallet's chain)
+            require_active: Reject the credit if the wallet cannot transact
+            status: Status recorded on the transaction
+        
+        Returns:
+            WalletTransaction: The logged transaction with true before/after balances
+        """
+        amount = WalletLedgerService._positive(amount, wallet_type)
+        return WalletLedgerService._apply(
+            user, wallet_type, amount, transaction_type, reference_id,
+            description, metadata, chain_type, require_active, status
+        )
+    
+    @staticmethod
+    def debit(user, wallet_type, amount, transaction_type, reference_id=None,
+              description='', metadata=None, chain_type=None, status='completed'):
+        """
+        Atomically deduct an amount from an active wallet and log the transaction.
+        
+        The balance check is part of the UPDATE, so two concurrent debits can
+        never take a wallet below zero.
+        
+        Raises:
+            ValueError: If the wallet is inactive or the balance is insufficient
+        """
+        amount = WalletLedgerService._positive(amount, wallet_type)
+        return WalletLedgerService._apply(
+            user, wallet_type, -amount, transaction_type, reference_id,
+            description, metadata, chain_type, True, status
+        )
+    
+    @staticmethod
+    def _positive(amount, wallet_type):
+        """
+        Get an amount as a Decimal at the wallet balance's scale, rejecting
+        zero and negative amounts.
+        
+        The amount is rounded the way the database would round it on the
+        UPDATE, so the logged amount is the change actually applied.
+        """
+        wallet_model = WalletLedgerService.get_wallet_model(wallet_type)
+        places = wallet_model._meta.get_field('balance').decimal_places
+        amount = Decimal(str(amount)).quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP)
+        if amount <= 0:
+            raise ValueError("Amount must be positive")
+        return amount
+    
+    @staticmethod
+    def _apply(user, wallet_type, delta, transaction_type, reference_id,
+               description, metadata, chain_type, require_active, status='completed'):
+        """Apply a signed balance change and write its WalletTransaction."""
+        delta = Decimal(str(delta))
+        
+        wallet_type = wallet_type.lower()
+        wallet_model = WalletLedgerService.get_wallet_model(wallet_type)
+        user_id = getattr(user, 'pk', user)
+        now = timezone.now()
+        
+        table = connection.ops.quote_name(wallet_model._meta.db_table)
+        conditions = ["user_id = %s"]
+        params = [delta, now, user_id]
+        if require_active:
+            conditions.append("is_active AND status = 'active'")
+        if delta < 0:
+            conditions.append("balance + %s >= 0")
+            params.append(delta)
+        returning = "balance, chain_type" if wallet_type == 'usdt' else "balance"
+        sql = (
+            f"UPDATE {table} SET balance = balance + %s, updated_at = %s "
+            f"WHERE {' AND '.join(conditions)} RETURNING {returning}"
+        )
+        
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+            
+            if row is None:
+                wallet = wallet_model.objects.filter(user_id=user_id).first()
+                if wallet is None:
+                    raise wallet_model.DoesNotExist(
+                        f"No {wallet_type.upper()} wallet for user {user_id}"
+                    )
+                if require_active and not wallet.can_transact():
+                    raise ValueError("Wallet is not active for transactions")
+                raise ValueError("Insufficient balance")
+            
+            balance_after = row[0]
+            if wallet_type == 'usdt' and chain_type is None:
+                chain_type = row[1]
+            
+            return WalletTransaction.objects.create(
+                user_id=user_id,
+                transaction_type=transaction_type,
+                wallet_type=wallet_type,
+                chain_type=chain_type,
+                amount=abs(delta),
+                balance_before=balance_after - delta,
+                balance_after=balance_after,
+                status=status,
+                reference_id=reference_id,
+                description=description,
+                metadata=metadata or {}
+            )
+
+
+    @staticmethod
+    def credit_many(credits, skip_missing=False):
+        """
+        Credit many wallets with a handful of statements.
+        
+        Credits are grouped by currency. For each currency the affected
+        wallets are locked in user_id order (so concurrent batches cannot
+        deadlock) and incremented by one UPDATE ... FROM (VALUES ...); the
+        WalletTransaction rows are then bulk-inserted with running balances,
+        in input order, for users credited more than once.
+        
+        Args:
+            credits: (user_id, currency, amount, transaction_type, reference_id)
+                tuples, optionally followed by description and metadata
+            skip_missing: Skip credits for users without a wallet instead of
+                raising and rolling the whole batch back
+        
+        Returns:
+            list: WalletTransaction per credit, in input order (None when skipped)
+        """
+        entries = []
+        for credit in credits:
+            user_id, currency, amount, transaction_type, reference_id = credit[:5]
+            description = credit[5] if len(credit) > 5 else ''
+            metadata = credit[6] if len(credit) > 6 else {}
+            amount = WalletLedgerService._positive(amount, currency)
+            entries.append((
+                uuid.UUID(str(getattr(user_id, 'pk', user_id))), currency.lower(), amount,
+                transaction_type, reference_id, description, metadata
+            ))
+        if not entries:
+            return []
+        
+        now = timezone.now()
+        results = [None] * len(entries)
+        with transaction.atomic():
+            wallet_rows = {}
+            for wallet_type in sorted({entry[1] for entry in entries}):
+                increments = defaultdict(Decimal)
+                for user_id, currency, amount, *_ in entries:
+                    if currency == wallet_type:
+                        increments[user_id] += amount
+                rows = WalletLedgerService._increment_many(wallet_type, increments, now)
+                missing = set(increments) - set(rows)
+                if missing and not skip_missing:
+                    wallet_model = WalletLedgerService.get_wallet_model(wallet_type)
+                    raise wallet_model.DoesNotExist(
+                        f"No {wallet_type.upper()} wallet for {len(missing)} user(s)"
+                    )
+                for user_id, row in rows.items():
+                    wallet_rows[(wallet_type, user_id)] = row
+            
+            transactions = []
+            for position, (user_id, currency, amount, transaction_type, reference_id,
+                           description, metadata) in enumerate(entries):
+                row = wallet_rows.get((currency, user_id))
+                if row is None:
+                    continue
+                balance_before = row['balance']
+                row['balance'] = balance_before + amount
+                results[position] = WalletTransaction(
+                    user_id=user_id,
+                    transaction_type=transaction_type,
+                    wallet_type=currency,
+                    chain_type=row['chain_type'],
+                    amount=amount,
+                    balance_before=balance_before,
+                    balance_after=row['balance'],
+                    status='completed',
+                    reference_id=reference_id,
+                    description=description,
+                    metadata=metadata
+                )
+                transactions.append(results[position])
+            
+            WalletTransaction.objects.bulk_create(
+                transactions, batch_size=WalletLedgerService.BULK_BATCH_SIZE
+            )
+        return results
+    
+    @staticmethod
+    def _increment_many(wallet_type, increments, now):
+        """
+        Lock and increment many wallets of one currency in one statement.
+        
+        Returns:
+            dict: user_id -> {'balance' (before the increments), 'chain_type'}
+        """
+        wallet_model = WalletLedgerService.get_wallet_model(wallet_type)
+        table = connection.ops.quote_name(wallet_model._meta.db_table)
+        has_chain = wallet_type == 'usdt'
+        values_sql = ', '.join(['(%s::uuid, %s::numeric)'] * len(increments))
+        params = []
+        for user_id, amount in increments.items():
+            params.extend([str(user_id), amount])
+        params.append(now)
+        
+        returning = 'w.user_id, w.balance' + (', w.chain_type' if has_chain else '')
+        sql = (
+            f"WITH v(user_id, amount) AS (VALUES {values_sql}), "
+            f"locked AS ("
+            f"SELECT w.id FROM {table} AS w JOIN v ON w.user_id = v.user_id "
+            f"ORDER BY w.user_id FOR UPDATE OF w"
+            f") "
+            f"UPDATE {table} AS w "
+            f"SET balance = w.balance + v.amount, updated_at = %s "
+            f"FROM v, locked "
+            f"WHERE w.user_id = v.user_id AND w.id = locked.id "
+            f"RETURNING {returning}"
+        )
+        
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return {
+                row[0]: {
+                    'balance': row[1] - increments[row[0]],
+                    'chain_type': row[2] if has_chain else None,
+                }
+                for row in cursor.fetchall()
+            }
+
+
 class WalletService:
     """Service class for wallet operations."""
     
@@ -47,27 +317,14 @@ class WalletService:
         if amount <= 0:
             raise ValueError("Amount must be positive")
         
-        wallet = WalletService.get_or_create_inr_wallet(user)
+        WalletService.get_or_create_inr_wallet(user)
         
-        if not wallet.can_transact():
-            raise ValueError("Wallet is not active for transactions")
-        
-        balance_before = wallet.balance
-        if wallet.add_balance(amount):
-            # Create transaction log
-            WalletTransaction.objects.create(
-                user=user,
-                transaction_type=transaction_type,
-                wallet_type='inr',
-                amount=amount,
-                balance_before=balance_before,
-                balance_after=wallet.balance,
-                status='completed',
-                reference_id=reference_id,
-                description=description
-            )
-            return True
-        return False
+        # The active-wallet check is applied atomically by the ledger
+        WalletLedgerService.credit(
+            user, 'inr', amount, transaction_type,
+            reference_id=reference_id, description=description, require_active=True
+        )
+        return True
     
     @staticmethod
     @transaction.atomic
@@ -76,30 +333,14 @@ class WalletService:
         if amount <= 0:
             raise ValueError("Amount must be positive")
         
-        wallet = WalletService.get_or_create_inr_wallet(user)
-        
-        if not wallet.can_transact():
-            raise ValueError("Wallet is not active for transactions")
+        WalletService.get_or_create_inr_wallet(user)
         
-        if wallet.balance < amount:
-            raise ValueError("Insufficient balance")
-        
-        balance_before = wallet.balance
-        if wallet.deduct_balance(amount):
-            # Create transaction log
-            WalletTransaction.objects.create(
-                user=user,
-                transaction_type=transaction_type,
-                wallet_type='inr',
-                amount=amount,
-                balance_before=balance_before,
-                balance_after=wallet.balance,
-                status='completed',
-                reference_id=reference_id,
-                description=description
-            )
-            return True
-        return False
+        # Active and sufficient-balance checks are applied atomically by the ledger
+        WalletLedgerService.debit(
+            user, 'inr', amount, transaction_type,
+            reference_id=reference_id, description=description
+        )
+        return True
     
     @staticmethod
     @transaction.atomic
@@ -108,27 +349,14 @@ class WalletService:
         if amount <= 0:
             raise ValueError("Amount must be positive")
         
-        wallet = WalletService.get_or_create_usdt_wallet(user)
+        WalletService.get_or_create_usdt_wallet(user)
         
-        if not wallet.can_transact():
-            raise ValueError("Wallet is not active for transactions")
-        
-        balance_before = wallet.balance
-        if wallet.add_balance(amount):
-            # Create transaction log
-            WalletTransaction.objects.create(
-                user=user,
-                transaction_type=transaction_type,
-                wallet_type='usdt',
-                amount=amount,
-                balance_before=balance_before,
-                balance_after=wallet.balance,
-                status='completed',
-                reference_id=reference_id,
-                description=description
-            )
-            return True
-        return False
+        # The active-wallet check is applied atomically by the ledger
+        WalletLedgerService.credit(
+            user, 'usdt', amount, transaction_type,
+            reference_id=reference_id, description=description, require_active=True
+        )
+        return True
     
     @staticmethod
     @transaction.atomic
@@ -137,30 +365,14 @@ class WalletService:
         if amount <= 0:
             raise ValueError("Amount must be positive")
         
-        wallet = WalletService.get_or_create_usdt_wallet(user)
-        
-        if not wallet.can_transact():
-            raise ValueError("Wallet is not active for transactions")
+        WalletService.get_or_create_usdt_wallet(user)
         
-        if wallet.balance < amount:
-            raise ValueError("Insufficient balance")
-        
-        balance_before = wallet.balance
-        if wallet.deduct_balance(amount):
-            # Create transaction log
-            WalletTransaction.objects.create(
-                user=user,
-                transaction_type=transaction_type,
-                wallet_type='usdt',
-                amount=amount,
-                balance_before=balance_before,
-                balance_after=wallet.balance,
-                status='completed',
-                reference_id=reference_id,
-                description=description
-            )
-            return True
-        return False
+        # Active and sufficient-balance checks are applied atomically by the ledger
+        WalletLedgerService.debit(
+            user, 'usdt', amount, transaction_type,
+            reference_id=reference_id, description=description
+        )
+        return True
 
 
 class DepositService:
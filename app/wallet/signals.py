@@ -3,6 +3,7 @@ from django.dispatch import receiver
 from django.contrib.auth.models import User
 from .models import INRWallet, USDTWallet
 from .services import WalletService
+from . import address_index
 
 
 @receiver(post_save, sender=User)
@@ -15,6 +16,17 @@ def create_user_wallets(sender, instance, created, **kwargs):
         WalletService.get_or_create_usdt_wallet(instance)
 
 
+@receiver(post_save, sender=USDTWallet)
+def refresh_deposit_address_index(sender, instance, **kwargs):
+    """Rebuild the deposit address filter of a chain when one of its addresses appears or changes."""
+    previous = getattr(instance, '_indexed_address', None)
+    current = instance.get_indexed_address()
+    instance._indexed_address = current
+    if previous == current:
+        return
+    address_index.invalidate(*{indexed[0] for indexed in (previous, current) if indexed})
+
+
 # Signal removed to prevent double wallet saves
 # @receiver(post_save, sender=User)
 # def save_user_wallets(sender, instance, **kwargs):
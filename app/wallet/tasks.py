@@ -0,0 +1,66 @@
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Set while an inbox drain is queued, so a burst of webhooks queues one drain
+MORALIS_INBOX_PENDING_KEY = 'wallet:moralis_inbox:pending'
+
+# Set per chain while a batched sweep is queued
+SWEEP_PENDING_KEY = 'wallet:sweep:{chain_type}:pending'
+
+# Upper bound on batches per drain, so one run cannot hold a worker forever
+MORALIS_INBOX_MAX_BATCHES = 50
+
+
+@shared_task
+def process_moralis_webhook_inbox():
+    """
+    Task to credit the Moralis webhook events waiting in the inbox.
+    Runs every minute and right after webhooks are received.
+    """
+    from app.services.real_wallet_service import real_wallet_service
+
+    # Webhooks stored from here on queue the next drain
+    cache.delete(MORALIS_INBOX_PENDING_KEY)
+
+    batch_size = getattr(settings, 'MORALIS_INBOX_BATCH_SIZE', 200)
+    totals = {}
+    for _ in range(MORALIS_INBOX_MAX_BATCHES):
+        counts = real_wallet_service.process_webhook_inbox(batch_size)
+        for outcome, count in counts.items():
+            totals[outcome] = totals.get(outcome, 0) + count
+        # Events to retry wait for the next periodic run
+        if counts['claimed'] < batch_size or counts['retrying']:
+            break
+
+    logger.info(f"Drained Moralis inbox: {totals}")
+    return f"Processed {totals.get('processed', 0)} Moralis events, ignored {totals.get('ignored', 0)}, failed {totals.get('failed', 0)}"
+
+
+@shared_task
+def sweep_confirmed_deposits(chain_type=None):
+    """
+    Task to sweep confirmed deposits to the master wallets in batches.
+    Runs every 5 minutes and, debounced, shortly after deposits are credited.
+    Each run first settles the pending transfers of earlier runs from their receipts.
+    """
+    from app.services.sweeper import CHAIN_IDS, DepositSweeper
+
+    results = []
+    for chain in [chain_type] if chain_type else list(CHAIN_IDS):
+        # Deposits credited from here on queue the next sweep
+        cache.delete(SWEEP_PENDING_KEY.format(chain_type=chain))
+        result = DepositSweeper(chain).sweep()
+        reconciled = result['reconciled']
+        if result['failed_count'] or reconciled['failed']:
+            logger.error(f"{result['failed_count'] + reconciled['failed']} {chain} sweep transfers failed")
+        if result['unknown_count']:
+            logger.warning(f"{result['unknown_count']} {chain} sweep broadcasts left to their receipts")
+        results.append(
+            f"{chain}: sent {result['deposit_count']} deposits in {result['sweep_count']} transfers, "
+            f"completed {reconciled['completed']} earlier transfers"
+        )
+    return '; '.join(results)
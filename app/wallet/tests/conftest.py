@@ -5,6 +5,7 @@ from rest_framework.test import APIClient
 from decimal import Decimal
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.db import transaction
+from django.test import override_settings
 from unittest.mock import patch
 
 from app.wallet.models import (
@@ -241,6 +242,13 @@ class PreLoadedUSDTWalletFactory(USDTWalletFactory):
 
 
 # Pytest Fixtures
+@pytest.fixture(autouse=True)
+def temp_media_root(tmp_path):
+    """Write uploaded files to a temporary MEDIA_ROOT instead of the checked-in media tree."""
+    with override_settings(MEDIA_ROOT=str(tmp_path)):
+        yield
+
+
 @pytest.fixture
 def api_client():
     """Return an API client for testing."""
@@ -0,0 +1,219 @@
+from decimal import Decimal
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from app.wallet.models import INRWallet, USDTWallet, WalletTransaction, DepositRequest, USDTDepositRequest
+from app.wallet.services import WalletLedgerService
+
+User = get_user_model()
+
+
+class WalletLedgerServiceTest(TestCase):
+    """Test cases for atomic wallet ledger updates."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            username='ledgeruser',
+            email='ledger@example.com',
+            password='testpass123'
+        )
+        self.inr_wallet, _ = INRWallet.objects.get_or_create(user=self.user)
+        INRWallet.objects.filter(id=self.inr_wallet.id).update(balance=Decimal('100.00'))
+        self.usdt_wallet, _ = USDTWallet.objects.get_or_create(user=self.user)
+    
+    def test_credit_uses_database_balance(self):
+        """Test that a credit applies to the stored balance, not a stale instance."""
+        stale_wallet = INRWallet.objects.get(id=self.inr_wallet.id)
+        INRWallet.objects.filter(id=self.inr_wallet.id).update(balance=Decimal('250.00'))
+        
+        wallet_transaction = WalletLedgerService.credit(self.user, 'inr', Decimal('50.00'), 'deposit')
+        
+        self.assertEqual(stale_wallet.balance, Decimal('100.00'))
+        self.assertEqual(wallet_transaction.balance_before, Decimal('250.00'))
+        self.assertEqual(wallet_transaction.balance_after, Decimal('300.00'))
+        self.inr_wallet.refresh_from_db()
+        self.assertEqual(self.inr_wallet.balance, Decimal('300.00'))
+    
+    def test_debit_rejects_insufficient_balance(self):
+        """Test that a debit never takes the balance below zero."""
+        with self.assertRaisesMessage(ValueError, "Insufficient balance"):
+            WalletLedgerService.debit(self.user, 'inr', Decimal('100.01'), 'withdrawal')
+        
+        wallet_transaction = WalletLedgerService.debit(self.user, 'inr', Decimal('100.00'), 'withdrawal')
+        
+        self.assertEqual(wallet_transaction.amount, Decimal('100.00'))
+        self.assertEqual(wallet_transaction.balance_after, Decimal('0.00'))
+        self.assertEqual(WalletTransaction.objects.filter(user=self.user).count(), 1)
+    
+    def test_non_positive_amounts_are_rejected(self):
+        """Test that a negative credit cannot turn into an unchecked debit."""
+        for amount in (Decimal('-500.00'), Decimal('0')):
+            with self.assertRaisesMessage(ValueError, "Amount must be positive"):
+                WalletLedgerService.credit(self.user, 'inr', amount, 'deposit')
+            with self.assertRaisesMessage(ValueError, "Amount must be positive"):
+                WalletLedgerService.debit(self.user, 'inr', amount, 'withdrawal')
+        
+        self.inr_wallet.refresh_from_db()
+        self.assertEqual(self.inr_wallet.balance, Decimal('100.00'))
+        self.assertFalse(WalletTransaction.objects.exists())
+    
+    def test_amounts_are_rounded_to_the_wallet_scale(self):
+        """Test that the logged amount and balances match the change the database applies."""
+        wallet_transaction = WalletLedgerService.credit(self.user, 'inr', Decimal('10.005'), 'deposit')
+        
+        self.assertEqual(wallet_transaction.amount, Decimal('10.01'))
+        self.assertEqual(wallet_transaction.balance_before, Decimal('100.00'))
+        self.assertEqual(wallet_transaction.balance_after, Decimal('110.01'))
+        
+        [batch_transaction] = WalletLedgerService.credit_many([
+            (self.user.id, 'inr', Decimal('0.994'), 'referral_bonus', 'ref-1'),
+        ])
+        
+        self.assertEqual(batch_transaction.amount, Decimal('0.99'))
+        self.assertEqual(batch_transaction.balance_before, Decimal('110.01'))
+        self.assertEqual(batch_transaction.balance_after, Decimal('111.00'))
+        self.inr_wallet.refresh_from_db()
+        self.assertEqual(self.inr_wallet.balance, Decimal('111.00'))
+        
+        with self.assertRaisesMessage(ValueError, "Amount must be positive"):
+            WalletLedgerService.credit(self.user, 'inr', Decimal('0.004'), 'deposit')
+    
+    def test_debit_records_requested_status(self):
+        """Test that a debit can be logged as pending, as withdrawal requests are."""
+        wallet_transaction = WalletLedgerService.debit(
+            self.user, 'inr', Decimal('40.00'), 'withdrawal', status='pending'
+        )
+        
+        self.assertEqual(wallet_transaction.status, 'pending')
+        self.assertEqual(wallet_transaction.balance_after, Decimal('60.00'))
+    
+    def test_usdt_credit_records_wallet_chain(self):
+        """Test that USDT credits record the wallet's chain type."""
+        wallet_transaction = WalletLedgerService.credit(self.user, 'usdt', Decimal('1.5'), 'usdt_deposit')
+        
+        self.assertEqual(wallet_transaction.wallet_type, 'usdt')
+        self.assertEqual(wallet_transaction.chain_type, self.usdt_wallet.chain_type)
+        self.assertEqual(wallet_transaction.balance_after, Decimal('1.500000'))
+    
+    def test_deposit_approval_credits_once(self):
+        """Test that approving a deposit twice credits the wallet once."""
+        deposit = DepositRequest.objects.create(
+            user=self.user, amount=Decimal('500.00'), payment_method='upi'
+        )
+        stale_deposit = DepositRequest.objects.get(id=deposit.id)
+        
+        self.assertTrue(deposit.approve(self.user))
+        self.assertFalse(stale_deposit.approve(self.user))
+        
+        self.inr_wallet.refresh_from_db()
+        self.assertEqual(self.inr_wallet.balance, Decimal('600.00'))
+        self.assertEqual(WalletTransaction.objects.filter(transaction_type='deposit').count(), 1)
+    
+    def test_credit_many_chains_balances_per_wallet(self):
+        """Test that a batch credit groups by currency and records running balances."""
+        other_user = User.objects.create_user(
+            username='ledgeruser2',
+            email='ledger2@example.com',
+            password='testpass123'
+        )
+        INRWallet.objects.get_or_create(user=other_user)
+        
+        transactions = WalletLedgerService.credit_many([
+            (self.user.id, 'inr', Decimal('10.00'), 'referral_bonus', 'ref-1'),
+            (other_user.id, 'INR', Decimal('5.00'), 'referral_bonus', 'ref-2'),
+            (self.user.id, 'usdt', Decimal('2.5'), 'admin_adjustment', 'ref-3'),
+            (self.user.id, 'inr', Decimal('20.00'), 'referral_bonus', 'ref-4', 'Second bonus'),
+        ])
+        
+        self.assertEqual(
+            [(tx.balance_before, tx.balance_after) for tx in transactions],
+            [
+                (Decimal('100.00'), Decimal('110.00')),
+                (Decimal('0.00'), Decimal('5.00')),
+                (Decimal('0'), Decimal('2.5')),
+                (Decimal('110.00'), Decimal('130.00')),
+            ]
+        )
+        self.inr_wallet.refresh_from_db()
+        self.assertEqual(self.inr_wallet.balance, Decimal('130.00'))
+        self.assertEqual(WalletTransaction.objects.filter(reference_id__startswith='ref-').count(), 4)
+    
+    def test_credit_many_missing_wallet(self):
+        """Test that a missing wallet fails the batch unless skipped."""
+        walletless_user = User.objects.create_user(
+            username='ledgeruser3',
+            email='ledger3@example.com',
+            password='testpass123'
+        )
+        INRWallet.objects.filter(user=walletless_user).delete()
+        credits = [
+            (self.user.id, 'inr', Decimal('10.00'), 'referral_bonus', 'ref-1'),
+            (walletless_user.id, 'inr', Decimal('10.00'), 'referral_bonus', 'ref-2'),
+        ]
+        
+        with self.assertRaises(INRWallet.DoesNotExist):
+            WalletLedgerService.credit_many(credits)
+        self.inr_wallet.refresh_from_db()
+        self.assertEqual(self.inr_wallet.balance, Decimal('100.00'))
+        
+        transactions = WalletLedgerService.credit_many(credits, skip_missing=True)
+        self.assertIsNotNone(transactions[0])
+        self.assertIsNone(transactions[1])
+    
+    def test_usdt_deposit_confirmation_credits_once(self):
+        """Test that confirming a USDT deposit twice credits the wallet once."""
+        deposit = USDTDepositRequest.objects.create(
+            user=self.user, chain_type='erc20', amount=Decimal('12.500000'), transaction_hash='0xconfirm',
+            from_address='0x' + 'f' * 40, to_address='0x' + 'a' * 40, confirmation_count=12
+        )
+        stale_deposit = USDTDepositRequest.objects.get(id=deposit.id)
+        
+        self.assertTrue(deposit.confirm_deposit(self.user))
+        self.assertFalse(stale_deposit.confirm_deposit(self.user))
+        
+        self.usdt_wallet.refresh_from_db()
+        self.assertEqual(self.usdt_wallet.balance, Decimal('12.500000'))
+        wallet_transaction = WalletTransaction.objects.get(transaction_type='usdt_deposit')
+        self.assertEqual(
+            (wallet_transaction.balance_before, wallet_transaction.balance_after, wallet_transaction.chain_type),
+            (Decimal('0'), Decimal('12.500000'), 'erc20')
+        )
+    
+    def test_manual_sweep_leaves_balance_alone(self):
+        """Test that a sweep only moves custody: it is logged before broadcast and never touches the ledger."""
+        from unittest.mock import MagicMock, patch
+        from eth_account import Account
+        from hexbytes import HexBytes
+        
+        from app.services.real_wallet_service import real_wallet_service
+        from app.wallet.models import SweepLog
+        
+        WalletLedgerService.credit(self.user, 'usdt', Decimal('30'), 'usdt_deposit')
+        w3 = MagicMock()
+        w3.eth.get_transaction_count.return_value = 0
+        w3.eth.gas_price = 1_000_000_000
+        w3.eth.account.sign_transaction.return_value = MagicMock(hash=HexBytes('0x' + 'ab' * 32))
+        private_key = Account.create().key.hex()
+        
+        def broadcast(raw_transaction):
+            # The pending log is written before the transfer is sent
+            self.assertEqual(SweepLog.objects.get(status='pending').transaction_hash, '0x' + 'ab' * 32)
+        
+        with patch.object(real_wallet_service, 'get_web3_connection', return_value=w3), \
+                patch.object(real_wallet_service, 'get_usdt_contract'), \
+                patch('app.services.rpc.get_token_decimals', return_value=6):
+            w3.eth.send_raw_transaction.side_effect = ValueError('nonce too low')
+            result = real_wallet_service.sweep_to_master_wallet(self.user, Decimal('20'), 'erc20', private_key)
+            self.assertEqual(result, {'success': False, 'error': 'nonce too low'})
+            
+            w3.eth.send_raw_transaction.side_effect = broadcast
+            result = real_wallet_service.sweep_to_master_wallet(self.user, Decimal('20'), 'erc20', private_key)
+        
+        self.assertTrue(result['success'])
+        self.usdt_wallet.refresh_from_db()
+        self.assertEqual(self.usdt_wallet.balance, Decimal('30'))
+        self.assertEqual(
+            sorted(SweepLog.objects.values_list('status', flat=True)), ['completed', 'failed']
+        )
+        self.assertFalse(WalletTransaction.objects.filter(transaction_type__in=['sweep', 'refund']).exists())
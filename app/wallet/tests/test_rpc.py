@@ -0,0 +1,133 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from app.services import rpc
+from app.services.real_wallet_service import real_wallet_service
+
+
+class LocalNode:
+    """Minimal JSON-RPC node on localhost answering balanceOf, receipts and the block number."""
+
+    def __init__(self):
+        self.balances = {}
+        self.receipts = {}
+        self.block_number = 1000
+        self.http_requests = 0
+        self.connections = set()
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                node.http_requests += 1
+                node.connections.add(self.client_address)
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                body = json.dumps([node.answer(call) for call in payload]).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def answer(self, call):
+        method, params = call['method'], call['params']
+        if method == 'eth_blockNumber':
+            result = hex(self.block_number)
+        elif method == 'eth_call' and params[0]['data'].startswith('0x' + rpc.BALANCE_OF_SELECTOR):
+            address = '0x' + params[0]['data'][-40:]
+            if address not in self.balances:
+                return {'jsonrpc': '2.0', 'id': call['id'], 'error': {'code': -32000, 'message': 'execution reverted'}}
+            result = hex(self.balances[address])
+        elif method == 'eth_getTransactionReceipt':
+            result = self.receipts.get(params[0])
+        else:
+            return {'jsonrpc': '2.0', 'id': call['id'], 'error': {'code': -32601, 'message': 'method not found'}}
+        return {'jsonrpc': '2.0', 'id': call['id'], 'result': result}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class PooledRPCTest(SimpleTestCase):
+    """Test cases for the pooled, batched RPC layer."""
+
+    def setUp(self):
+        """Start a local node holding 250 balances."""
+        self.node = LocalNode()
+        self.addCleanup(self.node.close)
+        self.addresses = ['0x' + f'{index + 1:040x}' for index in range(250)]
+        for index, address in enumerate(self.addresses):
+            self.node.balances[address] = (index + 1) * 1_000_000
+        # Decimals are read from the node once; seed them like a previous read would have
+        address = rpc.get_usdt_address('erc20').lower()
+        cache.set(f'wallet:rpc:erc20:{address}:decimals', 6, None)
+        self.addCleanup(rpc._decimals.clear)
+        settings_override = override_settings(ETHEREUM_RPC_URL=self.node.url, RPC_BATCH_SIZE=100)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_balances_are_read_in_batches(self):
+        """Test that 250 balances cost three HTTP requests over one kept-alive connection."""
+        unknown = '0x' + 'e' * 40
+        result = real_wallet_service.get_wallet_balances(self.addresses + [unknown, 'not-an-address'], 'erc20')
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['balances'][self.addresses[0]], '1')
+        self.assertEqual(result['balances'][self.addresses[-1]], '250')
+        self.assertEqual(result['errors'], {unknown: 'execution reverted', 'not-an-address': 'Invalid address'})
+        self.assertEqual(self.node.http_requests, 3)
+        self.assertEqual(len(self.node.connections), 1)
+
+        self.assertEqual(real_wallet_service.get_wallet_balance(self.addresses[1], 'erc20')['balance'], '2')
+
+    def test_transaction_statuses(self):
+        """Test that receipts and the block number come back from a single batch request."""
+        self.node.receipts['0xaa'] = {
+            'status': '0x1', 'blockNumber': hex(990), 'gasUsed': hex(21000), 'effectiveGasPrice': hex(5)
+        }
+        self.node.receipts['0xbb'] = {'status': '0x0', 'blockNumber': hex(1000), 'gasUsed': hex(30000)}
+
+        statuses = real_wallet_service.get_transaction_statuses(['0xaa', '0xbb', '0xcc'], 'erc20')['statuses']
+
+        self.assertEqual(self.node.http_requests, 1)
+        self.assertEqual(statuses['0xaa'], {
+            'success': True, 'status': 'success', 'confirmations': 10, 'block_number': 990,
+            'gas_used': 21000, 'effective_gas_price': 5
+        })
+        self.assertEqual(statuses['0xbb']['status'], 'failed')
+        self.assertEqual(statuses['0xcc'], {'success': False, 'error': 'Transaction not found'})
+
+    def test_shared_web3_and_contract(self):
+        """Test that connections and contract objects are built once per node."""
+        self.assertIs(rpc.get_web3('erc20'), real_wallet_service.get_web3_connection('erc20'))
+        self.assertIs(rpc.get_usdt_contract('erc20'), real_wallet_service.get_usdt_contract('erc20'))
+        self.assertEqual(rpc.get_web3('erc20').provider.endpoint_uri, self.node.url)
+        self.assertEqual(rpc.get_token_decimals('erc20'), 6)
+
+    def test_async_client_batches_concurrently(self):
+        """Test that the async client splits calls into batches and keeps the results in order."""
+        async def read():
+            async with rpc.AsyncRPCClient('erc20', batch_size=40) as client:
+                balances = await client.get_token_balances(self.addresses)
+                block_number, receipts = await client.get_transaction_receipts(['0xcc'])
+            return balances, block_number, receipts
+
+        balances, block_number, receipts = asyncio.run(read())
+
+        self.assertEqual(balances, [(index + 1) * 1_000_000 for index in range(250)])
+        self.assertEqual((block_number, receipts), (1000, [None]))
+        self.assertEqual(self.node.http_requests, 8)
@@ -0,0 +1,209 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+import rlp
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from eth_account import Account
+from eth_utils import keccak
+
+from app.services.real_wallet_service import real_wallet_service
+from app.services.sweeper import DepositSweeper, LocalSweepRPC, NonceManager
+from app.wallet.models import SweepLog, USDTDepositRequest
+
+User = get_user_model()
+
+
+@override_settings(SWEEP_CONFIRMATIONS=3, SWEEP_PENDING_TIMEOUT=3600)
+class DepositSweeperTest(TestCase):
+    """Test cases for the batched master-wallet sweeper."""
+
+    def setUp(self):
+        """Set up two deposit wallets with confirmed deposits."""
+        self.accounts = []
+        for index in range(2):
+            user = User.objects.create_user(
+                username=f'sweepee{index}',
+                email=f'sweepee{index}@example.com',
+                password='testpass123'
+            )
+            account = Account.create()
+            wallet = user.usdt_wallet
+            wallet.wallet_address = account.address
+            wallet.private_key_encrypted = real_wallet_service.fernet.encrypt(account.key.hex().encode()).decode()
+            wallet.is_real_wallet = True
+            wallet.save()
+            self.accounts.append((user, account))
+
+        self.deposits = [
+            self._deposit(self.accounts[0], '10.000000', '0xa1'),
+            self._deposit(self.accounts[0], '5.500000', '0xa2'),
+            self._deposit(self.accounts[1], '20.000000', '0xb1'),
+        ]
+        # Above the auto-sweep threshold: left for a manual sweep
+        self._deposit(self.accounts[1], '5000.000000', '0xb2')
+
+    def _deposit(self, owner, amount, tx_hash):
+        user, account = owner
+        return USDTDepositRequest.objects.create(
+            user=user, chain_type='erc20', amount=Decimal(amount), transaction_hash=tx_hash,
+            from_address='0x' + 'f' * 40, to_address=account.address.lower(), status='confirmed'
+        )
+
+    def test_sweep_batches_per_wallet(self):
+        """Test that a batch costs one gas price read and one nonce read per key."""
+        rpc = LocalSweepRPC()
+        sender = self.accounts[0][1].address.lower()
+        rpc.nonces[sender] = 7
+
+        result = DepositSweeper('erc20', rpc=rpc).sweep()
+
+        self.assertEqual((result['deposit_count'], result['sweep_count'], result['failed_count']), (3, 2, 0))
+        self.assertEqual(rpc.calls['gas_price'], 1)
+        self.assertEqual(rpc.calls['transaction_count'], 2)
+        self.assertEqual(rpc.nonces[sender], 8)
+
+        transfers = {sent_by: rlp.decode(raw) for sent_by, _, raw in rpc.sent}
+        data = transfers[sender][5].hex()
+        self.assertTrue(data.startswith('a9059cbb'))
+        self.assertEqual(int(data[-64:], 16), 15_500_000)
+
+        # Broadcast, but not swept until the receipts are in
+        self.assertEqual(
+            sorted(USDTDepositRequest.objects.values_list('transaction_hash', 'status')),
+            [('0xa1', 'sweeping'), ('0xa2', 'sweeping'), ('0xb1', 'sweeping'), ('0xb2', 'confirmed')]
+        )
+        self.assertEqual(SweepLog.objects.filter(status='pending').count(), 2)
+
+        rpc.mine(2)
+        result = DepositSweeper('erc20', rpc=rpc).sweep()
+
+        self.assertEqual(result['reconciled'], {'completed': 2, 'failed': 0, 'pending': 0})
+        self.assertEqual(rpc.calls['transaction_receipts'], 2)
+        self.assertEqual(
+            sorted(USDTDepositRequest.objects.values_list('transaction_hash', 'status')),
+            [('0xa1', 'swept'), ('0xa2', 'swept'), ('0xb1', 'swept'), ('0xb2', 'confirmed')]
+        )
+        swept = USDTDepositRequest.objects.get(transaction_hash='0xa1')
+        self.assertEqual(swept.sweep_type, 'auto')
+        self.assertEqual(swept.sweep_tx_hash, USDTDepositRequest.objects.get(transaction_hash='0xa2').sweep_tx_hash)
+        self.assertEqual(SweepLog.objects.filter(status='completed').count(), 2)
+        # Nothing left to sweep automatically
+        self.assertEqual(result['sweep_count'], 0)
+
+    def test_failed_transfer_is_logged_and_retried(self):
+        """Test that a transfer the node rejects is logged and its deposits stay confirmed."""
+        failing = self.accounts[1][1].address
+        rpc = LocalSweepRPC(failing_senders=[failing])
+
+        result = DepositSweeper('erc20', rpc=rpc).sweep()
+
+        self.assertEqual((result['sweep_count'], result['failed_count']), (1, 1))
+        log = SweepLog.objects.get(status='failed')
+        self.assertEqual(log.from_address, failing)
+        self.assertIn('insufficient funds', log.error_message)
+        deposit = USDTDepositRequest.objects.get(transaction_hash='0xb1')
+        self.assertEqual((deposit.status, deposit.sweep_tx_hash), ('confirmed', None))
+
+        rpc.failing_senders.clear()
+        self.assertEqual(DepositSweeper('erc20', rpc=rpc).sweep()['deposit_count'], 1)
+
+    def test_deposits_are_claimed_before_broadcast(self):
+        """Test that the deposits and pending sweep logs are written before a transfer is sent."""
+        rpc = LocalSweepRPC()
+        sweeper = DepositSweeper('erc20', rpc=rpc)
+
+        jobs, _, gas_fee = sweeper._claim(None, 'auto')
+
+        self.assertEqual(rpc.sent, [])
+        self.assertEqual(
+            sorted(SweepLog.objects.values_list('transaction_hash', 'status')),
+            sorted((job['tx_hash'], 'pending') for job in jobs)
+        )
+        self.assertEqual(USDTDepositRequest.objects.filter(status='sweeping').count(), 3)
+        # A claimed deposit is not picked up again
+        self.assertFalse(sweeper.get_pending_deposits().exists())
+
+        for job in jobs:
+            job.update(sweeper._broadcast(job))
+        sweeper._record(jobs)
+
+        self.assertEqual(set(SweepLog.objects.values_list('status', flat=True)), {'pending'})
+        self.assertEqual(set(SweepLog.objects.values_list('gas_fee', flat=True)), {gas_fee.quantize(Decimal('0.000001'))})
+
+        rpc.mine(2)
+        self.assertEqual(sweeper._reconcile(), {'completed': 2, 'failed': 0, 'pending': 0})
+        self.assertEqual(set(SweepLog.objects.values_list('status', flat=True)), {'completed'})
+        self.assertEqual(USDTDepositRequest.objects.filter(status='swept').count(), 3)
+        self.assertEqual(
+            {tx_hash for _, _, raw in rpc.sent for tx_hash in ['0x' + keccak(raw).hex()]},
+            {job['tx_hash'] for job in jobs}
+        )
+
+    def test_lost_broadcast_response_is_not_swept_again(self):
+        """Test that a broadcast whose answer is lost stays sweeping with its hash until its receipt is read."""
+        sender = self.accounts[1][1].address
+        rpc = LocalSweepRPC(lost_response_senders=[sender])
+
+        result = DepositSweeper('erc20', rpc=rpc).sweep()
+
+        self.assertEqual((result['sweep_count'], result['failed_count'], result['unknown_count']), (1, 0, 1))
+        deposit = USDTDepositRequest.objects.get(transaction_hash='0xb1')
+        log = SweepLog.objects.get(from_address=sender)
+        self.assertEqual((deposit.status, deposit.sweep_tx_hash), ('sweeping', log.transaction_hash))
+        self.assertEqual(log.status, 'pending')
+        self.assertIn('Connection reset', log.error_message)
+
+        rpc.mine(3)
+        result = DepositSweeper('erc20', rpc=rpc).sweep()
+
+        self.assertEqual(result['reconciled']['completed'], 2)
+        self.assertEqual(USDTDepositRequest.objects.get(transaction_hash='0xb1').status, 'swept')
+        self.assertEqual(sum(1 for sent_by, _, _ in rpc.sent if sent_by == sender.lower()), 1)
+
+    def test_reverted_transfer_is_failed(self):
+        """Test that a mined transfer with receipt status 0 is never booked as swept."""
+        sender = self.accounts[1][1].address
+        rpc = LocalSweepRPC(reverting_senders=[sender])
+        sweeper = DepositSweeper('erc20', rpc=rpc)
+        sweeper.sweep()
+
+        rpc.mine(3)
+        self.assertEqual(sweeper._reconcile(), {'completed': 1, 'failed': 1, 'pending': 0})
+
+        log = SweepLog.objects.get(from_address=sender)
+        self.assertEqual(log.status, 'failed')
+        self.assertIn('reverted', log.error_message)
+        deposit = USDTDepositRequest.objects.get(transaction_hash='0xb1')
+        self.assertEqual((deposit.status, deposit.sweep_tx_hash), ('failed', log.transaction_hash))
+        self.assertEqual(USDTDepositRequest.objects.get(transaction_hash='0xa1').status, 'swept')
+
+    def test_claim_left_by_dead_run_is_settled(self):
+        """Test that transfers a dead run claimed but never sent are failed once they time out."""
+        rpc = LocalSweepRPC()
+        sweeper = DepositSweeper('erc20', rpc=rpc)
+        sweeper._claim(None, 'auto')
+
+        self.assertEqual(sweeper._reconcile(), {'completed': 0, 'failed': 0, 'pending': 2})
+
+        SweepLog.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(sweeper._reconcile(), {'completed': 0, 'failed': 2, 'pending': 0})
+        self.assertEqual(
+            set(USDTDepositRequest.objects.exclude(transaction_hash='0xb2').values_list('status', flat=True)),
+            {'failed'}
+        )
+        self.assertEqual(set(SweepLog.objects.values_list('status', flat=True)), {'failed'})
+
+    def test_nonce_manager_hands_out_sequential_nonces(self):
+        """Test that concurrent reservations for one key get distinct, consecutive nonces."""
+        rpc = LocalSweepRPC()
+        rpc.nonces['0xkey'] = 3
+        nonces = NonceManager(rpc)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            reserved = sorted(pool.map(lambda _: nonces.reserve('0xkey'), range(20)))
+
+        self.assertEqual(reserved, list(range(3, 23)))
+        self.assertEqual(rpc.calls['transaction_count'], 1)
@@ -0,0 +1,324 @@
+import json
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from app.services.real_wallet_service import real_wallet_service
+from app.wallet.models import MoralisWebhookEvent, USDTDepositRequest, USDTWallet, WalletTransaction
+from app.wallet.tasks import MORALIS_INBOX_PENDING_KEY, SWEEP_PENDING_KEY
+from app.wallet import address_index
+
+User = get_user_model()
+
+DEPOSIT_ADDRESS = '0x742d35cc6634c0532925a3b8d404d1deba4cb61f'
+
+
+class MoralisWebhookInboxTest(TestCase):
+    """Test cases for the Moralis webhook inbox and its consumer."""
+
+    def setUp(self):
+        """Set up a user with a real deposit wallet."""
+        cache.delete(MORALIS_INBOX_PENDING_KEY)
+        cache.delete(SWEEP_PENDING_KEY.format(chain_type='erc20'))
+        self.user = User.objects.create_user(
+            username='depositor',
+            email='depositor@example.com',
+            password='testpass123'
+        )
+        wallet = USDTWallet.objects.get(user=self.user)
+        wallet.wallet_address = '0x742d35Cc6634C0532925a3b8D404d1deBa4Cb61f'
+        wallet.chain_type = 'erc20'
+        wallet.is_real_wallet = True
+        wallet.save()
+        self.payload = {
+            'to': DEPOSIT_ADDRESS,
+            'from': '0x1234567890123456789012345678901234567890',
+            'value': '25000000',
+            'hash': '0xabc123',
+            'chain': 'eth',
+        }
+
+    def _post(self, payload):
+        return self.client.post(
+            reverse('moralis-usdt-webhook'), data=json.dumps(payload), content_type='application/json'
+        )
+
+    @patch('app.wallet.tasks.process_moralis_webhook_inbox.apply_async')
+    def test_webhook_only_stores_event(self, apply_async):
+        """Test that the endpoint stores each transaction once and credits nothing."""
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._post(self.payload)
+            retry = self._post(self.payload)
+        invalid = self._post(dict(self.payload, chain='tron'))
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(invalid.status_code, 400)
+        self.assertEqual(MoralisWebhookEvent.objects.get().status, 'pending')
+        self.assertFalse(USDTDepositRequest.objects.exists())
+        apply_async.assert_called_once()
+
+    @patch('app.wallet.tasks.sweep_confirmed_deposits.apply_async')
+    def test_consumer_credits_and_queues_sweep(self, sweep_async):
+        """Test that the consumer credits deposits, ignores foreign transfers and queues sweeps."""
+        MoralisWebhookEvent.objects.create(
+            transaction_hash=self.payload['hash'], chain_type='erc20', payload=self.payload
+        )
+        MoralisWebhookEvent.objects.create(
+            transaction_hash='0xforeign', chain_type='erc20',
+            payload=dict(self.payload, hash='0xforeign', to='0x' + '9' * 40)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = real_wallet_service.process_webhook_inbox()
+
+        self.assertEqual((counts['claimed'], counts['processed'], counts['ignored']), (2, 1, 1))
+        deposit = USDTDepositRequest.objects.get()
+        self.assertEqual(deposit.amount, Decimal('25.000000'))
+        self.assertEqual(USDTWallet.objects.get(user=self.user).balance, Decimal('25.000000'))
+        self.assertEqual(WalletTransaction.objects.filter(transaction_type='usdt_deposit').count(), 1)
+        self.assertEqual(
+            dict(MoralisWebhookEvent.objects.values_list('transaction_hash', 'status')),
+            {'0xabc123': 'processed', '0xforeign': 'ignored'}
+        )
+        sweep_async.assert_called_once_with(args=['erc20'], countdown=30)
+
+        # A drained inbox is a no-op
+        self.assertEqual(real_wallet_service.process_webhook_inbox()['claimed'], 0)
+
+    def test_consumer_retries_then_fails(self):
+        """Test that an event that raises stays pending until its attempts run out."""
+        MoralisWebhookEvent.objects.create(
+            transaction_hash=self.payload['hash'], chain_type='erc20', payload=self.payload
+        )
+
+        with self.settings(MORALIS_INBOX_MAX_ATTEMPTS=2), \
+                patch.object(real_wallet_service, 'credit_moralis_transfers', side_effect=RuntimeError('RPC down')):
+            self.assertEqual(real_wallet_service.process_webhook_inbox()['retrying'], 1)
+            self.assertEqual(real_wallet_service.process_webhook_inbox()['failed'], 1)
+
+        event = MoralisWebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts, event.error_message), ('failed', 2, 'RPC down'))
+
+
+class MoralisStreamPayloadTest(TestCase):
+    """Test cases for multi-transfer Moralis stream payloads."""
+
+    USDT = '0xdac17f958d2ee523a2206206994597c13d831ec7'
+
+    def setUp(self):
+        """Set up users with real deposit wallets."""
+        cache.delete(MORALIS_INBOX_PENDING_KEY)
+        self.addresses = []
+        for index in range(20):
+            user = User.objects.create_user(
+                username=f'streamer{index}',
+                email=f'streamer{index}@example.com',
+                password='testpass123'
+            )
+            address = '0x' + f'{index + 1:040x}'
+            wallet = user.usdt_wallet
+            wallet.wallet_address = address.upper().replace('0X', '0x')
+            wallet.chain_type = 'erc20'
+            wallet.is_real_wallet = True
+            wallet.save()
+            self.addresses.append(address)
+
+    def _stream(self, confirmed=True):
+        transfers = [
+            {
+                'transactionHash': f'0xtx{index}', 'logIndex': str(index), 'contract': self.USDT,
+                'from': '0x' + 'f' * 40, 'to': address, 'value': '2000000', 'tokenDecimals': '6',
+            }
+            for index, address in enumerate(self.addresses)
+        ]
+        transfers.append({
+            'transactionHash': '0xforeign', 'logIndex': '90', 'contract': self.USDT,
+            'from': '0x' + 'f' * 40, 'to': '0x' + 'e' * 40, 'value': '2000000', 'tokenDecimals': '6',
+        })
+        transfers.append({
+            'transactionHash': '0xothertoken', 'logIndex': '91', 'contract': '0x' + 'c' * 40,
+            'from': '0x' + 'f' * 40, 'to': self.addresses[0], 'value': '2000000', 'tokenDecimals': '6',
+        })
+        return {
+            'confirmed': confirmed,
+            'chainId': '0x1',
+            'block': {'number': '19000000'},
+            'erc20Transfers': transfers,
+            'logs': [{
+                # Undecoded Transfer of 3 USDT to the first wallet
+                'transactionHash': '0xrawlog', 'logIndex': '92', 'address': self.USDT,
+                'topic0': '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef',
+                'topic1': '0x' + '0' * 24 + 'f' * 40,
+                'topic2': '0x' + '0' * 24 + self.addresses[0][2:],
+                'data': hex(3000000),
+            }],
+        }
+
+    @patch('app.wallet.tasks.sweep_confirmed_deposits.apply_async')
+    @patch('app.wallet.tasks.process_moralis_webhook_inbox.apply_async')
+    def test_stream_payload_is_credited_in_bulk(self, apply_async, sweep_async):
+        """Test that a stream delivery is split into inbox events and credited with a few queries."""
+        self.assertEqual(real_wallet_service.enqueue_moralis_webhook(self._stream(confirmed=False))['transfer_count'], 0)
+        with patch.object(address_index, 'is_shared', return_value=True):
+            result = real_wallet_service.enqueue_moralis_webhook(self._stream())
+            # The transfer to a foreign address never reaches the inbox
+            self.assertEqual(result['transfer_count'], 21)
+        # Without a shared cache the filter is not trusted and the consumer sorts it out
+        with patch.object(address_index, 'is_shared', return_value=False):
+            real_wallet_service.enqueue_moralis_webhook(self._stream())
+        self.assertEqual(MoralisWebhookEvent.objects.count(), 22)
+
+        with CaptureQueriesContext(connection) as queries:
+            counts = real_wallet_service.process_webhook_inbox()
+
+        self.assertEqual((counts['processed'], counts['ignored']), (21, 1))
+        self.assertLess(len(queries), 20)
+        self.assertEqual(USDTDepositRequest.objects.count(), 21)
+        self.assertEqual(
+            USDTWallet.objects.get(user__username='streamer0').balance, Decimal('5.000000')
+        )
+        self.assertEqual(WalletTransaction.objects.filter(transaction_type='usdt_deposit').count(), 21)
+
+        # Crediting the same transfers again is a no-op
+        results = real_wallet_service.process_moralis_webhook(self._stream())['results']
+        self.assertEqual({result['error'] for result in results}, {
+            'Deposit already processed', f"No wallet found for address: {'0x' + 'e' * 40}"
+        })
+
+    @patch('app.wallet.tasks.sweep_confirmed_deposits.apply_async')
+    def test_bsc_transfers_use_18_decimals(self, sweep_async):
+        """Test that BSC transfers without decimals in the payload are read with 18 decimals."""
+        bsc_usdt = '0x55d398326f99059ff775485246999027b3197955'
+        USDTWallet.objects.filter(user__username__in=['streamer0', 'streamer1']).update(chain_type='bep20')
+        stream = {
+            'confirmed': True,
+            'chainId': '0x38',
+            'block': {'number': '35000000'},
+            'erc20Transfers': [{
+                'transactionHash': '0xbscdecoded', 'logIndex': '1', 'contract': bsc_usdt,
+                'from': '0x' + 'f' * 40, 'to': self.addresses[1], 'value': str(25 * 10 ** 17),
+            }],
+            'logs': [{
+                # Undecoded Transfer of 1 USDT to the first wallet
+                'transactionHash': '0xbscrawlog', 'logIndex': '2', 'address': bsc_usdt,
+                'topic0': '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef',
+                'topic1': '0x' + '0' * 24 + 'f' * 40,
+                'topic2': '0x' + '0' * 24 + self.addresses[0][2:],
+                'data': hex(10 ** 18),
+            }],
+        }
+
+        result = real_wallet_service.process_moralis_webhook(stream)
+
+        self.assertEqual(result['credited_count'], 2)
+        self.assertEqual(
+            sorted(USDTDepositRequest.objects.values_list('transaction_hash', 'chain_type', 'amount')),
+            [('0xbscdecoded', 'bep20', Decimal('2.500000')), ('0xbscrawlog', 'bep20', Decimal('1.000000'))]
+        )
+        self.assertEqual(USDTWallet.objects.get(user__username='streamer0').balance, Decimal('1.000000'))
+
+    @patch('app.wallet.tasks.sweep_confirmed_deposits.apply_async')
+    @patch('app.wallet.tasks.process_moralis_webhook_inbox.apply_async')
+    def test_transfers_of_one_transaction_are_credited_separately(self, apply_async, sweep_async):
+        """Test that two transfers to two of our users in one transaction are both credited."""
+        stream = {
+            'confirmed': True,
+            'chainId': '0x1',
+            'block': {'number': '19000000'},
+            'erc20Transfers': [
+                {
+                    'transactionHash': '0xbatchpayout', 'logIndex': str(log_index), 'contract': self.USDT,
+                    'from': '0x' + 'f' * 40, 'to': address, 'value': '2000000', 'tokenDecimals': '6',
+                }
+                for log_index, address in ((4, self.addresses[0]), (7, self.addresses[1]))
+            ],
+        }
+
+        with patch.object(address_index, 'is_shared', return_value=True):
+            self.assertEqual(real_wallet_service.enqueue_moralis_webhook(stream)['transfer_count'], 2)
+            real_wallet_service.enqueue_moralis_webhook(stream)
+        self.assertEqual(
+            sorted(MoralisWebhookEvent.objects.values_list('transaction_hash', 'log_index')),
+            [('0xbatchpayout', 4), ('0xbatchpayout', 7)]
+        )
+
+        self.assertEqual(real_wallet_service.process_webhook_inbox()['processed'], 2)
+        self.assertEqual(
+            sorted(USDTDepositRequest.objects.values_list('log_index', 'user__username')),
+            [(4, 'streamer0'), (7, 'streamer1')]
+        )
+        for username in ('streamer0', 'streamer1'):
+            self.assertEqual(USDTWallet.objects.get(user__username=username).balance, Decimal('2.000000'))
+
+        # Redelivered, or reported without log indexes, the transaction is not credited again
+        results = real_wallet_service.process_moralis_webhook(stream)['results']
+        self.assertEqual({result['error'] for result in results}, {'Deposit already processed'})
+        flat = {'to': self.addresses[0], 'from': '0x' + 'f' * 40, 'value': '2000000', 'hash': '0xbatchpayout', 'chain': 'eth'}
+        self.assertEqual(real_wallet_service.process_moralis_webhook(flat)['error'], 'Deposit already processed')
+        self.assertEqual(WalletTransaction.objects.filter(transaction_type='usdt_deposit').count(), 2)
+
+
+class DepositAddressIndexTest(TestCase):
+    """Test cases for the normalized deposit address column and the address filter."""
+
+    def setUp(self):
+        """Set up a user with a real deposit wallet."""
+        self.user = User.objects.create_user(
+            username='indexed',
+            email='indexed@example.com',
+            password='testpass123'
+        )
+        self.wallet = self.user.usdt_wallet
+        self.wallet.wallet_address = '0xAbCdEf0000000000000000000000000000000001'
+        self.wallet.is_real_wallet = True
+        self.wallet.save()
+
+    def test_address_is_normalized_and_unique_per_chain(self):
+        """Test that the lowercased address is stored and cannot be reused on the same chain."""
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.normalized_address, '0xabcdef0000000000000000000000000000000001')
+
+        other = User.objects.create_user(username='clash', email='clash@example.com', password='testpass123')
+        other_wallet = other.usdt_wallet
+        other_wallet.wallet_address = '0xABCDEF0000000000000000000000000000000001'
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            other_wallet.save()
+
+        other_wallet.chain_type = 'bep20'
+        other_wallet.save()
+
+    @patch.object(address_index, 'is_shared', return_value=True)
+    def test_filter_tracks_new_addresses(self, is_shared):
+        """Test that the filter rules out foreign addresses and sees new ones at once."""
+        foreign = '0x' + '9' * 40
+        self.assertEqual(
+            address_index.filter_candidates('erc20', [self.wallet.wallet_address, foreign]),
+            {'0xabcdef0000000000000000000000000000000001'}
+        )
+
+        self.wallet.wallet_address = foreign
+        self.wallet.save()
+
+        self.assertEqual(address_index.filter_candidates('erc20', [foreign.upper()]), {foreign})
+        self.assertEqual(address_index.filter_candidates('bep20', [foreign]), set())
+
+    def test_process_local_cache_fails_open(self):
+        """Test that an address another process added is kept when the cache is not shared."""
+        with patch.object(address_index, 'is_shared', return_value=True):
+            address_index.get_filter('erc20')
+        # Added elsewhere: this process's filter copy is not invalidated
+        added = '0x' + '7' * 40
+        USDTWallet.objects.filter(id=self.wallet.id).update(normalized_address=added)
+
+        with patch.object(address_index, 'is_shared', return_value=True):
+            self.assertEqual(address_index.filter_candidates('erc20', [added]), set())
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertFalse(address_index.is_shared())
+            self.assertEqual(address_index.filter_candidates('erc20', [added]), {added})
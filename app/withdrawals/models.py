@@ -300,46 +300,22 @@ class Withdrawal(TimeStampedModel):
     
     def _refund_to_wallet(self):
         """Refund the withdrawal amount back to user's wallet."""
-        from app.wallet.models import INRWallet, USDTWallet, WalletTransaction
+        from app.wallet.services import WalletLedgerService
         
         try:
-            if self.currency == 'INR':
-                wallet = INRWallet.objects.get(user=self.user)
-                if wallet.add_balance(self.total_amount):
-                    # Create transaction log
-                    WalletTransaction.objects.create(
-                        user=self.user,
-                        transaction_type='refund',
-                        wallet_type='inr',
-                        amount=self.total_amount,
-                        balance_before=wallet.balance - self.total_amount,
-                        balance_after=wallet.balance,
-                        status='completed',
-                        reference_id=str(self.id),
-                        description=f"Withdrawal refund - {self.get_status_display()}",
-                        metadata={'withdrawal_id': str(self.id)}
-                    )
-                    return True, "Amount refunded to INR wallet"
+            if self.currency not in ('INR', 'USDT'):
+                return False, "Failed to refund amount to wallet"
             
-            elif self.currency == 'USDT':
-                wallet = USDTWallet.objects.get(user=self.user)
-                if wallet.add_balance(self.total_amount):
-                    # Create transaction log
-                    WalletTransaction.objects.create(
-                        user=self.user,
-                        transaction_type='refund',
-                        wallet_type='usdt',
-                        amount=self.total_amount,
-                        balance_before=wallet.balance - self.total_amount,
-                        balance_after=wallet.balance,
-                        status='completed',
-                        reference_id=str(self.id),
-                        description=f"Withdrawal refund - {self.get_status_display()}",
-                        metadata={'withdrawal_id': str(self.id)}
-                    )
-                    return True, "Amount refunded to USDT wallet"
-            
-            return False, "Failed to refund amount to wallet"
+            WalletLedgerService.credit(
+                self.user,
+                self.currency.lower(),
+                self.total_amount,
+                'refund',
+                reference_id=str(self.id),
+                description=f"Withdrawal refund - {self.get_status_display()}",
+                metadata={'withdrawal_id': str(self.id)}
+            )
+            return True, f"Amount refunded to {self.currency} wallet"
         
         except Exception as e:
             return False, f"Error refunding amount: {str(e)}"
@@ -2,7 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import Withdrawal, WithdrawalSettings
 import json
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Sum
 from app.wallet.models import INRWallet, USDTWallet
 from django.utils import timezone
@@ -199,14 +199,12 @@ class WithdrawalRequestSerializer(serializers.ModelSerializer):
         if not isinstance(validated_data['payout_details'], str):
             validated_data['payout_details'] = json.dumps(validated_data['payout_details'])
         
-        # Create withdrawal instance
-        withdrawal = Withdrawal.objects.create(**validated_data)
-        
-        # Immediately deduct balance to prevent double-spending
-        self.deduct_wallet_balance(withdrawal)
-        
-        # Create transaction log
-        self.create_transaction_log(withdrawal)
+        with transaction.atomic():
+            # Create withdrawal instance
+            withdrawal = Withdrawal.objects.create(**validated_data)
+            
+            # Immediately deduct balance and log it to prevent double-spending
+            self.deduct_wallet_balance(withdrawal)
 
         # if currency == 'USDT' and amount <= 100:
         #     print(f"✅ Auto-approving small USDT withdrawal (Amount: {amount})")
@@ -232,57 +230,35 @@ class WithdrawalRequestSerializer(serializers.ModelSerializer):
         return withdrawal    
     
     def deduct_wallet_balance(self, withdrawal):
-        """Deduct withdrawal amount from user's wallet."""
-        from app.wallet.models import INRWallet, USDTWallet
+        """Deduct withdrawal amount from user's wallet and log a pending transaction."""
+        from app.wallet.services import WalletLedgerService
         
-        # Calculate total amount (amount + fee)
-        total_amount = withdrawal.amount + withdrawal.fee
-        
-        if withdrawal.currency == 'INR':
-            wallet = INRWallet.objects.get(user=withdrawal.user)
-            if not wallet.deduct_balance(total_amount):
-                raise serializers.ValidationError("Failed to deduct balance from INR wallet")
-            # Save the wallet after deduction
-            wallet.save()
-        
-        elif withdrawal.currency == 'USDT':
-            wallet = USDTWallet.objects.get(user=withdrawal.user)
-            if not wallet.deduct_balance(total_amount):
-                raise serializers.ValidationError("Failed to deduct balance from USDT wallet")
-            # Save the wallet after deduction
-            wallet.save()
-    
-    def create_transaction_log(self, withdrawal):
-        """Create transaction log for withdrawal request."""
-        from app.wallet.models import WalletTransaction, INRWallet, USDTWallet
+        if withdrawal.currency not in ('INR', 'USDT'):
+            raise serializers.ValidationError(f"Unsupported currency: {withdrawal.currency}")
         
         # Calculate total amount (amount + fee)
         total_amount = withdrawal.amount + withdrawal.fee
         
-        # Get current wallet balance after deduction
-        if withdrawal.currency == 'INR':
-            wallet = INRWallet.objects.get(user=withdrawal.user)
-            wallet_type = 'inr'
-        else:
-            wallet = USDTWallet.objects.get(user=withdrawal.user)
-            wallet_type = 'usdt'
-        
-        WalletTransaction.objects.create(
-            user=withdrawal.user,
-            transaction_type='withdrawal',
-            wallet_type=wallet_type,
-            amount=total_amount,
-            balance_before=wallet.balance + total_amount,
-            balance_after=wallet.balance,
-            status='pending',
-            reference_id=str(withdrawal.id),
-            description=f"Withdrawal request - {withdrawal.payout_method}",
-            metadata={
-                'withdrawal_id': str(withdrawal.id),
-                'payout_method': withdrawal.payout_method,
-                'fee': str(withdrawal.fee)
-            }
-        )
+        # Active and sufficient-balance checks are applied atomically by the ledger
+        try:
+            WalletLedgerService.debit(
+                withdrawal.user,
+                withdrawal.currency.lower(),
+                total_amount,
+                'withdrawal',
+                reference_id=str(withdrawal.id),
+                description=f"Withdrawal request - {withdrawal.payout_method}",
+                metadata={
+                    'withdrawal_id': str(withdrawal.id),
+                    'payout_method': withdrawal.payout_method,
+                    'fee': str(withdrawal.fee)
+                },
+                status='pending'
+            )
+        except ValueError as e:
+            raise serializers.ValidationError(
+                f"Failed to deduct balance from {withdrawal.currency} wallet: {e}"
+            )
     
     def get_client_ip(self, request):
         """Get client IP address from request."""
@@ -198,6 +198,17 @@ REDIS_HOST = config('REDIS_HOST', default='localhost')
 REDIS_PORT = config('REDIS_PORT', default=6379, cast=int)
 REDIS_DB = config('REDIS_DB', default=0, cast=int)
 
+# Cache shared by all web and worker processes. The referral catalogue, the
+# deposit address filters and the task debounce keys must be seen by every
+# process; a process-local backend (LocMemCache) only suits a single process
+REDIS_CACHE_DB = config('REDIS_CACHE_DB', default=1, cast=int)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.redis.RedisCache'),
+        'LOCATION': config('CACHE_LOCATION', default=f'redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_CACHE_DB}'),
+    }
+}
+
 # Celery Configuration
 CELERY_BROKER_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}'
 CELERY_RESULT_BACKEND = f'redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}'
@@ -206,6 +217,57 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Number of user_id partitions the ROI coordinator task fans out to workers
+ROI_PARTITION_COUNT = config('ROI_PARTITION_COUNT', default=8, cast=int)
+
+# Seconds a fanned-out ROI run may go without progress on any partition before
+# the coordinator task treats it as failed and resumes it
+ROI_FANOUT_STALE_TIMEOUT = config('ROI_FANOUT_STALE_TIMEOUT', default=3600, cast=int)
+
+# Credit every elapsed ROI cycle in one run (e.g. after downtime) and whether to
+# write one wallet transaction per cycle ('per_cycle') or per investment ('aggregate')
+ROI_CATCH_UP = config('ROI_CATCH_UP', default=False, cast=bool)
+ROI_CATCH_UP_TRANSACTION_MODE = config('ROI_CATCH_UP_TRANSACTION_MODE', default='per_cycle')
+
+# Seconds the active referral config and milestone list stay in the shared cache,
+# and in each process's memory before it re-reads the shared cache
+REFERRAL_CACHE_TIMEOUT = config('REFERRAL_CACHE_TIMEOUT', default=3600, cast=int)
+REFERRAL_LOCAL_CACHE_TTL = config('REFERRAL_LOCAL_CACHE_TTL', default=30, cast=int)
+
+# Seconds a milestone evaluation is held back after referral bonuses are paid,
+# so a burst of bonuses is evaluated in one run
+REFERRAL_MILESTONE_CHECK_DELAY = config('REFERRAL_MILESTONE_CHECK_DELAY', default=60, cast=int)
+
+# Key of the permutation that turns the referral code sequence into codes.
+# Changing it reshuffles future codes; existing codes stay valid
+REFERRAL_CODE_KEY = config('REFERRAL_CODE_KEY', default=SECRET_KEY)
+
+# Moralis webhook events credited per inbox batch, and delivery attempts before
+# an event that keeps raising is marked failed
+MORALIS_INBOX_BATCH_SIZE = config('MORALIS_INBOX_BATCH_SIZE', default=200, cast=int)
+MORALIS_INBOX_MAX_ATTEMPTS = config('MORALIS_INBOX_MAX_ATTEMPTS', default=5, cast=int)
+
+# Deposits per sweep batch, transfers broadcast at once, and seconds a sweep is
+# held back after a deposit is credited so a burst of deposits is swept together
+SWEEP_BATCH_SIZE = config('SWEEP_BATCH_SIZE', default=200, cast=int)
+SWEEP_MAX_PARALLEL = config('SWEEP_MAX_PARALLEL', default=8, cast=int)
+SWEEP_BATCH_DELAY = config('SWEEP_BATCH_DELAY', default=30, cast=int)
+
+# Blocks a sweep transfer must be buried under before its deposits count as
+# swept, and seconds a broadcast transfer may stay unmined before it is failed
+SWEEP_CONFIRMATIONS = config('SWEEP_CONFIRMATIONS', default=12, cast=int)
+SWEEP_PENDING_TIMEOUT = config('SWEEP_PENDING_TIMEOUT', default=3600, cast=int)
+
+# Seconds a chain's deposit address filter stays in the shared cache
+DEPOSIT_ADDRESS_INDEX_TIMEOUT = config('DEPOSIT_ADDRESS_INDEX_TIMEOUT', default=86400, cast=int)
+
+# Pooled keep-alive connections per node, seconds before a node call times out,
+# calls per JSON-RPC batch request, and batches the async client sends at once
+RPC_POOL_SIZE = config('RPC_POOL_SIZE', default=20, cast=int)
+RPC_TIMEOUT = config('RPC_TIMEOUT', default=10, cast=int)
+RPC_BATCH_SIZE = config('RPC_BATCH_SIZE', default=100, cast=int)
+RPC_ASYNC_CONCURRENCY = config('RPC_ASYNC_CONCURRENCY', default=4, cast=int)
+
 # AWS S3 Configuration
 AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID', default='')
 AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY', default='')